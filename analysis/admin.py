@@ -1,12 +1,29 @@
 from django.contrib import admin
-from .models import AnalysisProject, AnalysisResult
+from .models import AnalysisBatch, AnalysisProject, AnalysisResult, AnalysisVariant, ProteinStructure
+
+@admin.register(AnalysisBatch)
+class AnalysisBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'size', 'created_at')
+    search_fields = ('id', 'user__email')
 
 @admin.register(AnalysisProject)
 class AnalysisProjectAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'input_type', 'status', 'created_at')
+    list_display = ('id', 'user', 'submitter', 'input_type', 'status', 'batch', 'created_at')
     list_filter = ('status', 'input_type')
-    search_fields = ('id', 'user__email')
+    search_fields = ('id', 'user__email', 'submitter')
 
 @admin.register(AnalysisResult)
 class AnalysisResultAdmin(admin.ModelAdmin):
-    list_display = ('project', 'organism')
\ No newline at end of file
+    list_display = ('project', 'organism', 'gene', 'structure')
+
+@admin.register(ProteinStructure)
+class ProteinStructureAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'length', 'size', 'created_at')
+    search_fields = ('digest',)
+    exclude = ('pdb_compressed',)
+
+@admin.register(AnalysisVariant)
+class AnalysisVariantAdmin(admin.ModelAdmin):
+    list_display = ('project', 'position', 'ref', 'alt', 'consequence', 'hgvs_p')
+    list_filter = ('consequence',)
+    search_fields = ('project__id', 'variant_id', 'hgvs_c', 'hgvs_p')
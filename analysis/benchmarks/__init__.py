@@ -0,0 +1,17 @@
+"""
+Offline benchmarks for GeneRosetta.
+
+Each module exposes add_arguments(parser) and run(options) -> dict, and is run with:
+    python manage.py benchmark <suite> [options]
+"""
+
+SUITES = {
+    'biophysics': 'analysis.benchmarks.biophysics',
+    'blast': 'analysis.benchmarks.blast',
+    'clinvar': 'analysis.benchmarks.clinvar',
+    'http': 'analysis.benchmarks.http',
+    'pipeline': 'analysis.benchmarks.pipeline',
+    'primitives': 'analysis.benchmarks.primitives',
+    'status': 'analysis.benchmarks.status',
+    'translation': 'analysis.benchmarks.translation',
+}
@@ -0,0 +1,68 @@
+"""
+BiophysicalEngine: one calculate_deltas call per substitution vs calculate_deltas_batch.
+
+Scores the same random substitutions three ways and checks they agree:
+  - legacy:   the original dict + .upper() + round() arithmetic per call
+  - per_call: calculate_deltas in a Python loop (precomputed table lookups)
+  - batch:    calculate_deltas_batch on the old/new residue columns
+"""
+import random
+import time
+import numpy as np
+from analysis.engine.biophysics import BiophysicalEngine
+
+
+def add_arguments(parser):
+    parser.add_argument('--substitutions', type=int, default=200_000, help="Substitutions to score.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per mode (best time is reported).")
+
+
+def run(options):
+    codes = BiophysicalEngine.CODES
+    old = [random.choice(codes) for _ in range(options['substitutions'])]
+    new = [random.choice(codes) for _ in range(options['substitutions'])]
+    old_column, new_column = np.array(old), np.array(new)
+
+    modes = {
+        'legacy': lambda: [_legacy_deltas(a, b) for a, b in zip(old, new)],
+        'per_call': lambda: [BiophysicalEngine.calculate_deltas(a, b) for a, b in zip(old, new)],
+        'batch': lambda: BiophysicalEngine.calculate_deltas_batch(old_column, new_column),
+    }
+
+    results, outputs = {}, {}
+    for name, mode in modes.items():
+        best = float('inf')
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            outputs[name] = mode()
+            best = min(best, time.perf_counter() - started)
+        results[name] = {
+            'seconds': round(best, 4),
+            'substitutions_per_sec': round(len(old) / best),
+        }
+
+    batch = outputs['batch']
+    results['mismatches'] = sum(
+        1 for i, single in enumerate(outputs['legacy'])
+        if single['mass_delta'] != batch['mass_delta'][i]
+        or single['charge_delta'] != batch['charge_delta'][i]
+        or single['hydropathy_delta'] != batch['hydropathy_delta'][i]
+    )
+    results['speedup_per_call'] = round(results['legacy']['seconds'] / results['per_call']['seconds'], 1)
+    results['speedup_batch'] = round(results['legacy']['seconds'] / results['batch']['seconds'], 1)
+    return results
+
+
+def _legacy_deltas(old_residue_char, new_residue_char):
+    """The pre-table implementation of calculate_deltas, kept as the baseline."""
+    old_aa = BiophysicalEngine.AMINO_ACIDS.get(old_residue_char.upper())
+    new_aa = BiophysicalEngine.AMINO_ACIDS.get(new_residue_char.upper())
+    if not old_aa or not new_aa:
+        return None
+    return {
+        "mass_delta": round(new_aa['mass'] - old_aa['mass'], 2),
+        "charge_delta": new_aa['charge'] - old_aa['charge'],
+        "hydropathy_delta": round(new_aa['hydropathy'] - old_aa['hydropathy'], 2),
+        "old_aa_name": old_aa['name'],
+        "new_aa_name": new_aa['name']
+    }
@@ -0,0 +1,131 @@
+"""
+BLAST throughput: blocking (qblast-style) vs non-blocking (submit + scheduled re-checks).
+
+Both modes run the same number of jobs through a fixed number of worker slots
+(think Celery concurrency) against the fake BLAST server:
+  - blocking:     a slot submits, then sleeps between polls until the job is done.
+  - non_blocking: a slot only runs the HTTP call; re-checks are scheduled on a
+                  timer queue (standing in for countdown retries on the broker).
+
+Times are scaled down (job_seconds / poll_interval) so a run takes seconds, not hours.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from Bio.Blast import NCBIXML
+from django.test.utils import override_settings
+from analysis.services.blast import BlastClient
+from .fakes import FakeServer, FakeBlastHandler
+
+
+def add_arguments(parser):
+    parser.add_argument('--jobs', type=int, default=100, help="BLAST submissions per mode.")
+    parser.add_argument('--slots', type=int, default=8, help="Worker slots (Celery concurrency).")
+    parser.add_argument('--job-seconds', type=float, default=2.0, help="Time each search takes at the fake NCBI.")
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="Delay between status checks.")
+    parser.add_argument('--latency', type=float, default=0.01, help="Fake server latency per request.")
+
+
+def run(options):
+    sequences = [''.join(random.choice('ACGT') for _ in range(300)) for _ in range(options['jobs'])]
+
+    with FakeServer(FakeBlastHandler, latency=options['latency'], job_seconds=options['job_seconds'], rtoe=0) as server:
+        with override_settings(NCBI_BLAST_URL=f"{server.url}/Blast.cgi"):
+            results = {
+                'blocking': _run_blocking(sequences, options['slots'], options['poll_interval']),
+                'non_blocking': _run_scheduled(sequences, options['slots'], options['poll_interval']),
+            }
+        results['server'] = server.stats
+
+    results['speedup'] = round(results['non_blocking']['jobs_per_sec'] / results['blocking']['jobs_per_sec'], 2)
+    return results
+
+
+def _summary(jobs, slots, elapsed, busy):
+    return {
+        'jobs': jobs,
+        'slots': slots,
+        'seconds': round(elapsed, 3),
+        'jobs_per_sec': round(jobs / elapsed, 2),
+        # Fraction of slot time spent doing work rather than waiting on NCBI.
+        'slot_utilisation': round(busy / (elapsed * slots), 3),
+    }
+
+
+def _run_blocking(sequences, slots, poll_interval):
+    busy = []
+
+    def job(sequence):
+        # The whole job holds the slot, but only the HTTP calls count as work.
+        started = time.perf_counter()
+        rid, _ = BlastClient.submit(sequence)
+        busy.append(time.perf_counter() - started)
+        while True:
+            time.sleep(poll_interval)
+            started = time.perf_counter()
+            handle = BlastClient.fetch(rid)
+            if handle is not None:
+                NCBIXML.read(handle)
+            busy.append(time.perf_counter() - started)
+            if handle is not None:
+                break
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=slots) as pool:
+        list(pool.map(job, sequences))
+    elapsed = time.perf_counter() - started
+
+    return _summary(len(sequences), slots, elapsed, sum(busy))
+
+
+def _run_scheduled(sequences, slots, poll_interval):
+    counter = itertools.count()
+    # (due_time, tie_breaker, rid, sequence); rid None = not yet submitted
+    due = [(0.0, next(counter), None, sequence) for sequence in sequences]
+    heapq.heapify(due)
+    cond = threading.Condition()
+    remaining = [len(sequences)]
+    busy = [0.0]
+
+    def slot():
+        while True:
+            with cond:
+                while True:
+                    if remaining[0] == 0:
+                        return
+                    now = time.perf_counter()
+                    if due and due[0][0] <= now:
+                        _, _, rid, sequence = heapq.heappop(due)
+                        break
+                    cond.wait(timeout=(due[0][0] - now) if due else None)
+
+            started = time.perf_counter()
+            if rid is None:
+                rid, _ = BlastClient.submit(sequence)
+                handle = None
+            else:
+                handle = BlastClient.fetch(rid)
+                if handle is not None:
+                    NCBIXML.read(handle)
+            finished = time.perf_counter()
+
+            with cond:
+                busy[0] += finished - started
+                if handle is None:
+                    heapq.heappush(due, (finished + poll_interval, next(counter), rid, sequence))
+                else:
+                    remaining[0] -= 1
+                cond.notify_all()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=slot) for _ in range(slots)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return _summary(len(sequences), slots, elapsed, busy[0])
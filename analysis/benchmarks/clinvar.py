@@ -0,0 +1,59 @@
+"""
+ClinVar lookups: one esearch + esummary per variant vs the batched E-utilities API.
+
+Runs the same (gene, variant) pairs through ClinVarClient.fetch_variant_data
+and ClinVarClient.fetch_variants_batch against a fake E-utilities server, and
+reports request counts, wall time and the time the same requests would take
+under NCBI's rate limit. Results of both modes are compared pair by pair.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.test.utils import override_settings
+from analysis.engine.clients import ClinVarClient
+from analysis.engine.http_client import HttpClient
+from .fakes import FakeServer, FakeEutilsHandler
+
+
+def add_arguments(parser):
+    parser.add_argument('--variants', type=int, default=200, help="(gene, variant) pairs to resolve.")
+    parser.add_argument('--genes', type=int, default=5, help="Distinct genes the variants are spread over.")
+    parser.add_argument('--threads', type=int, default=8, help="Concurrent callers in one-by-one mode.")
+    parser.add_argument('--latency', type=float, default=0.05, help="Fake server latency per request.")
+
+
+def run(options):
+    genes = [f"GENE{i}" for i in range(options['genes'])]
+    pairs = [(random.choice(genes), f"c.{i + 1}A>G") for i in range(options['variants'])]
+
+    results = {}
+    with FakeServer(FakeEutilsHandler, latency=options['latency']) as server:
+        # TTL 0: every lookup misses the annotation cache, so both modes really hit the server.
+        with override_settings(NCBI_EUTILS_URL=server.url, ANNOTATION_CACHE_TTL=0, ANNOTATION_NEGATIVE_TTL=0):
+            HttpClient.reset()
+            before = server.stats['requests']
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                single = dict(zip(pairs, pool.map(lambda pair: ClinVarClient.fetch_variant_data(*pair), pairs)))
+            results['one_by_one'] = _summary(server.stats['requests'] - before, time.perf_counter() - started)
+
+            before = server.stats['requests']
+            started = time.perf_counter()
+            batched = ClinVarClient.fetch_variants_batch(pairs)
+            results['batched'] = _summary(server.stats['requests'] - before, time.perf_counter() - started)
+        HttpClient.reset()
+
+    results['variants'] = len(pairs)
+    results['request_reduction'] = round(results['one_by_one']['requests'] / max(results['batched']['requests'], 1), 1)
+    results['mismatches'] = sum(1 for pair in pairs if single[pair] != batched.get(pair))
+    return results
+
+
+def _summary(requests_made, elapsed):
+    return {
+        'requests': requests_made,
+        'seconds': round(elapsed, 3),
+        # Lower bound on wall time once every worker shares the NCBI limit.
+        'seconds_at_ncbi_limit': round(requests_made / settings.NCBI_RATE_LIMIT, 1),
+    }
@@ -0,0 +1,407 @@
+"""
+Local stand-ins for the remote services, so benchmarks run offline and repeatably.
+
+Every fake is a ThreadingHTTPServer on 127.0.0.1 (random free port) with:
+  - latency:    seconds added to every response
+  - error_rate: fraction of requests answered with 503
+  - tls:        serve HTTPS with a throwaway self-signed certificate
+and counts requests / TCP connections so client behaviour can be measured.
+"""
+import datetime
+import json
+import math
+import random
+import re
+import ssl
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from Bio.Data.IUPACData import protein_letters_1to3
+
+
+class FakeServer:
+    """
+    Usage:
+        with FakeServer(FakeBlastHandler, job_seconds=2) as server:
+            settings.NCBI_BLAST_URL = server.url + '/Blast.cgi'
+    """
+
+    def __init__(self, handler_class, latency=0.0, error_rate=0.0, tls=False, **config):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.tls = tls
+        if tls:
+            self.httpd.socket = _self_signed_context().wrap_socket(self.httpd.socket, server_side=True)
+        self.httpd.config = {'latency': latency, 'error_rate': error_rate, **config}
+        self.httpd.stats = {'requests': 0, 'connections': 0, 'errors': 0}
+        self.httpd.state = {}
+        self.httpd.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"{'https' if self.tls else 'http'}://{host}:{port}"
+
+    @property
+    def stats(self):
+        with self.httpd.lock:
+            return dict(self.httpd.stats)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _self_signed_context():
+    """Server SSL context with a fresh self-signed cert for 127.0.0.1."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, '127.0.0.1')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+
+    with tempfile.NamedTemporaryFile(suffix='.pem') as pem:
+        pem.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ))
+        pem.write(cert.public_bytes(serialization.Encoding.PEM))
+        pem.flush()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(pem.name)
+    return context
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Base handler: keep-alive, latency, error injection and counters."""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real services
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.stats['connections'] += 1
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _begin(self):
+        """Applies latency + error injection. Returns False if an error was sent."""
+        config = self.server.config
+        with self.server.lock:
+            self.server.stats['requests'] += 1
+        if config['latency']:
+            time.sleep(config['latency'])
+        if config['error_rate'] and random.random() < config['error_rate']:
+            with self.server.lock:
+                self.server.stats['errors'] += 1
+            self._send(503, 'Service Unavailable', 'text/plain')
+            return False
+        return True
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length).decode() if length else ''
+
+    def _send(self, status, body, content_type):
+        payload = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeEchoHandler(FakeHandler):
+    """Answers every GET/POST with a small fixed body (config 'body')."""
+
+    def do_GET(self):
+        if self._begin():
+            self._send(200, self.server.config.get('body', 'OK'), 'text/plain')
+
+    def do_POST(self):
+        self._read_body()
+        self.do_GET()
+
+
+BLAST_XML_TEMPLATE = """<?xml version="1.0"?>
+<BlastOutput>
+  <BlastOutput_program>blastn</BlastOutput_program>
+  <BlastOutput_version>BLASTN 2.16.0+</BlastOutput_version>
+  <BlastOutput_reference>GeneRosetta fake BLAST</BlastOutput_reference>
+  <BlastOutput_db>nt</BlastOutput_db>
+  <BlastOutput_query-ID>Query_1</BlastOutput_query-ID>
+  <BlastOutput_query-def>query</BlastOutput_query-def>
+  <BlastOutput_query-len>{length}</BlastOutput_query-len>
+  <BlastOutput_param><Parameters><Parameters_expect>10</Parameters_expect></Parameters></BlastOutput_param>
+  <BlastOutput_iterations>
+    <Iteration>
+      <Iteration_iter-num>1</Iteration_iter-num>
+      <Iteration_query-ID>Query_1</Iteration_query-ID>
+      <Iteration_query-def>query</Iteration_query-def>
+      <Iteration_query-len>{length}</Iteration_query-len>
+      <Iteration_hits>
+        <Hit>
+          <Hit_num>1</Hit_num>
+          <Hit_id>{hit_id}</Hit_id>
+          <Hit_def>{hit_def}</Hit_def>
+          <Hit_accession>{accession}</Hit_accession>
+          <Hit_len>{length}</Hit_len>
+          <Hit_hsps>
+            <Hsp>
+              <Hsp_num>1</Hsp_num>
+              <Hsp_bit-score>100</Hsp_bit-score>
+              <Hsp_score>{length}</Hsp_score>
+              <Hsp_evalue>1e-20</Hsp_evalue>
+              <Hsp_query-from>1</Hsp_query-from>
+              <Hsp_query-to>{length}</Hsp_query-to>
+              <Hsp_hit-from>1</Hsp_hit-from>
+              <Hsp_hit-to>{length}</Hsp_hit-to>
+              <Hsp_query-frame>1</Hsp_query-frame>
+              <Hsp_hit-frame>1</Hsp_hit-frame>
+              <Hsp_identity>{length}</Hsp_identity>
+              <Hsp_positive>{length}</Hsp_positive>
+              <Hsp_gaps>0</Hsp_gaps>
+              <Hsp_align-len>{length}</Hsp_align-len>
+              <Hsp_qseq>{query}</Hsp_qseq>
+              <Hsp_hseq>{query}</Hsp_hseq>
+              <Hsp_midline>{midline}</Hsp_midline>
+            </Hsp>
+          </Hit_hsps>
+        </Hit>
+      </Iteration_hits>
+      <Iteration_stat><Statistics><Statistics_db-num>1</Statistics_db-num><Statistics_db-len>1</Statistics_db-len><Statistics_hsp-len>0</Statistics_hsp-len><Statistics_eff-space>0</Statistics_eff-space><Statistics_kappa>0.41</Statistics_kappa><Statistics_lambda>0.625</Statistics_lambda><Statistics_entropy>0.78</Statistics_entropy></Statistics></Iteration_stat>
+    </Iteration>
+  </BlastOutput_iterations>
+</BlastOutput>
+"""
+
+
+class FakeBlastHandler(FakeHandler):
+    """
+    Mimics the NCBI BLAST URL API (Blast.cgi):
+      CMD=Put -> QBlastInfo block with a new RID and RTOE
+      CMD=Get -> "Status=WAITING" until job_seconds have passed, then BLAST XML
+
+    Config:
+      job_seconds: how long each search "runs" at NCBI (default 2)
+      rtoe:        estimate reported back on submission (default = job_seconds)
+      hit_title:   "<id> <definition>" of the single hit returned
+      fixture:     a recorded BLAST XML reply, returned for every finished job instead
+    """
+
+    def do_POST(self):
+        params = {key: values[0] for key, values in parse_qs(self._read_body()).items()}
+        if not self._begin():
+            return
+
+        config = self.server.config
+        jobs = self.server.state.setdefault('jobs', {})
+
+        if params.get('CMD') == 'Put':
+            rid = uuid.uuid4().hex[:11].upper()
+            with self.server.lock:
+                jobs[rid] = (time.monotonic(), params.get('QUERY', ''))
+            rtoe = int(config.get('rtoe', config.get('job_seconds', 2)))
+            body = f"<!--\nQBlastInfoBegin\n    RID = {rid}\n    RTOE = {rtoe}\nQBlastInfoEnd\n-->\n"
+            return self._send(200, body, 'text/html')
+
+        if params.get('CMD') == 'Get':
+            job = jobs.get(params.get('RID'))
+            if job is None:
+                return self._send(200, "QBlastInfoBegin\n    Status=UNKNOWN\nQBlastInfoEnd\n", 'text/html')
+
+            submitted_at, query = job
+            if time.monotonic() - submitted_at < config.get('job_seconds', 2):
+                return self._send(200, "QBlastInfoBegin\n    Status=WAITING\nQBlastInfoEnd\n", 'text/html')
+
+            if config.get('fixture'):
+                return self._send(200, config['fixture'], 'text/xml')
+
+            hit_id, _, hit_def = config.get(
+                'hit_title', 'gi|1|ref|NM_000207.3| Homo sapiens insulin (INS), transcript variant 1, mRNA'
+            ).partition(' ')
+            query = query[:500] or 'A'
+            body = BLAST_XML_TEMPLATE.format(
+                length=len(query), query=query, midline='|' * len(query),
+                hit_id=hit_id, hit_def=hit_def, accession=hit_id.strip('|').split('|')[-1],
+            )
+            return self._send(200, body, 'text/xml')
+
+        self._send(400, 'Unknown CMD', 'text/plain')
+
+
+class FakeEutilsHandler(FakeHandler):
+    """
+    Mimics NCBI E-utilities for db=clinvar (GET or POST):
+      esearch.fcgi  -> one record ID per "<variant>[Text Word]" in the term
+      esummary.fcgi -> a DocumentSummary per requested ID (comma-separated)
+
+    Every (gene, variant) pair gets a stable ID and a title naming the variant,
+    so batched and one-by-one lookups return the same records.
+    """
+
+    SIGNIFICANCES = ('Pathogenic', 'Likely pathogenic', 'Uncertain significance', 'Benign')
+
+    def do_GET(self):
+        self._handle(self.path.partition('?')[2])
+
+    def do_POST(self):
+        self._handle(self._read_body())
+
+    def _handle(self, query):
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+        if not self._begin():
+            return
+
+        endpoint = self.path.partition('?')[0].rsplit('/', 1)[-1]
+        if endpoint == 'esearch.fcgi':
+            return self._send(200, self._esearch(params), 'text/xml')
+        if endpoint == 'esummary.fcgi':
+            return self._send(200, self._esummary(params), 'text/xml')
+        self._send(404, 'Unknown endpoint', 'text/plain')
+
+    def _esearch(self, params):
+        term = params.get('term', '')
+        gene = re.search(r'(\S+)\[Gene Name\]', term)
+        records = self.server.state.setdefault('records', {})
+        ids = []
+        for variant in re.findall(r'([^\s()]+)\[Text Word\]', term):
+            clinvar_id = str(zlib.crc32(f"{gene.group(1) if gene else ''}:{variant}".encode()) % 10_000_000)
+            with self.server.lock:
+                records[clinvar_id] = (gene.group(1) if gene else 'UNKNOWN', variant)
+            ids.append(clinvar_id)
+        ids = ids[:int(params.get('retmax', 20))]
+
+        id_xml = ''.join(f"<Id>{clinvar_id}</Id>" for clinvar_id in ids)
+        return (
+            '<?xml version="1.0" encoding="UTF-8" ?>\n'
+            '<!DOCTYPE eSearchResult PUBLIC "-//NLM//DTD esearch 20060628//EN" '
+            '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20060628/esearch.dtd">\n'
+            f"<eSearchResult><Count>{len(ids)}</Count><RetMax>{len(ids)}</RetMax><RetStart>0</RetStart>"
+            f"<IdList>{id_xml}</IdList><TranslationSet/><QueryTranslation>{escape(term)}</QueryTranslation>"
+            "</eSearchResult>"
+        )
+
+    def _esummary(self, params):
+        records = self.server.state.get('records', {})
+        summaries = []
+        for clinvar_id in filter(None, params.get('id', '').split(',')):
+            gene, variant = records.get(clinvar_id, ('UNKNOWN', 'c.?'))
+            significance = self.SIGNIFICANCES[int(clinvar_id) % len(self.SIGNIFICANCES)]
+            name = escape(f"NM_000000.1({gene}):{variant}")
+            summaries.append(
+                f'<DocumentSummary uid="{clinvar_id}"><obj_type>single nucleotide variant</obj_type>'
+                f"<title>{name}</title>"
+                f"<variation_set><variation><variation_name>{name}</variation_name>"
+                f"<cdna_change>{escape(variant)}</cdna_change></variation></variation_set>"
+                f"<germline_classification><description>{significance}</description>"
+                f"<trait_set><trait><trait_name>not provided</trait_name></trait>"
+                f"<trait><trait_name>{escape(gene)}-related disorder</trait_name></trait></trait_set>"
+                f"</germline_classification>"
+                f"<genes><gene><symbol>{escape(gene)}</symbol></gene></genes>"
+                f"</DocumentSummary>"
+            )
+        return (
+            '<?xml version="1.0" encoding="UTF-8" ?>\n'
+            '<!DOCTYPE eSummaryResult PUBLIC "-//NLM//DTD esummary clinvar 20230818//EN" '
+            '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20230818/esummary_clinvar.dtd">\n'
+            f'<eSummaryResult><DocumentSummarySet status="OK"><DbBuild>Build_fake</DbBuild>'
+            f"{''.join(summaries)}</DocumentSummarySet></eSummaryResult>"
+        )
+
+
+class FakeUniProtHandler(FakeHandler):
+    """
+    Mimics the UniProt REST search (GET /uniprotkb/search?query=gene:X AND organism_name:"Y"):
+    one entry with a FUNCTION comment naming the gene and organism of the query.
+
+    Config:
+      fixture:   a recorded search reply (JSON text), returned for every query instead
+      not_found: fraction of queries answered with no results
+    """
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+        if not self._begin():
+            return
+        if not path.endswith('/search'):
+            return self._send(404, 'Unknown endpoint', 'text/plain')
+
+        config = self.server.config
+        if config.get('fixture'):
+            return self._send(200, config['fixture'], 'application/json')
+        if config.get('not_found') and random.random() < config['not_found']:
+            return self._send(200, json.dumps({"results": []}), 'application/json')
+
+        term = params.get('query', '')
+        gene = re.search(r'gene:(\S+)', term)
+        organism = re.search(r'organism_name:"([^"]*)"', term)
+        gene = gene.group(1) if gene else 'UNKNOWN'
+        entry = {
+            "primaryAccession": f"P{zlib.crc32(term.encode()) % 100000:05d}",
+            "comments": [{
+                "commentType": "FUNCTION",
+                "texts": [{"value": f"{gene} from {organism.group(1) if organism else 'an unknown organism'} "
+                                    f"(fake UniProt entry)."}],
+            }],
+        }
+        self._send(200, json.dumps({"results": [entry]}), 'application/json')
+
+
+class FakeFoldHandler(FakeHandler):
+    """
+    Mimics the ESMFold API (POST the protein sequence, get PDB text back):
+    a CA-only helix with one ATOM record per residue, so the structure store
+    reads back the sequence that was folded.
+
+    Config:
+      fixture: a recorded PDB, returned for every sequence instead
+    """
+
+    def do_POST(self):
+        sequence = self._read_body().strip()
+        if not self._begin():
+            return
+
+        config = self.server.config
+        if config.get('fixture'):
+            return self._send(200, config['fixture'], 'text/plain')
+        if not sequence:
+            return self._send(400, 'Empty sequence', 'text/plain')
+        self._send(200, fake_pdb(sequence), 'text/plain')
+
+
+def fake_pdb(protein):
+    """CA-only alpha helix for a protein sequence (PDB text)."""
+    lines = []
+    for i, residue in enumerate(protein, start=1):
+        angle = math.radians(100 * i)
+        lines.append(
+            f"ATOM  {i:5d}  CA  {protein_letters_1to3.get(residue, 'Xaa').upper():3s} A{i:4d}    "
+            f"{2.3 * math.cos(angle):8.3f}{2.3 * math.sin(angle):8.3f}{1.5 * i:8.3f}  1.00 90.00           C"
+        )
+    return '\n'.join(lines + ['END']) + '\n'
@@ -0,0 +1,63 @@
+"""
+Pooled keep-alive sessions (HttpClient) vs one-shot requests.get/post calls.
+
+Sends the same sequence of requests to a local stand-in server both ways and
+reports wall time, TCP connections opened (= handshakes) and failures.
+Use --tls to include the TLS handshake, which dominates against real APIs.
+"""
+import time
+import warnings
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from django.test.utils import override_settings
+from urllib3.exceptions import InsecureRequestWarning
+from analysis.engine.http_client import HttpClient
+from .fakes import FakeServer, FakeEchoHandler
+
+
+def add_arguments(parser):
+    parser.add_argument('--requests', type=int, default=500, help="Requests per mode.")
+    parser.add_argument('--threads', type=int, default=8, help="Concurrent callers (worker threads).")
+    parser.add_argument('--latency', type=float, default=0.0, help="Fake server latency per request.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of 503 answers.")
+    parser.add_argument('--tls', action='store_true', help="Serve HTTPS (self-signed).")
+
+
+def run(options):
+    results = {}
+    # Fast backoff so injected errors don't turn the benchmark into a sleep test.
+    with override_settings(HTTP_RETRY_BACKOFF=0.01, HTTP_RETRY_JITTER=0.01), warnings.catch_warnings():
+        warnings.simplefilter('ignore', InsecureRequestWarning)
+        for mode, call in (('one_shot', requests.post), ('pooled', HttpClient.post)):
+            HttpClient.reset()
+            with FakeServer(FakeEchoHandler, latency=options['latency'],
+                            error_rate=options['error_rate'], tls=options['tls']) as server:
+                results[mode] = _drive(call, f"{server.url}/fold", options)
+                results[mode].update(server.stats)
+            if mode == 'pooled':
+                results[mode]['client'] = HttpClient.stats()
+        HttpClient.reset()
+
+    results['speedup'] = round(results['one_shot']['seconds'] / results['pooled']['seconds'], 2)
+    results['handshakes_saved'] = results['one_shot']['connections'] - results['pooled']['connections']
+    return results
+
+
+def _drive(call, url, options):
+    def one(_):
+        try:
+            # verify=False: the stand-in uses a throwaway self-signed certificate.
+            return call(url, data='MKTAYIAKQR', timeout=10, verify=False).status_code == 200
+        except requests.RequestException:
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+        outcomes = list(pool.map(one, range(options['requests'])))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(len(outcomes) / elapsed, 1),
+        'failed': outcomes.count(False),
+    }
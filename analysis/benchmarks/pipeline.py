@@ -0,0 +1,298 @@
+"""
+End to end: POST /api/analyze/ -> run_analysis_pipeline against local NCBI, UniProt and ESMFold stand-ins.
+
+Starts fake BLAST, E-utilities, UniProt and ESMFold servers (latency, error
+rate and optional recorded fixtures per service), submits --jobs sequences
+through AnalyzeView and works them off with --concurrency worker slots:
+enqueueing run_analysis_pipeline hands the project to an in-process queue
+instead of the broker, and a pending BLAST is re-queued after --poll-interval
+(standing in for the countdown retry). The pipeline runs in inline mode.
+
+Reports jobs/sec, p50/p95/p99 latency from submission to COMPLETED/FAILED and
+a per-stage breakdown taken from each report's timings.
+Needs the configured database and Redis; the projects are removed afterwards.
+
+Fixtures (--fixtures DIR, each file optional): blast.xml, uniprot.json, esmfold.pdb.
+"""
+import heapq
+import itertools
+import random
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from unittest import mock
+from celery.exceptions import Retry
+from django.core.cache import cache
+from django.db import connections
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from analysis.engine.http_client import HttpClient
+from analysis.engine.redis_client import get_redis
+from analysis.models import AnalysisProject, ProteinStructure
+from analysis.services.cache import ResultCache
+from analysis.services.progress import StatusCache
+from analysis.services.singleflight import WAITING_STAGE
+from analysis.tasks import run_analysis_pipeline
+from analysis.views import AnalyzeView
+from .fakes import FakeServer, FakeBlastHandler, FakeEutilsHandler, FakeUniProtHandler, FakeFoldHandler
+
+FIXTURES = {'blast': 'blast.xml', 'uniprot': 'uniprot.json', 'esmfold': 'esmfold.pdb'}
+
+
+def add_arguments(parser):
+    parser.add_argument('--jobs', type=int, default=50, help="Sequences submitted.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Worker slots (Celery concurrency).")
+    parser.add_argument('--rate', type=float, default=0, help="Submissions per second (0 = all at once).")
+    parser.add_argument('--length', type=int, default=600, help="Bases per submitted sequence.")
+    parser.add_argument('--duplicates', type=float, default=0.0,
+                        help="Fraction of submissions that repeat an earlier sequence.")
+    parser.add_argument('--latency', type=float, default=0.05, help="Fake NCBI/UniProt latency per request.")
+    parser.add_argument('--fold-latency', type=float, default=0.5, help="Fake ESMFold latency per request.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 503.")
+    parser.add_argument('--blast-seconds', type=float, default=1.0, help="Time each search takes at the fake NCBI.")
+    parser.add_argument('--poll-interval', type=float, default=0.25, help="Delay between BLAST status checks.")
+    parser.add_argument('--ncbi-rate', type=float, default=1000,
+                        help="NCBI requests/s for the shared limiter (3 = the real unkeyed limit).")
+    parser.add_argument('--fixtures', help="Directory with recorded replies (blast.xml, uniprot.json, esmfold.pdb).")
+
+
+def run(options):
+    fixtures = _load_fixtures(options['fixtures'])
+    sequences = _sequences(options['jobs'], options['length'], options['duplicates'])
+    common = {'latency': options['latency'], 'error_rate': options['error_rate']}
+
+    with ExitStack() as stack:
+        servers = {
+            'blast': FakeServer(FakeBlastHandler, job_seconds=options['blast_seconds'], rtoe=0,
+                                fixture=fixtures.get('blast'), **common),
+            'eutils': FakeServer(FakeEutilsHandler, **common),
+            'uniprot': FakeServer(FakeUniProtHandler, fixture=fixtures.get('uniprot'), **common),
+            'esmfold': FakeServer(FakeFoldHandler, latency=options['fold_latency'],
+                                  error_rate=options['error_rate'], fixture=fixtures.get('esmfold')),
+        }
+        for server in servers.values():
+            stack.enter_context(server)
+
+        stack.enter_context(override_settings(
+            NCBI_BLAST_URL=f"{servers['blast'].url}/Blast.cgi",
+            NCBI_EUTILS_URL=servers['eutils'].url,
+            UNIPROT_SEARCH_URL=f"{servers['uniprot'].url}/uniprotkb/search",
+            ESMFOLD_URL=f"{servers['esmfold'].url}/foldSequence/v1/pdb/",
+            NCBI_RATE_LIMIT=options['ncbi_rate'],
+            BLAST_BACKEND='async',
+            BLAST_MIN_POLL_DELAY=options['poll_interval'],
+            BLAST_POLL_INTERVAL=options['poll_interval'],
+            SINGLE_FLIGHT_POLL_INTERVAL=options['poll_interval'],
+            PIPELINE_DISTRIBUTED=False,
+            # No local k-mer index: every organism comes from the fake BLAST
+            KMER_INDEX_DIR=stack.enter_context(tempfile.TemporaryDirectory()),
+            # Every job really calls UniProt (annotations would otherwise be cached after the first)
+            ANNOTATION_CACHE_TTL=0,
+            ANNOTATION_NEGATIVE_TTL=0,
+            # Every submission comes from one client; measure the pipeline, not the admission limits
+            ADMISSION_ENABLED=False,
+        ))
+        HttpClient.reset()
+
+        queue = _WorkQueue(options['concurrency'], options['poll_interval'])
+        stack.enter_context(mock.patch.object(run_analysis_pipeline, 'delay', queue.put))
+        stack.enter_context(mock.patch.object(run_analysis_pipeline, 'apply_async', queue.apply_async))
+        submissions, submit_seconds = _submit(sequences, options['rate'])
+        elapsed = queue.drain()
+        HttpClient.reset()
+
+        server_stats = {name: server.stats for name, server in servers.items()}
+
+    try:
+        results = _summarise(submissions, queue.finished, elapsed, options['concurrency'])
+    finally:
+        _clean_up([project_id for project_id, _ in submissions], sequences)
+
+    results['submit_ms'] = _percentiles([seconds * 1000 for seconds in submit_seconds], digits=2)
+    results['servers'] = server_stats
+    return results
+
+
+def _load_fixtures(directory):
+    if not directory:
+        return {}
+    paths = {service: Path(directory) / name for service, name in FIXTURES.items()}
+    return {service: path.read_text() for service, path in paths.items() if path.exists()}
+
+
+def _sequences(count, length, duplicates):
+    sequences = []
+    for _ in range(count):
+        if sequences and random.random() < duplicates:
+            sequences.append(random.choice(sequences))
+        else:
+            sequences.append(''.join(random.choice('ACGT') for _ in range(length)))
+    return sequences
+
+
+def _submit(sequences, rate):
+    """POSTs every sequence to AnalyzeView. Returns [(project_id, submitted_at)] and the view times."""
+    view = AnalyzeView.as_view()
+    factory = RequestFactory()
+    submissions, view_seconds = [], []
+
+    started = time.perf_counter()
+    for i, sequence in enumerate(sequences):
+        if rate:
+            time.sleep(max(0.0, started + i / rate - time.perf_counter()))
+        submitted_at = time.perf_counter()
+        response = view(factory.post('/api/analyze/', {'raw_text': sequence}, content_type='application/json'))
+        view_seconds.append(time.perf_counter() - submitted_at)
+        assert response.status_code == 201, response.data
+        submissions.append((str(response.data['id']), submitted_at))
+    return submissions, view_seconds
+
+
+class _WorkQueue:
+    """
+    Stands in for the broker and a Celery worker: put() is run_analysis_pipeline.delay
+    (apply_async, ignoring priorities), 'slots' threads run the task, and a retried task
+    (pending BLAST, waiting on an identical run) comes back after retry_delay.
+    """
+
+    def __init__(self, slots, retry_delay):
+        self.retry_delay = retry_delay
+        self.due = []  # (due_time, tie_breaker, project_id)
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.outstanding = 0
+        self.closed = False
+        self.finished = {}  # project_id -> time the task ended (not retried)
+        self.started = time.perf_counter()
+        self.threads = [threading.Thread(target=self._slot, daemon=True) for _ in range(slots)]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, project_id):
+        with self.cond:
+            self.outstanding += 1
+            heapq.heappush(self.due, (time.perf_counter(), next(self.counter), str(project_id)))
+            self.cond.notify()
+
+    def apply_async(self, args, **options):
+        self.put(args[0])
+
+    def drain(self):
+        """Waits until every task has finished. Returns seconds since the queue was created."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+        return time.perf_counter() - self.started
+
+    def _slot(self):
+        try:
+            while True:
+                with self.cond:
+                    while True:
+                        if self.closed and self.outstanding == 0:
+                            return
+                        now = time.perf_counter()
+                        if self.due and self.due[0][0] <= now:
+                            _, _, project_id = heapq.heappop(self.due)
+                            break
+                        self.cond.wait(timeout=(self.due[0][0] - now) if self.due else None)
+
+                try:
+                    run_analysis_pipeline(project_id)
+                    retry_at = None
+                except Retry:
+                    retry_at = time.perf_counter() + self.retry_delay
+
+                with self.cond:
+                    if retry_at is None:
+                        self.finished[project_id] = time.perf_counter()
+                        self.outstanding -= 1
+                    else:
+                        heapq.heappush(self.due, (retry_at, next(self.counter), project_id))
+                    self.cond.notify_all()
+        finally:
+            # Like a worker process exiting: give the thread's connection back
+            connections.close_all()
+
+
+def _summarise(submissions, finished, elapsed, concurrency):
+    ids = [project_id for project_id, _ in submissions]
+    projects = AnalysisProject.objects.filter(id__in=ids).select_related('result').only(
+        'id', 'status', 'stage', 'result__report'
+    )
+
+    statuses, stages, cached, coalesced = {}, {}, 0, 0
+    for project in projects:
+        statuses[project.status] = statuses.get(project.status, 0) + 1
+        # Answered from the ResultCache or by an identical in-flight run:
+        # the report (and its timings) were copied from another project
+        if not project.stage:
+            cached += project.status == 'COMPLETED'
+            continue
+        if project.stage == WAITING_STAGE:
+            coalesced += project.status == 'COMPLETED'
+            continue
+        report = getattr(project, 'result', None) and project.result.report
+        for name, timing in ((report or {}).get('timings') or {}).items():
+            stage = stages.setdefault(name, {'seconds': [], 'calls': {}})
+            stage['seconds'].append(timing['seconds'])
+            for call, totals in timing['calls'].items():
+                entry = stage['calls'].setdefault(call, {'count': 0, 'seconds': 0.0})
+                entry['count'] += totals['count']
+                entry['seconds'] += totals['seconds']
+
+    latencies = [finished[project_id] - submitted_at for project_id, submitted_at in submissions
+                 if project_id in finished]
+    return {
+        'jobs': len(submissions),
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'jobs_per_sec': round(len(latencies) / elapsed, 2),
+        'statuses': statuses,
+        'result_cache_hits': cached,
+        'coalesced': coalesced,
+        'latency_seconds': _percentiles(latencies),
+        # Per stage: time across the jobs that ran it, and the external calls made inside it
+        'stages': {
+            name: {
+                'runs': len(stage['seconds']),
+                **_percentiles(stage['seconds']),
+                'calls': {
+                    call: {'count': totals['count'], 'seconds': round(totals['seconds'], 3)}
+                    for call, totals in stage['calls'].items()
+                },
+            }
+            for name, stage in stages.items()
+        },
+    }
+
+
+def _percentiles(values, digits=3):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p):
+        # Nearest-rank percentile
+        return round(ordered[max(0, -(-len(ordered) * p // 100) - 1)], digits)
+
+    return {
+        'mean': round(statistics.fmean(ordered), digits),
+        'p50': rank(50), 'p95': rank(95), 'p99': rank(99),
+        'max': round(ordered[-1], digits),
+    }
+
+
+def _clean_up(ids, sequences):
+    structures = list(
+        ProteinStructure.objects.filter(results__project_id__in=ids).values_list('digest', flat=True).distinct()
+    )
+    AnalysisProject.objects.filter(id__in=ids).delete()
+    ProteinStructure.objects.filter(digest__in=structures, results__isnull=True).delete()
+    cache.delete_many([ResultCache._key(ResultCache.digest(sequence)) for sequence in set(sequences)])
+    get_redis().delete(*[StatusCache.key(project_id) for project_id in ids])
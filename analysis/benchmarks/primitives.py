@@ -0,0 +1,177 @@
+"""
+Engine primitives: ops/sec and peak memory of the CPU-bound building blocks, with a regression check.
+
+Times every primitive over a range of input sizes (short peptides to megabase
+sequences, small to large variant batches):
+  - biophysics.calculate_deltas        one call per substitution, over a batch
+  - biophysics.calculate_deltas_batch  the same batch in one call
+  - narrative.generate_report          a report for a protein of the given length
+  - scanner.extract_names              _extract_organism_name + _extract_gene_name per BLAST title
+  - ingest.sanitize_and_validate       cleaning a pasted sequence
+  - translation.translate / translation.best_protein   what the translate stage runs
+
+An op is one call on one input; peak memory is measured in a separate traced call.
+With --baseline (the --output of an earlier run) every case slower, or using more
+memory, by more than --threshold is listed under 'regressions' and the command fails.
+"""
+import json
+import random
+import time
+import tracemalloc
+import numpy as np
+from django.conf import settings
+from analysis.engine.biophysics import BiophysicalEngine
+from analysis.engine.narrative import NarrativeComposer
+from analysis.engine.profile import ProteinProfiler
+from analysis.engine.translation import TranslationEngine
+from analysis.services.ingest import IngestService
+from analysis.services.scanner import OrganismScanner
+
+# Differences below this are noise (interpreter caches, small allocations)
+MEMORY_NOISE_BYTES = 64 * 1024
+
+TITLES = (
+    "gi|{n}|ref|NM_000207.3| Homo sapiens insulin (INS), transcript variant {n}, mRNA",
+    "gi|{n}|ref|XM_038429.1| PREDICTED: Canis lupus familiaris hemoglobin subunit beta (HBB), mRNA",
+    "gi|{n}|gb|CP0{n}.1| Escherichia coli strain K-12 chromosome, complete genome",
+    "gi|{n}|ref|NP_{n}.2| cytochrome c oxidase subunit 1 [Mus musculus]",
+    "synthetic construct clone {n}, partial sequence",
+)
+
+
+def add_arguments(parser):
+    parser.add_argument('--bases', default='300,30000,3000000',
+                        help="Comma-separated sequence lengths (proteins are a third as long).")
+    parser.add_argument('--batches', default='100,10000,100000',
+                        help="Comma-separated batch sizes (substitutions, BLAST titles).")
+    parser.add_argument('--min-time', type=float, default=0.2, help="Minimum seconds per timed run.")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case (best is reported).")
+    parser.add_argument('--baseline', help="Results of an earlier run (--output) to compare against.")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Allowed slowdown / memory growth against the baseline (0.25 = 25%%).")
+
+
+def run(options):
+    cases = {}
+    for name, items, call in _cases(_sizes(options['bases']), _sizes(options['batches'])):
+        seconds = _time(call, options['min_time'], options['repeat'])
+        cases[name] = {
+            'ops_per_sec': round(1 / seconds, 2),
+            'items_per_sec': round(items / seconds),
+            'peak_bytes': _peak_memory(call),
+        }
+
+    results = {'cases': cases}
+    if options.get('baseline'):
+        with open(options['baseline']) as handle:
+            baseline = json.load(handle)
+        # Accepts the command's full output or just its 'results'
+        baseline = baseline.get('results', baseline).get('cases', {})
+        results['threshold'] = options['threshold']
+        results['regressions'] = _regressions(baseline, cases, options['threshold'])
+    return results
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(',') if size.strip()]
+
+
+def _cases(bases, batches):
+    """(name, items per call, call) for every primitive and size. Inputs are built up front."""
+    codes = BiophysicalEngine.CODES
+    for size in batches:
+        old = random.choices(codes, k=size)
+        new = random.choices(codes, k=size)
+        yield (f"biophysics.calculate_deltas[{size}]", size,
+               lambda old=old, new=new: [BiophysicalEngine.calculate_deltas(a, b) for a, b in zip(old, new)])
+
+        old_column, new_column = np.array(old), np.array(new)
+        yield (f"biophysics.calculate_deltas_batch[{size}]", size,
+               lambda old=old_column, new=new_column: BiophysicalEngine.calculate_deltas_batch(old, new))
+
+        titles = [random.choice(TITLES).format(n=i) for i in range(size)]
+        yield (f"scanner.extract_names[{size}]", size,
+               lambda titles=titles: [
+                   (OrganismScanner._extract_organism_name(title), OrganismScanner._extract_gene_name(title))
+                   for title in titles
+               ])
+
+    for size in bases:
+        dna = ''.join(random.choices('ACGT', k=size))
+        # A pasted sequence: lower case, wrapped at 60 columns
+        pasted = '\n'.join(dna[i:i + 60] for i in range(0, size, 60)).lower()
+        yield (f"ingest.sanitize_and_validate[{size}]", size,
+               lambda pasted=pasted: IngestService._sanitize_and_validate(pasted))
+
+        yield (f"translation.translate[{size}]", size, lambda dna=dna: TranslationEngine.translate(dna))
+        yield (f"translation.best_protein[{size}]", size,
+               lambda dna=dna: TranslationEngine.best_protein(dna, min_length=settings.ORF_MIN_LENGTH))
+
+        protein = ''.join(random.choices(codes, k=max(1, size // 3)))
+        context = {
+            "strategy_used": "HumanClinical",
+            "biophysics": BiophysicalEngine.calculate_deltas('W', 'R'),
+            "clinical": {"significance": "Pathogenic", "disease": "Hereditary cancer-predisposing syndrome"},
+            "functional": None,
+        }
+        profile = ProteinProfiler.profile(protein, window=settings.PROFILE_WINDOW)
+        yield (f"narrative.generate_report[{len(protein)}]", len(protein),
+               lambda context=context, profile=profile: NarrativeComposer.generate_report(context, profile))
+
+
+def _time(call, min_time, repeat):
+    """Best seconds per call: loops are calibrated so one run lasts at least min_time."""
+    loops = 1
+    while True:
+        elapsed = _run_loops(call, loops)
+        if elapsed >= min_time:
+            break
+        loops *= max(2, min(10, int(min_time / max(elapsed, 1e-9)) + 1))
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        best = min(best, _run_loops(call, loops))
+    return best / loops
+
+
+def _run_loops(call, loops):
+    started = time.perf_counter()
+    for _ in range(loops):
+        call()
+    return time.perf_counter() - started
+
+
+def _peak_memory(call):
+    """Peak bytes allocated during one call (inputs already exist, so they don't count)."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        call()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def _regressions(baseline, cases, threshold):
+    regressions = []
+    for name, current in cases.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+
+        slowdown = 1 - current['ops_per_sec'] / previous['ops_per_sec']
+        if slowdown > threshold:
+            regressions.append({
+                'case': name, 'metric': 'ops_per_sec',
+                'baseline': previous['ops_per_sec'], 'current': current['ops_per_sec'],
+                'change': round(-slowdown, 3),
+            })
+
+        growth = current['peak_bytes'] - previous['peak_bytes']
+        if growth > MEMORY_NOISE_BYTES and growth / max(previous['peak_bytes'], 1) > threshold:
+            regressions.append({
+                'case': name, 'metric': 'peak_bytes',
+                'baseline': previous['peak_bytes'], 'current': current['peak_bytes'],
+                'change': round(growth / max(previous['peak_bytes'], 1), 3),
+            })
+    return regressions
@@ -0,0 +1,62 @@
+"""
+Status polling: database queries and latency per GET /api/status/<uuid>/, with and without the status cache.
+
+Creates throwaway projects, has simulated clients poll them at random and
+counts the SQL each poll issues:
+  - db:    STATUS_CACHE_ENABLED=False, every poll reads Postgres
+  - cache: the Redis write-through cache (first poll of a project may miss and refill)
+Needs the configured database and Redis; the projects and keys are removed afterwards.
+"""
+import random
+import time
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from analysis.engine.redis_client import get_redis
+from analysis.models import AnalysisProject
+from analysis.services.progress import StatusCache
+from analysis.views import ProjectStatusView
+
+
+def add_arguments(parser):
+    parser.add_argument('--projects', type=int, default=50, help="Projects being waited on.")
+    parser.add_argument('--polls', type=int, default=2000, help="Status requests per mode.")
+
+
+def run(options):
+    projects = AnalysisProject.objects.bulk_create([
+        AnalysisProject(input_type='TEXT', input_sequence='ATG', status='PROCESSING', stage='fold')
+        for _ in range(options['projects'])
+    ])
+    ids = [project.id for project in projects]
+    polls = [random.choice(ids) for _ in range(options['polls'])]
+
+    view = ProjectStatusView.as_view()
+    factory = RequestFactory()
+
+    results = {}
+    try:
+        for name, enabled in (('db', False), ('cache', True)):
+            _clear(ids)
+            with override_settings(STATUS_CACHE_ENABLED=enabled):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for project_id in polls:
+                        response = view(factory.get(f'/api/status/{project_id}/'), project_id=project_id)
+                        assert response.status_code == 200
+                    elapsed = time.perf_counter() - started
+
+            results[name] = {
+                'queries': len(queries.captured_queries),
+                'queries_per_poll': round(len(queries.captured_queries) / len(polls), 3),
+                'ms_per_poll': round(elapsed / len(polls) * 1000, 3),
+            }
+    finally:
+        _clear(ids)
+        AnalysisProject.objects.filter(id__in=ids).delete()
+
+    return results
+
+
+def _clear(ids):
+    get_redis().delete(*[StatusCache.key(project_id) for project_id in ids])
@@ -0,0 +1,63 @@
+"""
+TranslationEngine: six-frame translation and ORF discovery vs per-frame Biopython.
+
+Translates the same random DNA both ways and checks every frame agrees:
+  - biopython: Seq.translate on each of the six frames (reverse_complement for the - strand)
+  - engine:    TranslationEngine.six_frames (one encode, six table lookups)
+  - orfs:      TranslationEngine.find_orfs, the full ORF scan the pipeline runs
+"""
+import random
+import time
+from Bio.Seq import Seq
+from analysis.engine.translation import TranslationEngine
+
+
+def add_arguments(parser):
+    parser.add_argument('--bases', type=int, default=5_000_000, help="Length of the random DNA.")
+    parser.add_argument('--ambiguous', type=float, default=0.001, help="Fraction of bases that are N.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per mode (best time is reported).")
+
+
+def run(options):
+    bases = options['bases']
+    dna = ''.join(random.choices('ACGT', k=bases))
+    if options['ambiguous']:
+        letters = list(dna)
+        for i in random.sample(range(bases), int(bases * options['ambiguous'])):
+            letters[i] = 'N'
+        dna = ''.join(letters)
+
+    modes = {
+        'biopython': lambda: _biopython_frames(dna),
+        'engine': lambda: [protein.tobytes().decode('ascii') for _, _, protein in TranslationEngine.six_frames(dna)],
+        'orfs': lambda: TranslationEngine.find_orfs(dna, limit=10),
+    }
+
+    results, outputs = {}, {}
+    for name, mode in modes.items():
+        best = float('inf')
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            outputs[name] = mode()
+            best = min(best, time.perf_counter() - started)
+        results[name] = {
+            'seconds': round(best, 4),
+            'megabases_per_sec': round(bases / best / 1e6, 2),
+        }
+
+    results['mismatched_frames'] = sum(
+        1 for expected, actual in zip(outputs['biopython'], outputs['engine']) if expected != actual
+    )
+    results['longest_orf'] = outputs['orfs'][0]['length'] if outputs['orfs'] else 0
+    results['speedup'] = round(results['biopython']['seconds'] / results['engine']['seconds'], 1)
+    return results
+
+
+def _biopython_frames(dna):
+    """The six frames the way the pipeline used to translate frame 0, once per frame."""
+    frames = []
+    for strand in (Seq(dna), Seq(dna).reverse_complement()):
+        for frame in range(3):
+            codons = (len(strand) - frame) // 3
+            frames.append(str(strand[frame:frame + 3 * codons].translate()))
+    return frames
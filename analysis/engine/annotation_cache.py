@@ -0,0 +1,192 @@
+import copy
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter, OrderedDict
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from .redis_client import get_redis
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'annotation_cache:stats'
+
+
+class AnnotationCache:
+    """
+    Two-tier cache for external annotations (ClinVar significance, UniProt function).
+
+    Tier 1: in-process LRU (per worker process, shared by its threads).
+    Tier 2: Django cache (Redis), shared by every worker.
+
+    Each entry remembers when it stops being fresh:
+      - positive answers stay fresh for ANNOTATION_CACHE_TTL
+      - "not found" answers (negative caching) for ANNOTATION_NEGATIVE_TTL
+    After that the entry is kept for ANNOTATION_STALE_TTL more, and is only
+    served if the upstream API fails (stale-if-error).
+
+    Hit/miss counters are kept in-process and added to a Redis hash every
+    ANNOTATION_STATS_FLUSH_INTERVAL seconds by a background thread, so they add up
+    across workers without a Redis call on the lookup path
+    (GET /api/cache-stats/ for staff users).
+    """
+
+    _local = OrderedDict()
+    _lock = threading.Lock()
+
+    _counts = Counter()
+    _counts_lock = threading.Lock()
+    _flusher_pid = None
+
+    @staticmethod
+    def get_or_fetch(namespace, parts, fetch, is_negative=lambda value: False):
+        """
+        Returns the cached value for (namespace, *parts), or calls fetch() on a miss.
+        fetch() must raise when the upstream fails; if a stale entry exists it is
+        returned instead, otherwise the exception propagates.
+        """
+        value, fresh = AnnotationCache.lookup(namespace, parts)
+        if fresh:
+            return value
+
+        try:
+            result = fetch()
+        except Exception as e:
+            if value is not None:
+                logger.warning(f"{namespace} upstream failed ({e}). Serving stale annotation.")
+                AnnotationCache.record(namespace, 'stale_served')
+                return value
+            AnnotationCache.record(namespace, 'errors')
+            raise
+
+        AnnotationCache.store(namespace, parts, result, negative=is_negative(result))
+        return result
+
+    @staticmethod
+    def lookup(namespace, parts):
+        """
+        Returns (value, fresh). value is None when nothing (not even stale) is cached.
+        Counts hit_local / hit_shared / miss.
+        """
+        key = AnnotationCache._key(namespace, parts)
+        now = time.time()
+
+        # 1. Tier 1: this process
+        with AnnotationCache._lock:
+            entry = AnnotationCache._local.get(key)
+            if entry is not None:
+                AnnotationCache._local.move_to_end(key)
+        if entry is not None and entry['local_until'] > now:
+            AnnotationCache.record(namespace, 'hit_local')
+            # Copy: callers get their own dict, never the one other threads are reading.
+            return copy.deepcopy(entry['value']), True
+
+        # 2. Tier 2: Redis (also holds the stale copies)
+        try:
+            entry = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Annotation cache unavailable: {e}")
+            entry = None
+
+        if entry is not None and entry['fresh_until'] > now:
+            AnnotationCache._remember(key, entry, now)
+            AnnotationCache.record(namespace, 'hit_shared')
+            return entry['value'], True
+
+        AnnotationCache.record(namespace, 'miss')
+        return (entry['value'] if entry else None), False
+
+    @staticmethod
+    def store(namespace, parts, value, negative=False):
+        key = AnnotationCache._key(namespace, parts)
+        ttl = settings.ANNOTATION_NEGATIVE_TTL if negative else settings.ANNOTATION_CACHE_TTL
+        entry = {'value': value, 'fresh_until': time.time() + ttl, 'negative': negative}
+
+        AnnotationCache._remember(key, entry, time.time())
+        try:
+            cache.set(key, entry, timeout=ttl + settings.ANNOTATION_STALE_TTL)
+        except Exception as e:
+            logger.warning(f"Annotation cache unavailable: {e}")
+
+    @staticmethod
+    def _remember(key, entry, now):
+        """Puts an entry in the local LRU. Local copies expire early so workers pick up refreshes."""
+        local_until = min(entry['fresh_until'], now + settings.ANNOTATION_LOCAL_TTL)
+        with AnnotationCache._lock:
+            AnnotationCache._local[key] = {'value': entry['value'], 'local_until': local_until}
+            AnnotationCache._local.move_to_end(key)
+            while len(AnnotationCache._local) > settings.ANNOTATION_LOCAL_SIZE:
+                AnnotationCache._local.popitem(last=False)
+
+    @staticmethod
+    def _key(namespace, parts):
+        raw = '\x1f'.join(str(part).strip().lower() for part in parts)
+        return f"annotation:{namespace}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def record(namespace, event, amount=1):
+        """Counts an event in this process (see _flush)."""
+        with AnnotationCache._counts_lock:
+            if AnnotationCache._flusher_pid != os.getpid():
+                # First event in this process (or a forked child): counts inherited
+                # from the parent are the parent's to flush. Start our own flusher.
+                AnnotationCache._counts = Counter()
+                AnnotationCache._flusher_pid = os.getpid()
+                threading.Thread(
+                    target=AnnotationCache._flush_forever, name='annotation-stats', daemon=True
+                ).start()
+            AnnotationCache._counts[f"{namespace}:{event}"] += amount
+
+    @staticmethod
+    def _flush_forever():
+        while True:
+            time.sleep(settings.ANNOTATION_STATS_FLUSH_INTERVAL)
+            AnnotationCache._flush()
+
+    @staticmethod
+    def _flush():
+        """Adds this process's pending counts to the shared hash (one pipelined round trip)."""
+        with AnnotationCache._counts_lock:
+            pending, AnnotationCache._counts = AnnotationCache._counts, Counter()
+        if not pending:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for field, amount in pending.items():
+                pipe.hincrby(STATS_KEY, field, amount)
+            pipe.execute()
+        except redis.RedisError:
+            # Metrics are best effort: keep the counts for the next flush
+            with AnnotationCache._counts_lock:
+                AnnotationCache._counts.update(pending)
+
+    @staticmethod
+    def stats():
+        """
+        Counters per namespace, e.g.
+            {"clinvar": {"hit_local": 10, "hit_shared": 4, "miss": 2, "hit_rate": 0.875}, ...}
+        """
+        AnnotationCache._flush()
+        raw = get_redis().hgetall(STATS_KEY)
+        stats = {}
+        for field, count in raw.items():
+            namespace, _, event = field.decode().partition(':')
+            stats.setdefault(namespace, {})[event] = int(count)
+
+        for counters in stats.values():
+            hits = counters.get('hit_local', 0) + counters.get('hit_shared', 0)
+            lookups = hits + counters.get('miss', 0)
+            counters['hit_rate'] = round(hits / lookups, 3) if lookups else None
+
+        with AnnotationCache._lock:
+            local_entries = len(AnnotationCache._local)
+        return {'namespaces': stats, 'local_entries': local_entries}
+
+    @staticmethod
+    def clear_local():
+        with AnnotationCache._lock:
+            AnnotationCache._local.clear()
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class BiophysicalEngine:
     """
     The 'Physics Engine' of GeneRosetta.
@@ -42,6 +45,22 @@ class BiophysicalEngine:
         'V': {'name': 'Valine',         'mass': 117.2, 'charge': 0,  'hydropathy': 4.2},
     }
 
+    # -------------------------------------------------------------------------
+    # COMPILED TABLES (built once at import, see _compile below)
+    # -------------------------------------------------------------------------
+    # CODES:    the 20 letters in AMINO_ACIDS order; residue index i <-> CODES[i]
+    # INVALID:  index 20, used for anything that is not one of the 20 letters
+    # *_DELTA:  21x21 matrices indexed [old, new]; row/column INVALID is NaN
+    # -------------------------------------------------------------------------
+    CODES = ''
+    INVALID = 20
+    MASS_DELTA = None
+    CHARGE_DELTA = None
+    HYDROPATHY_DELTA = None
+    NAMES = None
+    _BYTE_INDEX = None
+    _SUBSTITUTIONS = {}
+
     @staticmethod
     def calculate_deltas(old_residue_char, new_residue_char):
         """
@@ -54,42 +73,139 @@ class BiophysicalEngine:
         Returns:
             dict: The numerical differences, or None if invalid input.
         """
-        # 1. Lookup the data for both letters
-
         # Guard Clause: If inputs are missing (e.g. healthy gene), return None immediately.
         if not old_residue_char or not new_residue_char:
             return None
-        
-        # .get() prevents crashing if a weird letter (like 'X' or 'Z') is passed
-        old_aa = BiophysicalEngine.AMINO_ACIDS.get(old_residue_char.upper())
-        new_aa = BiophysicalEngine.AMINO_ACIDS.get(new_residue_char.upper())
 
-        # If input is garbage (not a real amino acid), return None
-        if not old_aa or not new_aa:
-            return None
+        # All 400 answers are precomputed; unknown letters (like 'X' or 'Z') are simply not in the table.
+        result = BiophysicalEngine._SUBSTITUTIONS.get((old_residue_char, new_residue_char))
+        return dict(result) if result else None
 
-        # 2. Perform the Math (The Physics Logic)
+    @staticmethod
+    def calculate_deltas_batch(old_residues, new_residues):
+        """
+        Vectorised calculate_deltas for many substitutions at once.
+
+        Args:
+            old_residues: residues before mutation. A string ("WRK"), a list of
+                letters (['W', 'R', 'K']) or a NumPy array of letters, e.g. the
+                'old_aa' column of a variant table.
+            new_residues: residues after mutation, same length.
+
+        Returns:
+            dict of column arrays (one row per substitution):
+                mass_delta, charge_delta, hydropathy_delta: float64 (NaN where invalid)
+                old_aa_name, new_aa_name: object arrays (None where invalid)
+                valid: bool, False where calculate_deltas would have returned None
+        """
+        old_index = BiophysicalEngine._encode(old_residues)
+        new_index = BiophysicalEngine._encode(new_residues)
+        if old_index.shape != new_index.shape:
+            raise ValueError(f"Got {old_index.size} old residues but {new_index.size} new residues.")
+
+        valid = (old_index != BiophysicalEngine.INVALID) & (new_index != BiophysicalEngine.INVALID)
         return {
-            # MASS DELTA:
-            # If Positive (+): We added weight. The new piece is bigger.
-            # Implication: "Steric Hindrance" (It might not fit in the hole).
-            # If Negative (-): We lost weight. The new piece is smaller.
-            # Implication: "Cavity Formation" (It leaves an empty gap, destabilizing structure).
-            "mass_delta": round(new_aa['mass'] - old_aa['mass'], 2),
-
-            # CHARGE DELTA:
-            # If Not Zero: We changed the magnetism.
-            # e.g., +1 to -1 is a delta of -2. This is huge.
-            # Implication: Breaks "Salt Bridges" (the glue holding the protein together).
-            "charge_delta": new_aa['charge'] - old_aa['charge'],
-
-            # HYDROPATHY DELTA:
-            # If we go from High Positive (Oily) to High Negative (Watery).
-            # Implication: The protein core might try to turn inside out to touch water.
-            # This causes "Unfolding" (The protein breaks).
-            "hydropathy_delta": round(new_aa['hydropathy'] - old_aa['hydropathy'], 2),
-
-            # Metadata for the report generator
-            "old_aa_name": old_aa['name'],
-            "new_aa_name": new_aa['name']
-        }
\ No newline at end of file
+            "mass_delta": BiophysicalEngine.MASS_DELTA[old_index, new_index],
+            "charge_delta": BiophysicalEngine.CHARGE_DELTA[old_index, new_index],
+            "hydropathy_delta": BiophysicalEngine.HYDROPATHY_DELTA[old_index, new_index],
+            "old_aa_name": np.where(valid, BiophysicalEngine.NAMES[old_index], None),
+            "new_aa_name": np.where(valid, BiophysicalEngine.NAMES[new_index], None),
+            "valid": valid,
+        }
+
+    @staticmethod
+    def _encode(residues):
+        """Residue letters -> int array of table indices (INVALID for anything unknown)."""
+        if isinstance(residues, str):
+            codes = np.frombuffer(residues.encode('ascii', 'replace'), dtype=np.uint8)
+            return BiophysicalEngine._BYTE_INDEX[codes]
+
+        residues = np.asarray(residues)
+        # Fast paths: one letter per item, read the character codes directly (no Python loop).
+        # Empty strings are code 0 and anything above 255 is clamped to 255; both map to INVALID.
+        if residues.dtype.kind == 'U' and residues.dtype.itemsize == 4:
+            codes = np.minimum(residues.view(np.uint32), 255)
+            return BiophysicalEngine._BYTE_INDEX[codes]
+        if residues.dtype == np.dtype('S1'):
+            return BiophysicalEngine._BYTE_INDEX[residues.view(np.uint8)]
+
+        # Slow path: mixed objects (None, '', 'Trp'...). Only single letters are residues.
+        letters = [r if isinstance(r, str) and len(r) == 1 else '?' for r in residues.ravel()]
+        codes = np.frombuffer(''.join(letters).encode('ascii', 'replace'), dtype=np.uint8)
+        return BiophysicalEngine._BYTE_INDEX[codes].reshape(residues.shape)
+
+    @staticmethod
+    def _compile():
+        """
+        Builds the lookup tables from AMINO_ACIDS.
+        The deltas use the exact same arithmetic (and rounding) as the original per-call
+        code, so batch results and calculate_deltas agree to the last digit.
+        """
+        amino_acids = BiophysicalEngine.AMINO_ACIDS
+        codes = ''.join(amino_acids)
+        size = len(codes) + 1  # + INVALID
+        invalid = len(codes)
+
+        mass = np.full((size, size), np.nan)
+        charge = np.full((size, size), np.nan)
+        hydropathy = np.full((size, size), np.nan)
+        substitutions = {}
+
+        for i, old in enumerate(codes):
+            for j, new in enumerate(codes):
+                old_aa, new_aa = amino_acids[old], amino_acids[new]
+                result = {
+                    # MASS DELTA:
+                    # If Positive (+): We added weight. The new piece is bigger.
+                    # Implication: "Steric Hindrance" (It might not fit in the hole).
+                    # If Negative (-): We lost weight. The new piece is smaller.
+                    # Implication: "Cavity Formation" (It leaves an empty gap, destabilizing structure).
+                    "mass_delta": round(new_aa['mass'] - old_aa['mass'], 2),
+
+                    # CHARGE DELTA:
+                    # If Not Zero: We changed the magnetism.
+                    # e.g., +1 to -1 is a delta of -2. This is huge.
+                    # Implication: Breaks "Salt Bridges" (the glue holding the protein together).
+                    "charge_delta": new_aa['charge'] - old_aa['charge'],
+
+                    # HYDROPATHY DELTA:
+                    # If we go from High Positive (Oily) to High Negative (Watery).
+                    # Implication: The protein core might try to turn inside out to touch water.
+                    # This causes "Unfolding" (The protein breaks).
+                    "hydropathy_delta": round(new_aa['hydropathy'] - old_aa['hydropathy'], 2),
+
+                    # Metadata for the report generator
+                    "old_aa_name": old_aa['name'],
+                    "new_aa_name": new_aa['name']
+                }
+                mass[i, j] = result['mass_delta']
+                charge[i, j] = result['charge_delta']
+                hydropathy[i, j] = result['hydropathy_delta']
+
+                # Same answer for any capitalisation ('w'/'W'), without calling .upper() per call
+                for old_key in {old, old.lower()}:
+                    for new_key in {new, new.lower()}:
+                        substitutions[(old_key, new_key)] = result
+
+        # Byte -> index lookup for both cases; everything else is INVALID
+        byte_index = np.full(256, invalid, dtype=np.intp)
+        for i, code in enumerate(codes):
+            byte_index[ord(code)] = i
+            byte_index[ord(code.lower())] = i
+
+        names = np.array([amino_acids[code]['name'] for code in codes] + [None], dtype=object)
+
+        for table in (mass, charge, hydropathy):
+            table.flags.writeable = False
+
+        BiophysicalEngine.CODES = codes
+        BiophysicalEngine.INVALID = invalid
+        BiophysicalEngine.MASS_DELTA = mass
+        BiophysicalEngine.CHARGE_DELTA = charge
+        BiophysicalEngine.HYDROPATHY_DELTA = hydropathy
+        BiophysicalEngine.NAMES = names
+        BiophysicalEngine._BYTE_INDEX = byte_index
+        BiophysicalEngine._SUBSTITUTIONS = substitutions
+
+
+BiophysicalEngine._compile()
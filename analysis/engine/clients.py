@@ -1,90 +1,241 @@
-import requests # type: ignore
+import io
 import logging
 from Bio import Entrez
+from django.conf import settings
+from .annotation_cache import AnnotationCache
+from .deadline import DeadlineExceeded
+from .http_client import HttpClient
+from .rate_limit import RateLimiter
 
 # Configure Logging
 logger = logging.getLogger(__name__)
 
 # IMPORTANT: NCBI requires you to provide an email so they can contact you 
-# if your script accidentally spams their server.
-Entrez.email = "emediongfrancis@gmail.com" 
+# if your script accidentally spams their server (same identity as _eutils sends).
+Entrez.email = settings.NCBI_EMAIL
+Entrez.tool = settings.NCBI_TOOL
 
 class ClinVarClient:
     """
     The 'Doctor'. 
     Talks to the NCBI ClinVar database to see if a human mutation causes disease.
+
+    Every E-utilities call takes a token from the shared NCBI rate limiter first,
+    so all workers together stay under NCBI's per-IP limit.
     """
-    
+
+    # Variants OR'd into one esearch term (keeps the query a sane length).
+    SEARCH_BATCH = 50
+    # IDs per esummary call (NCBI recommends POST and at most a few hundred).
+    SUMMARY_BATCH = 200
+    # Candidate records fetched per variant in a batched search.
+    RETMAX_PER_VARIANT = 20
+
+    IGNORED_TRAITS = ["not provided",
+                      "not specified",
+                      "see cases",
+                      "all highly penetrant phenotypes",
+                      "Unspecified Condition"
+                      ]
+
+    NOT_FOUND = {"significance": "Unknown / Not Listed in ClinVar"}
+    UNAVAILABLE = {"significance": "Error connecting to Clinical Database"}
+
     @staticmethod
     def fetch_variant_data(gene_name, variant_code):
         """
         Uses NCBI E-utilities to find clinical significance.
         Input: Gene="BRCA1", Variant="c.123A>T" (or protein change)
+        Answers (including "not listed") are cached, see AnnotationCache.
         """
         try:
-            # 1. Construct a Search Query
-            # We look for the Gene AND the specific mutation string.
-            search_term = f"{gene_name}[Gene Name] AND {variant_code}[Text Word]"
-            logger.info(f"ClinVar Search: {search_term}")
-
-            # 2. E-Search: Find the ID of the record
-            handle = Entrez.esearch(db="clinvar", term=search_term, retmax=1)
-            record = Entrez.read(handle, validate=False)
-            handle.close()
-
-            id_list = record['IdList'] # type: ignore
-
-            if not id_list:
-                logger.warning("ClinVar: No matching record found.")
-                return {"significance": "Unknown / Not Listed in ClinVar"}
-
-            # 3. E-Summary: Get the details for that ID
-            clinvar_id = id_list[0]
-            summary_handle = Entrez.esummary(db="clinvar", id=clinvar_id)
-            summary_record = Entrez.read(summary_handle, validate=False)
-            summary_handle.close()
-
-            # 4. Parse the Result
-            # The structure of the response is messy. We look for 'clinical_significance'.
-            data = summary_record['DocumentSummarySet']['DocumentSummary'][0] # type: ignore
-            # A. Extract Significance (The Waterfall)
-            # Priority 1: Germline Classification (Modern standard for hereditary diseases)
-            # Priority 2: Clinical Significance (Legacy/Aggregate field)
-            significance = "Unknown"
-            
-            if 'germline_classification' in data and 'description' in data['germline_classification']:
-                significance = data['germline_classification']['description']
-            elif 'clinical_significance' in data and 'description' in data['clinical_significance']:
-                significance = data['clinical_significance']['description']
-            
-            # B. Extract Disease Name (The Filter)
-            # We look through the 'trait_set' list.
-            # We skip generic terms like "not provided" or "All highly penetrant phenotypes"
-            disease_name = "Unspecified Condition"
-            traits = data.get('trait_set', [])
-            
-            ignored_terms = ["not provided", 
-                             "not specified",
-                             "see cases",
-                             "all highly penetrant phenotypes",
-                             "Unspecified Condition"
-                             ]
-            
-            for trait in traits:
-                name = trait.get('trait_name', '')
-                if name and name.lower() not in ignored_terms:
-                    disease_name = name
-                    break # Stop at the first real disease name found
-
-            return {
-                "significance": significance, # e.g., "Pathogenic", "Benign"
-                "disease": disease_name,      # e.g., "Breast Cancer"
-                "clinvar_id": clinvar_id
-            }
-
+            return AnnotationCache.get_or_fetch(
+                'clinvar', (gene_name, variant_code),
+                lambda: ClinVarClient._lookup_variant(gene_name, variant_code),
+                is_negative=ClinVarClient._not_found,
+            )
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"ClinVar API Error: {e}")
-            return {"significance": "Error connecting to Clinical Database"}
+            return dict(ClinVarClient.UNAVAILABLE)
+
+    @staticmethod
+    def _lookup_variant(gene_name, variant_code):
+        """Uncached esearch + esummary for one variant. Raises on upstream errors."""
+        # 1. Construct a Search Query
+        # We look for the Gene AND the specific mutation string.
+        search_term = f"{gene_name}[Gene Name] AND {variant_code}[Text Word]"
+        logger.info(f"ClinVar Search: {search_term}")
+
+        # 2. E-Search: Find the ID of the record
+        record = ClinVarClient._eutils("esearch", term=search_term, retmax=1)
+        id_list = record['IdList'] # type: ignore
+
+        if not id_list:
+            logger.warning("ClinVar: No matching record found.")
+            return dict(ClinVarClient.NOT_FOUND)
+
+        # 3. E-Summary: Get the details for that ID
+        clinvar_id = id_list[0]
+        summary_record = ClinVarClient._eutils("esummary", id=clinvar_id)
+
+        # 4. Parse the Result
+        data = summary_record['DocumentSummarySet']['DocumentSummary'][0] # type: ignore
+        return ClinVarClient._parse_summary(data, clinvar_id)
+
+    @staticmethod
+    def _not_found(result):
+        return result == ClinVarClient.NOT_FOUND
+
+    @staticmethod
+    def fetch_variants_batch(pairs):
+        """
+        Batched version of fetch_variant_data for many variants at once.
+        Input:  [("BRCA1", "c.68_69del"), ("BRCA1", "c.5266dup"), ("TP53", "R175H")]
+        Output: {("BRCA1", "c.68_69del"): {...same dict as fetch_variant_data...}, ...}
+
+        Instead of 2 requests per variant this makes one esearch per gene
+        (variants OR'd together, SEARCH_BATCH at a time) and one esummary per
+        SUMMARY_BATCH IDs, then matches each record back to its variant.
+        """
+        # 1. Serve what the annotation cache already knows
+        results, stale = {}, {}
+        by_gene = {}
+        for pair in dict.fromkeys(pairs):
+            value, fresh = AnnotationCache.lookup('clinvar', pair)
+            if fresh:
+                results[pair] = value
+                continue
+            if value is not None:
+                stale[pair] = value
+            # Group the misses by gene (dropping duplicates, keeping order)
+            by_gene.setdefault(pair[0], []).append(pair[1])
+
+        # 2. Resolve the misses in batches
+        for gene_name, variants in by_gene.items():
+            for i in range(0, len(variants), ClinVarClient.SEARCH_BATCH):
+                chunk = variants[i:i + ClinVarClient.SEARCH_BATCH]
+                try:
+                    resolved = ClinVarClient._resolve_chunk(gene_name, chunk)
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    logger.error(f"ClinVar API Error ({gene_name}, {len(chunk)} variants): {e}")
+                    for variant_code in chunk:
+                        pair = (gene_name, variant_code)
+                        # Upstream down: fall back to a stale answer when we have one
+                        if pair in stale:
+                            AnnotationCache.record('clinvar', 'stale_served')
+                            results[pair] = stale[pair]
+                        else:
+                            AnnotationCache.record('clinvar', 'errors')
+                            results[pair] = dict(ClinVarClient.UNAVAILABLE)
+                    continue
+
+                for pair, value in resolved.items():
+                    AnnotationCache.store('clinvar', pair, value, negative=ClinVarClient._not_found(value))
+                results.update(resolved)
+        return results
+
+    @staticmethod
+    def _resolve_chunk(gene_name, variants):
+        """One esearch for up to SEARCH_BATCH variants of a gene, then batched esummary."""
+        # 1. E-Search: all variants of this gene in one query
+        words = " OR ".join(f"{variant_code}[Text Word]" for variant_code in variants)
+        search_term = f"{gene_name}[Gene Name] AND ({words})"
+        logger.info(f"ClinVar Batch Search: {gene_name} ({len(variants)} variants)")
+
+        record = ClinVarClient._eutils(
+            "esearch", term=search_term, retmax=ClinVarClient.RETMAX_PER_VARIANT * len(variants)
+        )
+        id_list = list(record['IdList']) # type: ignore
+
+        # 2. E-Summary: SUMMARY_BATCH IDs per request (esearch order = relevance order)
+        summaries = []
+        for i in range(0, len(id_list), ClinVarClient.SUMMARY_BATCH):
+            summary_record = ClinVarClient._eutils(
+                "esummary", id=",".join(id_list[i:i + ClinVarClient.SUMMARY_BATCH])
+            )
+            summaries.extend(summary_record['DocumentSummarySet']['DocumentSummary']) # type: ignore
+
+        # 3. Match each record back to the variant it describes.
+        # A lone variant gets the top hit, exactly like fetch_variant_data.
+        results = {}
+        for variant_code in variants:
+            match = None
+            for data in summaries:
+                if len(variants) == 1 or ClinVarClient._describes(data, variant_code):
+                    match = data
+                    break
+
+            if match is None:
+                results[(gene_name, variant_code)] = dict(ClinVarClient.NOT_FOUND)
+            else:
+                clinvar_id = match.attributes.get('uid') or match.get('uid', '')
+                results[(gene_name, variant_code)] = ClinVarClient._parse_summary(match, clinvar_id)
+        return results
+
+    @staticmethod
+    def _describes(data, variant_code):
+        """True if a ClinVar summary mentions the variant (title, protein change or HGVS names)."""
+        fields = [data.get('title', ''), data.get('protein_change', '')]
+        for variation in data.get('variation_set', []):
+            fields.append(variation.get('variation_name', ''))
+            fields.append(variation.get('cdna_change', ''))
+        needle = variant_code.lower()
+        return any(needle in str(field).lower() for field in fields)
+
+    @staticmethod
+    def _parse_summary(data, clinvar_id):
+        """Turns one ClinVar DocumentSummary into the {significance, disease, clinvar_id} dict."""
+        # The structure of the response is messy. We look for 'clinical_significance'.
+        # A. Extract Significance (The Waterfall)
+        # Priority 1: Germline Classification (Modern standard for hereditary diseases)
+        # Priority 2: Clinical Significance (Legacy/Aggregate field)
+        significance = "Unknown"
+        
+        if 'germline_classification' in data and 'description' in data['germline_classification']:
+            significance = data['germline_classification']['description']
+        elif 'clinical_significance' in data and 'description' in data['clinical_significance']:
+            significance = data['clinical_significance']['description']
+        
+        # B. Extract Disease Name (The Filter)
+        # We look through the 'trait_set' list (newer records nest it under the classification).
+        # We skip generic terms like "not provided" or "All highly penetrant phenotypes"
+        disease_name = "Unspecified Condition"
+        traits = data.get('trait_set') or data.get('germline_classification', {}).get('trait_set', [])
+        
+        for trait in traits:
+            name = trait.get('trait_name', '')
+            if name and name.lower() not in ClinVarClient.IGNORED_TRAITS:
+                disease_name = name
+                break # Stop at the first real disease name found
+
+        # Plain str: Entrez's StringElement carries XML attributes we don't want to cache.
+        return {
+            "significance": str(significance), # e.g., "Pathogenic", "Benign"
+            "disease": str(disease_name),      # e.g., "Breast Cancer"
+            "clinvar_id": str(clinvar_id)
+        }
+
+    @staticmethod
+    def _eutils(endpoint, **params):
+        """
+        Rate-limited POST to an E-utilities endpoint (esearch/esummary) on db=clinvar.
+        Returns the parsed XML (Entrez.read), raises on HTTP errors.
+        """
+        params.update({"db": "clinvar", "tool": settings.NCBI_TOOL, "email": settings.NCBI_EMAIL})
+        if settings.NCBI_API_KEY:
+            params["api_key"] = settings.NCBI_API_KEY
+
+        # Read-only queries, so safe to retry (each retry takes its own NCBI token)
+        response = HttpClient.post(
+            f"{settings.NCBI_EUTILS_URL}/{endpoint}.fcgi", data=params, timeout=30,
+            idempotent=True, throttle=RateLimiter.ncbi,
+        )
+        response.raise_for_status()
+        return Entrez.read(io.BytesIO(response.content), validate=False)
 
 
 class UniProtClient:
@@ -94,55 +245,66 @@ class UniProtClient:
     Works for any species (Dog, Virus, Bacteria).
     """
 
-    BASE_URL = "https://rest.uniprot.org/uniprotkb/search"
+    NOT_FOUND = {"function": "No functional data found for this protein."}
 
     @staticmethod
     def fetch_protein_data(organism_name, gene_name):
         """
         Input: Organism="Canis lupus familiaris", Gene="INS"
         Output: "Insulin decreases blood glucose concentration..."
+        Answers (including "no data") are cached, see AnnotationCache.
         """
         try:
-            # 1. Construct the API Query
-            # query = (gene:INS) AND (organism_id:9615 OR organism_name:"Canis lupus")
-            query = f"gene:{gene_name} AND organism_name:\"{organism_name}\""
-            
-            params = {
-                "query": query,
-                "format": "json",
-                "fields": "cc_function", # We only want the 'Function' comment
-                "size": 1 # Just give us the best match
-            }
-
-            logger.info(f"UniProt Search: {query}")
-
-            # 2. Make the HTTP Request
-            response = requests.get(UniProtClient.BASE_URL, params=params, timeout=10)
-            response.raise_for_status() # Raise error if 404/500
-
-            data = response.json()
-
-            # 3. Parse the JSON
-            if not data['results']:
-                return {"function": "No functional data found for this protein."}
-
-            # Dive into the JSON structure to find the "Function" comment
-            result = data['results'][0]
-            comments = result.get('comments', [])
-            
-            function_text = "Function description unavailable."
-            
-            for comment in comments:
-                if comment['commentType'] == 'FUNCTION':
-                    # Extract the actual text description
-                    function_text = comment['texts'][0]['value']
-                    break
-
-            return {
-                "function": function_text,
-                "uniprot_id": result.get('primaryAccession')
-            }
-
+            return AnnotationCache.get_or_fetch(
+                'uniprot', (organism_name, gene_name),
+                lambda: UniProtClient._lookup_protein(organism_name, gene_name),
+                is_negative=lambda result: result == UniProtClient.NOT_FOUND,
+            )
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"UniProt API Error: {e}")
-            return {"function": "Error connecting to Protein Database"}
\ No newline at end of file
+            return {"function": "Error connecting to Protein Database"}
+
+    @staticmethod
+    def _lookup_protein(organism_name, gene_name):
+        """Uncached UniProt search. Raises on upstream errors."""
+        # 1. Construct the API Query
+        # query = (gene:INS) AND (organism_id:9615 OR organism_name:"Canis lupus")
+        query = f"gene:{gene_name} AND organism_name:\"{organism_name}\""
+        
+        params = {
+            "query": query,
+            "format": "json",
+            "fields": "cc_function", # We only want the 'Function' comment
+            "size": 1 # Just give us the best match
+        }
+
+        logger.info(f"UniProt Search: {query}")
+
+        # 2. Make the HTTP Request
+        response = HttpClient.get(settings.UNIPROT_SEARCH_URL, params=params, timeout=10)
+        response.raise_for_status() # Raise error if 404/500
+
+        data = response.json()
+
+        # 3. Parse the JSON
+        if not data['results']:
+            return dict(UniProtClient.NOT_FOUND)
+
+        # Dive into the JSON structure to find the "Function" comment
+        result = data['results'][0]
+        comments = result.get('comments', [])
+        
+        function_text = "Function description unavailable."
+        
+        for comment in comments:
+            if comment['commentType'] == 'FUNCTION':
+                # Extract the actual text description
+                function_text = comment['texts'][0]['value']
+                break
+
+        return {
+            "function": function_text,
+            "uniprot_id": result.get('primaryAccession')
+        }
@@ -0,0 +1,80 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(Exception):
+    """The analysis ran out of time before (or while) making an external call."""
+
+
+class Deadline:
+    """
+    Time budget of the analysis running in the current thread.
+
+    The pipeline opens it around every stage that calls out (see running()), from
+    the project's deadline. Everything inside the stage (the scanner, the strategies
+    and their clients, StructureService) goes through HttpClient, which caps each
+    request's timeout to the time left and raises DeadlineExceeded once none is.
+    So a stage's timeout is whatever remains of its project's budget.
+
+    Outside running() there is no budget and timeouts are left as given.
+    """
+
+    _local = threading.local()
+
+    @staticmethod
+    @contextmanager
+    def running(deadline):
+        """deadline: UNIX timestamp, or None for no budget."""
+        previous = getattr(Deadline._local, 'deadline', None)
+        Deadline._local.deadline = deadline
+        try:
+            yield
+        finally:
+            Deadline._local.deadline = previous
+
+    @staticmethod
+    def left(deadline):
+        """Seconds until the given deadline (negative once past), or None for no deadline."""
+        return None if deadline is None else deadline - time.time()
+
+    @staticmethod
+    def remaining():
+        """Seconds left in this thread's budget, or None if there is none."""
+        return Deadline.left(getattr(Deadline._local, 'deadline', None))
+
+    @staticmethod
+    def check():
+        """Raises DeadlineExceeded if this thread's budget is spent."""
+        remaining = Deadline.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(f"Time budget exhausted {-remaining:.1f}s ago.")
+
+    @staticmethod
+    def timeout(default):
+        """A call's timeout: 'default', capped to the time left. Raises DeadlineExceeded if none is."""
+        Deadline.check()
+        remaining = Deadline.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+    @staticmethod
+    def cap(countdown):
+        """A retry countdown that doesn't sleep past the deadline (wakes just after it)."""
+        remaining = Deadline.remaining()
+        if remaining is None:
+            return countdown
+        return min(countdown, max(0, math.ceil(remaining)) + 1)
+
+    @staticmethod
+    def sleep(seconds):
+        """
+        time.sleep() for a backoff or throttle wait. If the wait outlasts the time left,
+        raises DeadlineExceeded straight away instead of sleeping into an expired budget.
+        """
+        remaining = Deadline.remaining()
+        if remaining is not None and remaining < seconds:
+            raise DeadlineExceeded(f"A {seconds:.1f}s wait doesn't fit in the {max(remaining, 0):.1f}s left.")
+        time.sleep(seconds)
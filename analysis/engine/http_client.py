@@ -0,0 +1,189 @@
+import os
+import threading
+import logging
+from collections import Counter
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from .deadline import Deadline
+from .metrics import Metrics
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+# Transient upstream answers worth retrying (rate limited / overloaded / gateway errors).
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class _CountingRetry(Retry):
+    """
+    urllib3 Retry that reports every retry attempt to HttpClient's metrics,
+    and doesn't wait for a retry the analysis has no time left for (see Deadline.sleep).
+    The request's own options (see HttpClient.request) decide whether a POST may be
+    repeated and which rate limiter a retry waits for.
+    """
+
+    def _is_method_retryable(self, method):
+        # urllib3's idempotent methods, plus POSTs the caller declared safe to repeat
+        return super()._is_method_retryable(method) or getattr(HttpClient._local, 'idempotent', False)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        host = 'unknown'
+        if _pool is not None:
+            # Same key as urlsplit(url).netloc in HttpClient.request (port only when non-default).
+            host = _pool.host if _pool.port in (None, 80, 443) else f"{_pool.host}:{_pool.port}"
+        reason = str(response.status) if response is not None else type(error).__name__
+        HttpClient._record(host, f'retries_{reason}')
+        # No second attempt once the analysis is out of time
+        Deadline.check()
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+    def sleep(self, response=None):
+        """Retry-After or backoff wait, as in urllib3, but never past the analysis deadline."""
+        wait = None
+        if self.respect_retry_after_header and response:
+            wait = self.get_retry_after(response)
+        Deadline.sleep(wait or self.get_backoff_time())
+        # A retry is one more request to the host: it takes a token like the first attempt did
+        throttle = getattr(HttpClient._local, 'throttle', None)
+        if throttle is not None:
+            throttle()
+
+
+class HttpClient:
+    """
+    Shared HTTP layer for every external API (UniProt, ESMFold, NCBI).
+
+    - One keep-alive requests.Session per host, reused by all tasks in the worker
+      process, so repeated calls skip the TCP + TLS handshake.
+    - Retries on 429/5xx and connection errors with exponential, jittered backoff
+      (and Retry-After when the server sends it). POSTs are only retried when the
+      caller passes idempotent=True: a repeated BLAST CMD=Put would start a new search.
+    - Sessions are rebuilt after a fork, so prefork children never share sockets.
+    - Inside a pipeline stage, timeouts are capped to the project's remaining time
+      budget, and an exhausted budget (or a retry wait longer than what is left)
+      raises DeadlineExceeded (see Deadline).
+    """
+
+    _sessions = {}
+    _pid = None
+    _lock = threading.Lock()
+    _metrics = {}
+    _local = threading.local()
+
+    @staticmethod
+    def _build_session():
+        retry = _CountingRetry(
+            total=settings.HTTP_RETRY_TOTAL,
+            backoff_factor=settings.HTTP_RETRY_BACKOFF,
+            backoff_jitter=settings.HTTP_RETRY_JITTER,
+            status_forcelist=RETRY_STATUSES,
+            # Hand the final 5xx back to the caller instead of raising, like plain requests.
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @staticmethod
+    def session(url):
+        """Returns the pooled session for the URL's host (creating it on first use)."""
+        host = urlsplit(url).netloc
+        with HttpClient._lock:
+            if HttpClient._pid != os.getpid():
+                # New process (e.g. prefork child): drop sockets inherited from the parent.
+                HttpClient._sessions = {}
+                HttpClient._metrics = {}
+                HttpClient._pid = os.getpid()
+
+            session = HttpClient._sessions.get(host)
+            if session is None:
+                session = HttpClient._build_session()
+                HttpClient._sessions[host] = session
+            return session
+
+    @staticmethod
+    def request(method, url, idempotent=False, throttle=None, **kwargs):
+        """
+        idempotent: the POST is safe to send twice (a search, a fold, a BLAST poll), so it is
+                    retried like a GET. Leave False for anything that creates state upstream.
+        throttle:   called before the request and before each of its retries (e.g. RateLimiter.ncbi).
+        """
+        host = urlsplit(url).netloc
+        if throttle is not None:
+            throttle()
+        kwargs['timeout'] = Deadline.timeout(kwargs.get('timeout'))
+        session = HttpClient.session(url)
+        HttpClient._record(host, 'requests')
+        with Metrics.span('http', host=host) as span:
+            # Read by _CountingRetry, which runs in this thread inside session.request()
+            HttpClient._local.idempotent, HttpClient._local.throttle = idempotent, throttle
+            try:
+                response = session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                HttpClient._record(host, 'failures')
+                if isinstance(e, requests.Timeout):
+                    # Timed out because the budget ran out, not because the host is slow
+                    Deadline.check()
+                raise
+            finally:
+                HttpClient._local.idempotent, HttpClient._local.throttle = False, None
+            if response.status_code >= 400:
+                span.outcome = f"http_{response.status_code}"
+            span.size = len(response.content)
+            return response
+
+    @staticmethod
+    def get(url, **kwargs):
+        return HttpClient.request('GET', url, **kwargs)
+
+    @staticmethod
+    def post(url, **kwargs):
+        return HttpClient.request('POST', url, **kwargs)
+
+    @staticmethod
+    def _record(host, name):
+        with HttpClient._lock:
+            HttpClient._metrics.setdefault(host, Counter())[name] += 1
+
+    @staticmethod
+    def stats():
+        """
+        Per-host pool and retry metrics for this process:
+            {host: {"requests", "failures", "retries_<status|error>",
+                    "connections_opened", "pool_requests"}}
+        """
+        with HttpClient._lock:
+            stats = {host: dict(counter) for host, counter in HttpClient._metrics.items()}
+            sessions = dict(HttpClient._sessions)
+
+        for host, session in sessions.items():
+            opened = served = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        opened += pool.num_connections
+                        served += pool.num_requests
+            entry = stats.setdefault(host, {})
+            entry['connections_opened'] = opened
+            entry['pool_requests'] = served
+        return stats
+
+    @staticmethod
+    def reset():
+        """Closes every pooled connection (used by benchmarks and on shutdown)."""
+        with HttpClient._lock:
+            for session in HttpClient._sessions.values():
+                session.close()
+            HttpClient._sessions = {}
+            HttpClient._metrics = {}
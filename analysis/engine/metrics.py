@@ -0,0 +1,256 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+import redis
+from django.conf import settings
+from .redis_client import get_redis
+
+SPANS_KEY = 'metrics:spans'
+COUNTERS_KEY = 'metrics:counters'
+
+# Histogram upper bounds (the last bucket is +Inf)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class Span:
+    """One timed operation. Set .outcome / .size inside the with-block to override the defaults."""
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.outcome = 'ok'
+        self.size = None
+        self.seconds = None
+
+
+class Metrics:
+    """
+    Pipeline and client instrumentation.
+
+    span() times a block and records duration, outcome and payload size into
+    Redis-backed histograms, so the numbers of every web process and Celery worker
+    add up in one place. GET /metrics renders them in the Prometheus text format
+    (see render()).
+
+    Spans and counters are added up in-process and written to Redis every
+    METRICS_FLUSH_INTERVAL seconds by a background thread (one pipelined round trip
+    per flush), so recording one costs no Redis call on the hot path.
+
+    Spans are also handed to the collector of the current thread, if any; the
+    pipeline uses that to keep per-project timings (see collect()).
+    """
+
+    _local = threading.local()
+    _broker = None
+
+    # {(hash key, field): amount} waiting for the next flush
+    _pending = Counter()
+    _pending_lock = threading.Lock()
+    _flusher_pid = None
+    _broker_lock = threading.Lock()
+
+    @staticmethod
+    @contextmanager
+    def span(name, **labels):
+        """
+        with Metrics.span('http', host='rest.uniprot.org') as span:
+            response = ...
+            span.size = len(response.content)
+        """
+        span = Span(name, labels)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            if span.outcome == 'ok':
+                span.outcome = type(e).__name__
+            raise
+        finally:
+            span.seconds = time.perf_counter() - started
+            Metrics._record(span)
+
+    @staticmethod
+    @contextmanager
+    def collect():
+        """Gathers the spans finished in this thread: {name: {"count", "seconds"}}."""
+        previous = getattr(Metrics._local, 'collector', None)
+        collector = {}
+        Metrics._local.collector = collector
+        try:
+            yield collector
+        finally:
+            Metrics._local.collector = previous
+
+    @staticmethod
+    def increment(name, amount=1, **labels):
+        """Adds to a plain counter (e.g. cache hits)."""
+        if not settings.METRICS_ENABLED:
+            return
+        Metrics._add({(COUNTERS_KEY, Metrics._series(name, labels)): amount})
+
+    @staticmethod
+    def _record(span):
+        collector = getattr(Metrics._local, 'collector', None)
+        if collector is not None:
+            entry = collector.setdefault(span.name, {'count': 0, 'seconds': 0.0})
+            entry['count'] += 1
+            entry['seconds'] = round(entry['seconds'] + span.seconds, 4)
+
+        if not settings.METRICS_ENABLED:
+            return
+
+        series = Metrics._series(span.name, {**span.labels, 'outcome': span.outcome})
+        amounts = {
+            (SPANS_KEY, f"{series}|seconds|{Metrics._bucket(span.seconds, DURATION_BUCKETS)}"): 1,
+            (SPANS_KEY, f"{series}|seconds|sum"): span.seconds,
+        }
+        if span.size is not None:
+            amounts[(SPANS_KEY, f"{series}|bytes|{Metrics._bucket(span.size, SIZE_BUCKETS)}")] = 1
+            amounts[(SPANS_KEY, f"{series}|bytes|sum")] = int(span.size)
+        Metrics._add(amounts)
+
+    @staticmethod
+    def _add(amounts):
+        """Adds to this process's pending amounts (see _flush)."""
+        with Metrics._pending_lock:
+            if Metrics._flusher_pid != os.getpid():
+                # First event in this process (or a forked child): amounts inherited
+                # from the parent are the parent's to flush. Start our own flusher.
+                Metrics._pending = Counter()
+                Metrics._flusher_pid = os.getpid()
+                threading.Thread(target=Metrics._flush_forever, name='metrics-flush', daemon=True).start()
+            Metrics._pending.update(amounts)
+
+    @staticmethod
+    def _flush_forever():
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            Metrics._flush()
+
+    @staticmethod
+    def _flush():
+        """Adds this process's pending amounts to the shared hashes (one pipelined round trip)."""
+        with Metrics._pending_lock:
+            pending, Metrics._pending = Metrics._pending, Counter()
+        if not pending:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for (key, field), amount in pending.items():
+                if isinstance(amount, float):
+                    pipe.hincrbyfloat(key, field, amount)
+                else:
+                    pipe.hincrby(key, field, amount)
+            pipe.execute()
+        except redis.RedisError:
+            # Metrics are best effort: keep the amounts for the next flush
+            with Metrics._pending_lock:
+                Metrics._pending.update(pending)
+
+    @staticmethod
+    def _series(name, labels):
+        """Stable hash field for a name + label set."""
+        return json.dumps([name, sorted(labels.items())], separators=(',', ':'))
+
+    @staticmethod
+    def _bucket(value, bounds):
+        for bound in bounds:
+            if value <= bound:
+                return str(bound)
+        return '+Inf'
+
+    @staticmethod
+    def queue_depths():
+        """
+        Messages waiting per Celery queue: {queue: depth}.
+        Reads the broker's Redis lists directly (LLEN, one round trip), so it's cheap to call.
+        Every priority level is its own list ('<queue>', '<queue>:1', ...); they are summed.
+        """
+        queues = sorted({'celery'} | {route['queue'] for route in settings.CELERY_TASK_ROUTES.values()})
+        options = settings.CELERY_BROKER_TRANSPORT_OPTIONS
+        suffixes = [f"{options['sep']}{step}" if step else '' for step in options['priority_steps']]
+        with Metrics._broker_lock:
+            if Metrics._broker is None:
+                Metrics._broker = redis.Redis.from_url(
+                    settings.CELERY_BROKER_URL, socket_connect_timeout=2, socket_timeout=5
+                )
+        pipe = Metrics._broker.pipeline(transaction=False)
+        for queue in queues:
+            for suffix in suffixes:
+                pipe.llen(queue + suffix)
+        depths = iter(pipe.execute())
+        return {queue: sum(next(depths) for _ in suffixes) for queue in queues}
+
+    @staticmethod
+    def render(extra=()):
+        """
+        Prometheus text exposition of every span histogram and counter, plus
+        extra series given as [(metric, type, help, [(labels, value), ...])].
+        """
+        Metrics._flush()
+        client = get_redis()
+        spans = client.hgetall(SPANS_KEY)
+        counters = client.hgetall(COUNTERS_KEY)
+
+        # {(metric, series): {bucket|'sum': value}}
+        histograms = {}
+        for field, value in spans.items():
+            series, metric, bucket = field.decode().rsplit('|', 2)
+            histograms.setdefault((metric, series), {})[bucket] = float(value)
+
+        lines = []
+        for metric, family, help_text, bounds in (
+            ('seconds', 'generosetta_span_duration_seconds', 'Duration of pipeline stages and external calls.', DURATION_BUCKETS),
+            ('bytes', 'generosetta_span_payload_bytes', 'Payload size of pipeline stages and external calls.', SIZE_BUCKETS),
+        ):
+            lines += [f"# HELP {family} {help_text}", f"# TYPE {family} histogram"]
+            for (kind, series), buckets in sorted(histograms.items()):
+                if kind != metric:
+                    continue
+                name, labels = json.loads(series)
+                labels = [('span', name)] + [tuple(pair) for pair in labels]
+                cumulative = 0
+                for bound in [str(b) for b in bounds] + ['+Inf']:
+                    cumulative += buckets.get(bound, 0)
+                    lines.append(f"{family}_bucket{Metrics._labels(labels + [('le', bound)])} {int(cumulative)}")
+                lines.append(f"{family}_sum{Metrics._labels(labels)} {buckets.get('sum', 0.0)}")
+                lines.append(f"{family}_count{Metrics._labels(labels)} {int(cumulative)}")
+
+        lines += ["# HELP generosetta_events_total Counted events (cache hits and misses).",
+                  "# TYPE generosetta_events_total counter"]
+        for field, value in sorted(counters.items()):
+            name, labels = json.loads(field.decode())
+            labels = [('event', name)] + [tuple(pair) for pair in labels]
+            lines.append(f"generosetta_events_total{Metrics._labels(labels)} {int(value)}")
+
+        for metric, kind, help_text, samples in extra:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            for labels, value in samples:
+                if value is None or (isinstance(value, float) and math.isnan(value)):
+                    continue
+                lines.append(f"{metric}{Metrics._labels(list(labels.items()))} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(pairs):
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+    @staticmethod
+    def reset():
+        """Drops every recorded span and counter (used by benchmarks)."""
+        with Metrics._pending_lock:
+            Metrics._pending = Counter()
+        get_redis().delete(SPANS_KEY, COUNTERS_KEY)
+
+
+def _escape(value):
+    """Label value escaping of the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
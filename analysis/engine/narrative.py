@@ -3,14 +3,29 @@ class NarrativeComposer:
     Determinist Logic Engine for Natural Language Generation.
     Fills templates based on data values.
     """
-    
+
+    # VCF variants that are not a simple residue swap (see VariantService.consequence)
+    CONSEQUENCES = {
+        "nonsense": "This variant introduces a premature stop codon, truncating the protein. Truncated products are often degraded or non-functional.",
+        "frameshift": "This insertion/deletion shifts the reading frame, scrambling every downstream residue and usually ending in an early stop codon.",
+        "inframe_indel": "This in-frame insertion/deletion adds or removes residues without shifting the reading frame.",
+        "start_lost": "This variant destroys the start codon, so translation may not begin at the normal site.",
+        "stop_lost": "This variant removes the stop codon, extending the protein past its normal end.",
+        "complex": "This variant changes several neighbouring residues at once.",
+        "synonymous": "This variant does not change the encoded amino acid (synonymous).",
+        "outside_cds": "This variant lies outside the reference coding sequence.",
+        "ref_mismatch": "The reference allele of this variant does not match the supplied reference sequence, so it was not interpreted.",
+    }
+
     @staticmethod
-    def generate_report(context):
+    def generate_report(context, profile=None):
         """
         context dictionary must contain:
         - biophysics (mass_delta, charge_delta, etc)
         - clinical (significance, disease) OR functional (function)
         - organism
+        - consequence, hgvs_p (optional, VCF variants)
+        profile (optional): whole-protein profile from ProteinProfiler
         """
         report_parts = []
         
@@ -29,6 +44,11 @@ class NarrativeComposer:
             report_parts.append(f"**Biological Function:** {func_summary}")
         
         # 2. THE BIOPHYSICS (The "Why")
+        consequence_text = NarrativeComposer.CONSEQUENCES.get(context.get('consequence'))
+        if consequence_text:
+            change = f" ({context['hgvs_p']})" if context.get('hgvs_p') else ""
+            report_parts.append(f"\n\n**Molecular Mechanism{change}:** {consequence_text}")
+
         if bio and bio.get('old_aa_name'):
             old_aa = bio.get('old_aa_name', 'Unknown')
             new_aa = bio.get('new_aa_name', 'Unknown')
@@ -53,4 +73,17 @@ class NarrativeComposer:
             elif hydro_delta < -2.0:
                 report_parts.append("A hydrophobic core residue is replaced by a water-loving one, which is a strong driver of protein unfolding.")
 
+        # 3. THE WHOLE PROTEIN (Physicochemical Profile)
+        if profile:
+            character = "hydrophobic" if profile['gravy'] > 0 else "hydrophilic"
+            report_parts.append(
+                f"\n\n**Protein Profile:** The translated protein is {profile['length']} residues long "
+                f"(~{profile['molecular_weight'] / 1000:.1f} kDa), {character} overall (GRAVY {profile['gravy']}), "
+                f"with an estimated isoelectric point of {profile['isoelectric_point']}."
+            )
+
+            # Hydrophobic stretches: a 19-residue window above 1.6 is the classic membrane-helix signal
+            if profile['window'] >= 19 and profile['hydropathy'] and max(profile['hydropathy']) > 1.6:
+                report_parts.append("It contains a strongly hydrophobic stretch, a possible transmembrane segment.")
+
         return " ".join(report_parts)
\ No newline at end of file
@@ -0,0 +1,112 @@
+import numpy as np
+from .biophysics import BiophysicalEngine
+
+# Water lost per peptide bond (Da). AMINO_ACIDS holds free amino acid masses.
+WATER_MASS = 18.02
+
+# pKa values used for the isoelectric point (EMBOSS set).
+# Positive groups gain charge below their pKa, negative groups above it.
+PKA_POSITIVE = {'N_TERM': 8.6, 'K': 10.8, 'R': 12.5, 'H': 6.5}
+PKA_NEGATIVE = {'C_TERM': 3.6, 'D': 3.9, 'E': 4.1, 'C': 8.5, 'Y': 10.1}
+
+
+class ProteinProfiler:
+    """
+    Whole-protein physicochemical profile, built on BiophysicalEngine.AMINO_ACIDS.
+
+    Where BiophysicalEngine compares two residues, this describes the entire chain:
+      - sliding-window profiles (Kyte-Doolittle hydropathy, net charge, mass)
+      - global properties (GRAVY, approximate pI, molecular weight, composition)
+
+    Every window is computed from cumulative sums, so the cost is O(length)
+    whatever the window size. Residues outside the 20-letter alphabet (e.g. 'X'
+    from an ambiguous codon) are left out of the averages.
+    """
+
+    # Per-residue property vectors in BiophysicalEngine.CODES order (+ 0 for INVALID)
+    HYDROPATHY = np.array([aa['hydropathy'] for aa in BiophysicalEngine.AMINO_ACIDS.values()] + [0.0])
+    CHARGE = np.array([aa['charge'] for aa in BiophysicalEngine.AMINO_ACIDS.values()] + [0.0])
+    MASS = np.array([aa['mass'] for aa in BiophysicalEngine.AMINO_ACIDS.values()] + [0.0])
+
+    @staticmethod
+    def profile(protein, window=9):
+        """
+        Input:  "MALWMRLLPLLALLALWGPDPAAA..." and a window size (odd, e.g. 9 or 19)
+        Output: dict of compact lists + scalars (JSON-ready), or None for an empty protein.
+
+        profiles[i] describes residues i .. i+window-1 (length - window + 1 values).
+        """
+        index = BiophysicalEngine._encode(protein)
+        length = int(index.size)
+        if length == 0:
+            return None
+
+        valid = index != BiophysicalEngine.INVALID
+        counts = np.bincount(index, minlength=BiophysicalEngine.INVALID + 1)[:BiophysicalEngine.INVALID]
+        residues = int(counts.sum())
+        if residues == 0:
+            return None
+
+        window = max(1, min(window, length))
+        hydropathy = ProteinProfiler.HYDROPATHY[index]
+        charge = ProteinProfiler.CHARGE[index]
+        mass = ProteinProfiler.MASS[index]
+
+        # Residues per window (windows with unknown letters average over fewer residues)
+        per_window = np.maximum(ProteinProfiler._window_sums(valid.astype(np.float64), window), 1)
+
+        return {
+            "length": length,
+            "window": window,
+            # Mean hydropathy per window: peaks > ~1.6 over 19 residues suggest a membrane helix
+            "hydropathy": ProteinProfiler._compact(ProteinProfiler._window_sums(hydropathy, window) / per_window, 2),
+            # Net charge per window at pH 7.4: clusters of +/- mark binding or interaction surfaces
+            "charge": ProteinProfiler._compact(ProteinProfiler._window_sums(charge, window), 2),
+            # Mean residue mass per window: bulky (aromatic-rich) vs small (G/A/S-rich) stretches
+            "mass": ProteinProfiler._compact(ProteinProfiler._window_sums(mass, window) / per_window, 1),
+
+            # GRAVY: grand average of hydropathy (> 0 hydrophobic, < 0 hydrophilic)
+            "gravy": round(float(hydropathy.sum() / residues), 3),
+            "net_charge": round(float(charge.sum()), 2),
+            "isoelectric_point": ProteinProfiler._isoelectric_point(counts),
+            "molecular_weight": round(float(mass.sum() - WATER_MASS * (residues - 1)), 1),
+            "composition": {
+                code: round(int(count) / residues, 4)
+                for code, count in zip(BiophysicalEngine.CODES, counts) if count
+            },
+        }
+
+    @staticmethod
+    def _window_sums(values, window):
+        """Sum of every run of 'window' consecutive values, via one cumulative sum."""
+        totals = np.concatenate(([0.0], np.cumsum(values)))
+        return totals[window:] - totals[:-window]
+
+    @staticmethod
+    def _compact(values, decimals):
+        """Rounded plain-float list: small in the JSON report, and -0.0 shown as 0.0."""
+        return (np.round(values, decimals) + 0.0).tolist()
+
+    @staticmethod
+    def _isoelectric_point(counts):
+        """
+        pH at which the net charge is zero (Henderson-Hasselbalch), found by bisection.
+        The charge falls monotonically with pH, so 30 halvings of 0-14 are plenty.
+        """
+        by_code = dict(zip(BiophysicalEngine.CODES, counts.tolist()))
+        positive = [(pka, 1 if group == 'N_TERM' else by_code.get(group, 0)) for group, pka in PKA_POSITIVE.items()]
+        negative = [(pka, 1 if group == 'C_TERM' else by_code.get(group, 0)) for group, pka in PKA_NEGATIVE.items()]
+
+        def net_charge(ph):
+            plus = sum(n / (1 + 10 ** (ph - pka)) for pka, n in positive)
+            minus = sum(n / (1 + 10 ** (pka - ph)) for pka, n in negative)
+            return plus - minus
+
+        low, high = 0.0, 14.0
+        for _ in range(30):
+            middle = (low + high) / 2
+            if net_charge(middle) > 0:
+                low = middle
+            else:
+                high = middle
+        return round((low + high) / 2, 2)
@@ -0,0 +1,87 @@
+import time
+import logging
+import redis
+from django.conf import settings
+from .deadline import Deadline
+from .redis_client import get_redis
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+
+# Token bucket, evaluated atomically inside Redis.
+# KEYS[1] = bucket key, ARGV[1] = tokens per second, ARGV[2] = bucket size.
+# Returns 0 if a token was taken, otherwise the microseconds until one is available.
+# Uses the Redis clock, so workers on different hosts agree on "now".
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000000 + tonumber(clock[2])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate / 1000000)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000000 / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+
+class RateLimiter:
+    """
+    Cluster-wide request limiter.
+
+    Every Celery worker (and web process) draws from the same bucket in Redis,
+    so the limit holds for the whole deployment rather than per process.
+    NCBI counts requests per IP across E-utilities and BLAST:
+    3/s without an API key, 10/s with one.
+
+    If Redis is unreachable the limiter fails open: requests go through
+    unthrottled (and NCBI may answer 429, which HttpClient retries with backoff).
+    """
+
+    _script = None
+    _warned_at = 0.0
+
+    @staticmethod
+    def acquire(name, rate, burst=1):
+        """
+        Blocks until a token for bucket 'name' is available. Returns seconds waited.
+        Inside a pipeline stage, raises DeadlineExceeded instead if the wait outlasts its budget.
+        """
+        waited = 0.0
+        while True:
+            try:
+                if RateLimiter._script is None:
+                    RateLimiter._script = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+                wait_us = RateLimiter._script(keys=[f"ratelimit:{name}"], args=[rate, burst])
+            except redis.RedisError as e:
+                # Warn at most once a minute, not on every request.
+                if time.monotonic() - RateLimiter._warned_at > 60:
+                    RateLimiter._warned_at = time.monotonic()
+                    logger.warning(f"Rate limiter unavailable ({e}). Proceeding without throttling.")
+                return waited
+
+            if not wait_us:
+                if waited:
+                    logger.debug(f"Rate limiter '{name}': waited {waited:.2f}s")
+                return waited
+
+            delay = int(wait_us) / 1_000_000
+            # Raises DeadlineExceeded if the analysis can't afford to wait for the token
+            Deadline.sleep(delay)
+            waited += delay
+
+    @staticmethod
+    def ncbi():
+        """Takes one token from the shared NCBI bucket (E-utilities + BLAST)."""
+        return RateLimiter.acquire('ncbi', settings.NCBI_RATE_LIMIT, settings.NCBI_RATE_BURST)
@@ -0,0 +1,27 @@
+import threading
+import redis
+from django.conf import settings
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    """
+    Shared redis-py client for REDIS_URL (the cache database).
+
+    redis-py's connection pool is thread-safe and re-creates its sockets after
+    a fork, so one client per process is enough for every worker thread.
+    Short timeouts: callers treat Redis as optional and must not hang on it.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis.from_url(
+                    settings.REDIS_URL,
+                    socket_connect_timeout=2,
+                    socket_timeout=5,
+                    health_check_interval=30,
+                )
+    return _client
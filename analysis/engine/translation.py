@@ -0,0 +1,187 @@
+import numpy as np
+from Bio.Data.CodonTable import standard_dna_table
+
+
+class TranslationEngine:
+    """
+    Vectorised DNA -> protein translation over the standard codon table.
+
+    DNA is encoded once to small integers (A=0, C=1, G=2, T=3, anything else=4),
+    so a codon is a single index 25*a + 5*b + c into a 125-entry lookup array.
+    Translating a frame is then one reshape + one fancy-index, and the reverse
+    strand is one more lookup on the reversed codes; no per-codon Python at all.
+
+    Codons containing N (or any other ambiguity) translate to 'X', unless every
+    possible base gives the same amino acid (e.g. GCN -> A), as Biopython does.
+    """
+
+    BASES = 'ACGT'
+    UNKNOWN = 4
+    STOP = ord('*')
+    START = ord('M')
+
+    # Built once at import, see _compile below
+    CODON_TABLE = None   # 125 uint8 amino acid letters, indexed by codon code
+    _BYTE_CODE = None    # 256 -> base code (both cases)
+    _COMPLEMENT = None   # base code -> complementary base code
+
+    @staticmethod
+    def encode(dna):
+        """'ACGTN...' (str or bytes) -> uint8 array of base codes."""
+        if isinstance(dna, str):
+            dna = dna.encode('ascii', 'replace')
+        return TranslationEngine._BYTE_CODE[np.frombuffer(dna, dtype=np.uint8)]
+
+    @staticmethod
+    def reverse_complement(codes):
+        """Encoded reverse strand of encoded DNA (N stays N)."""
+        return TranslationEngine._COMPLEMENT[codes[::-1]]
+
+    @staticmethod
+    def translate_codes(codes, frame=0):
+        """Translates one frame of encoded DNA. Returns uint8 letters (trailing partial codon dropped)."""
+        count = (codes.size - frame) // 3
+        if count <= 0:
+            return np.empty(0, dtype=np.uint8)
+        codons = codes[frame:frame + 3 * count].reshape(count, 3).astype(np.intp)
+        return TranslationEngine.CODON_TABLE[codons[:, 0] * 25 + codons[:, 1] * 5 + codons[:, 2]]
+
+    @staticmethod
+    def translate(dna, to_stop=False):
+        """
+        Frame 0 translation, the drop-in for str(Seq(dna).translate(to_stop=...)).
+        """
+        protein = TranslationEngine.translate_codes(TranslationEngine.encode(dna))
+        if to_stop:
+            stops = np.flatnonzero(protein == TranslationEngine.STOP)
+            if stops.size:
+                protein = protein[:stops[0]]
+        return protein.tobytes().decode('ascii')
+
+    @staticmethod
+    def six_frames(dna):
+        """
+        All six reading frames as uint8 letter arrays.
+        Returns [(strand, frame, protein)] with strand +1/-1 and frame 0-2,
+        in the order +0, +1, +2, -0, -1, -2.
+        """
+        forward = TranslationEngine.encode(dna)
+        reverse = TranslationEngine.reverse_complement(forward)
+        return [
+            (strand, frame, TranslationEngine.translate_codes(codes, frame))
+            for strand, codes in ((1, forward), (-1, reverse))
+            for frame in range(3)
+        ]
+
+    @staticmethod
+    def find_orfs(dna, min_length=1, limit=None):
+        """
+        Open reading frames (ATG ... stop) on both strands, longest first.
+
+        Per frame, the stop codons split the protein into segments and each ORF
+        runs from the first M of a segment to its end: one flatnonzero for the
+        stops, one for the Ms and one searchsorted to pair them, whatever the
+        length of the input. An ORF that reaches the end of the input without a
+        stop codon is reported with complete=False.
+
+        Returns a list of dicts:
+            strand, frame: +1/-1 and 0-2
+            start, end:    0-based, end-exclusive nucleotide span on the forward
+                           strand (the stop codon is not included)
+            length:        residues
+            complete:      True if a stop codon ends it
+            protein:       the translated ORF
+        """
+        length = len(dna)
+        frames, starts, ends = [], [], []
+        for strand, frame, protein in TranslationEngine.six_frames(dna):
+            stops = np.flatnonzero(protein == TranslationEngine.STOP)
+            segment_starts = np.concatenate(([0], stops + 1))
+            segment_ends = np.append(stops, protein.size)
+
+            # First M at or after each segment start (protein.size as a sentinel for "none left")
+            methionines = np.append(np.flatnonzero(protein == TranslationEngine.START), protein.size)
+            orf_starts = methionines[np.searchsorted(methionines, segment_starts)]
+            keep = (orf_starts < segment_ends) & (segment_ends - orf_starts >= min_length)
+
+            frames.append((strand, frame, protein))
+            starts.append(orf_starts[keep])
+            ends.append(segment_ends[keep])
+
+        # Longest first; ties keep frame order (+0 before the rest). Only the
+        # ORFs that are returned are turned into dicts and protein strings.
+        which = np.concatenate([np.full(s.size, i) for i, s in enumerate(starts)]).astype(np.intp)
+        starts, ends = np.concatenate(starts).astype(np.intp), np.concatenate(ends).astype(np.intp)
+        order = np.argsort(starts - ends, kind='stable')[:limit]
+
+        orfs = []
+        for i, start, end in zip(which[order].tolist(), starts[order].tolist(), ends[order].tolist()):
+            strand, frame, protein = frames[i]
+            nt_start, nt_end = frame + 3 * start, frame + 3 * end
+            if strand < 0:
+                nt_start, nt_end = length - nt_end, length - nt_start
+            orfs.append({
+                "strand": strand,
+                "frame": frame,
+                "start": nt_start,
+                "end": nt_end,
+                "length": end - start,
+                "complete": end < protein.size,
+                "protein": protein[start:end].tobytes().decode('ascii'),
+            })
+        return orfs
+
+    @staticmethod
+    def best_protein(dna, min_length=1):
+        """
+        The protein the rest of the pipeline should work on: the longest ORF over
+        all six frames. Falls back to the old frame-0, translate-to-stop protein
+        when no ORF reaches min_length residues (e.g. a fragment with no ATG).
+
+        Returns (protein, orf) where orf is the find_orfs dict, or None on fallback.
+        """
+        orfs = TranslationEngine.find_orfs(dna, min_length=min_length, limit=1)
+        if orfs:
+            orf = orfs[0]
+            return orf.pop('protein'), orf
+        return TranslationEngine.translate(dna, to_stop=True), None
+
+    @staticmethod
+    def _compile():
+        """Builds the codon lookup array from Biopython's standard table (resolving N where possible)."""
+        forward, stops = standard_dna_table.forward_table, set(standard_dna_table.stop_codons)
+
+        def amino_acid(codon):
+            return '*' if codon in stops else forward[codon]
+
+        table = np.full(125, ord('X'), dtype=np.uint8)
+        for a in range(5):
+            for b in range(5):
+                for c in range(5):
+                    # Every concrete codon this (possibly ambiguous) codon could be
+                    options = {
+                        amino_acid(x + y + z)
+                        for x in (TranslationEngine.BASES if a == 4 else TranslationEngine.BASES[a])
+                        for y in (TranslationEngine.BASES if b == 4 else TranslationEngine.BASES[b])
+                        for z in (TranslationEngine.BASES if c == 4 else TranslationEngine.BASES[c])
+                    }
+                    if len(options) == 1:
+                        table[a * 25 + b * 5 + c] = ord(options.pop())
+
+        byte_code = np.full(256, TranslationEngine.UNKNOWN, dtype=np.uint8)
+        for code, base in enumerate(TranslationEngine.BASES):
+            byte_code[ord(base)] = code
+            byte_code[ord(base.lower())] = code
+        byte_code[ord('U')] = byte_code[ord('u')] = 3
+
+        complement = np.array([3, 2, 1, 0, TranslationEngine.UNKNOWN], dtype=np.uint8)
+
+        for array in (table, byte_code, complement):
+            array.flags.writeable = False
+
+        TranslationEngine.CODON_TABLE = table
+        TranslationEngine._BYTE_CODE = byte_code
+        TranslationEngine._COMPLEMENT = complement
+
+
+TranslationEngine._compile()
@@ -0,0 +1,32 @@
+import json
+from importlib import import_module
+from django.core.management.base import BaseCommand, CommandError
+from analysis.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = "Runs an offline benchmark suite and prints (or writes) its results as JSON."
+
+    def add_arguments(self, parser):
+        suites = parser.add_subparsers(dest='suite', required=True)
+        for name, module_path in SUITES.items():
+            module = import_module(module_path)
+            subparser = suites.add_parser(name, help=(module.__doc__ or '').strip().splitlines()[0])
+            subparser.add_argument('--output', help="Write the JSON results to this file.")
+            module.add_arguments(subparser)
+
+    def handle(self, *args, **options):
+        module = import_module(SUITES[options['suite']])
+        results = module.run(options)
+
+        payload = json.dumps({'suite': options['suite'], 'results': results}, indent=2)
+        if options.get('output'):
+            with open(options['output'], 'w') as handle:
+                handle.write(payload + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(payload)
+
+        # Suites that compare against a baseline list what got worse
+        if results.get('regressions'):
+            raise CommandError(f"{len(results['regressions'])} regression(s) against the baseline.")
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from config.celery import app
+
+
+class Command(BaseCommand):
+    help = (
+        "Starts a Celery worker for one of the pools in settings.PIPELINE_WORKER_POOLS "
+        "(queues, pool type and concurrency all come from settings)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('pool', help="Pool name, e.g. 'io' or 'cpu'.")
+        parser.add_argument('--loglevel', default='info')
+
+    def handle(self, *args, **options):
+        name = options['pool']
+        pool = settings.PIPELINE_WORKER_POOLS.get(name)
+        if pool is None:
+            raise CommandError(
+                f"Unknown pool '{name}'. Choose from: {', '.join(settings.PIPELINE_WORKER_POOLS)}"
+            )
+
+        app.worker_main([
+            'worker',
+            f"--loglevel={options['loglevel']}",
+            f"--hostname={name}@%h",
+            f"--queues={','.join(pool['queues'])}",
+            f"--pool={pool['pool']}",
+            f"--concurrency={pool['concurrency']}",
+        ])
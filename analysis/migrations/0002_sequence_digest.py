@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisproject',
+            name='sequence_digest',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of input_sequence. Key for the result cache.', max_length=64),
+        ),
+    ]
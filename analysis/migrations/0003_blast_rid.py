@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0002_sequence_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisproject',
+            name='blast_rid',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='analysisproject',
+            name='blast_submitted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
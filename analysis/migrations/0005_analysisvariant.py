@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0004_analysisbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('variant_id', models.CharField(blank=True, help_text='VCF ID column (e.g. rs28934578)', max_length=255)),
+                ('position', models.PositiveIntegerField()),
+                ('ref', models.TextField()),
+                ('alt', models.TextField()),
+                ('consequence', models.CharField(blank=True, choices=[('missense', 'Missense'), ('synonymous', 'Synonymous'), ('nonsense', 'Nonsense (stop gained)'), ('stop_lost', 'Stop lost'), ('start_lost', 'Start lost'), ('frameshift', 'Frameshift'), ('inframe_indel', 'In-frame insertion/deletion'), ('complex', 'Multi-residue change'), ('outside_cds', 'Outside the coding sequence'), ('ref_mismatch', 'REF does not match the reference')], max_length=20)),
+                ('hgvs_c', models.CharField(blank=True, help_text='Coding DNA change, e.g. c.524G>A', max_length=255)),
+                ('hgvs_p', models.CharField(blank=True, help_text='Protein change, e.g. p.Arg175His', max_length=255)),
+                ('protein_position', models.PositiveIntegerField(blank=True, null=True)),
+                ('old_aa', models.CharField(blank=True, max_length=1)),
+                ('new_aa', models.CharField(blank=True, max_length=1)),
+                ('biophysics', models.JSONField(blank=True, null=True)),
+                ('clinical', models.JSONField(blank=True, null=True)),
+                ('narrative', models.TextField(blank=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='analysis.analysisproject')),
+            ],
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-16 21:10
+
+import django.db.models.deletion
+import hashlib
+import zlib
+from Bio.SeqUtils import seq1
+from django.db import migrations, models
+
+
+def _folded_sequence(pdb):
+    """The protein a PDB was predicted from, read off its CA atoms (one per residue)."""
+    residues = []
+    for line in pdb.splitlines():
+        if line.startswith('ATOM') and line[12:16].strip() == 'CA':
+            residues.append(seq1(line[17:20].strip()))
+    return ''.join(residues)
+
+
+def move_pdb_to_store(apps, schema_editor):
+    """
+    Compresses every existing pdb_data into ProteinStructure and points the result at it.
+    Rows are keyed by the sequence recovered from the PDB, so they match future lookups;
+    a PDB with no CA atoms is keyed by a hash of its own text instead.
+    """
+    AnalysisResult = apps.get_model('analysis', 'AnalysisResult')
+    ProteinStructure = apps.get_model('analysis', 'ProteinStructure')
+
+    results = AnalysisResult.objects.exclude(pdb_data__isnull=True).exclude(pdb_data='').only('id', 'pdb_data')
+    for result in results.iterator(chunk_size=200):
+        raw = result.pdb_data.encode('utf-8')
+        protein = _folded_sequence(result.pdb_data)
+        digest = hashlib.sha256(protein.encode('ascii') if protein else raw).hexdigest()
+
+        ProteinStructure.objects.get_or_create(
+            digest=digest,
+            defaults={'length': len(protein), 'pdb_compressed': zlib.compress(raw, 6), 'size': len(raw)}
+        )
+        AnalysisResult.objects.filter(id=result.id).update(structure_id=digest)
+
+
+def restore_pdb_data(apps, schema_editor):
+    AnalysisResult = apps.get_model('analysis', 'AnalysisResult')
+
+    results = AnalysisResult.objects.filter(structure__isnull=False).select_related('structure')
+    for result in results.iterator(chunk_size=200):
+        pdb = zlib.decompress(result.structure.pdb_compressed).decode('utf-8')
+        AnalysisResult.objects.filter(id=result.id).update(pdb_data=pdb)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0005_analysisvariant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProteinStructure',
+            fields=[
+                ('digest', models.CharField(help_text='SHA-256 of the folded protein sequence', max_length=64, primary_key=True, serialize=False)),
+                ('length', models.PositiveIntegerField(help_text='Residues folded')),
+                ('pdb_compressed', models.BinaryField(help_text='zlib-compressed PDB text')),
+                ('size', models.PositiveIntegerField(help_text='Uncompressed PDB size in bytes')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='analysisresult',
+            name='structure',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='results', to='analysis.proteinstructure'),
+        ),
+        migrations.RunPython(move_pdb_to_store, restore_pdb_data),
+        migrations.RemoveField(
+            model_name='analysisresult',
+            name='pdb_data',
+        ),
+    ]
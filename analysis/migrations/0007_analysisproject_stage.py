@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-16 21:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0006_proteinstructure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisproject',
+            name='stage',
+            field=models.CharField(blank=True, help_text="Pipeline stage last started (e.g. 'fold')", max_length=20),
+        ),
+    ]
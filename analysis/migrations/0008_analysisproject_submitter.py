@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0007_analysisproject_stage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisproject',
+            name='submitter',
+            field=models.CharField(blank=True, help_text="'user:<id>' or 'guest:<hashed IP>'. Admission control counts in-flight projects per submitter.", max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='analysisproject',
+            index=models.Index(fields=['submitter', 'status'], name='analysis_project_inflight'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0008_analysisproject_submitter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisresult',
+            name='checkpoint',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='analysisresult',
+            name='gene',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -1,7 +1,25 @@
 import uuid
+import zlib
 from django.db import models
 from django.conf import settings  # Connects Custom User
 
+class AnalysisBatch(models.Model):
+    """
+    A group of projects submitted in one request (POST /api/batch/).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True
+    )
+    size = models.PositiveIntegerField(help_text="Number of projects in the batch")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Batch {self.id} ({self.size} projects)"
+
 class AnalysisProject(models.Model):
     """
     The 'Ticket'. Created immediately when a user uploads data.
@@ -17,6 +35,7 @@ class AnalysisProject(models.Model):
         ('PENDING', 'Pending'),
         ('PROCESSING', 'Processing'),
         ('COMPLETED', 'Completed'),
+        ('PARTIAL', 'Partial'),  # Ran out of time: report without the parts that didn't finish
         ('FAILED', 'Failed'),
     )
 
@@ -33,12 +52,69 @@ class AnalysisProject(models.Model):
     
     input_type = models.CharField(max_length=10, choices=INPUT_TYPES)
     input_sequence = models.TextField(help_text="The cleaned, raw DNA sequence")
+    sequence_digest = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="SHA-256 of input_sequence. Key for the result cache."
+    )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    stage = models.CharField(max_length=20, blank=True, help_text="Pipeline stage last started (e.g. 'fold')")
+
+    submitter = models.CharField(
+        max_length=40,
+        blank=True,
+        help_text="'user:<id>' or 'guest:<hashed IP>'. Admission control counts in-flight projects per submitter."
+    )
+
+    # Set when the project came in through the batch endpoint.
+    batch = models.ForeignKey(
+        AnalysisBatch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='projects'
+    )
+
+    # Non-blocking BLAST: NCBI's request ID, so a rescheduled task can re-check the same job.
+    blast_rid = models.CharField(max_length=64, blank=True)
+    blast_submitted_at = models.DateTimeField(null=True, blank=True)
+
+    # Time budget: set when the pipeline first picks the project up (PIPELINE_DEADLINE).
+    deadline = models.DateTimeField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['submitter', 'status'], name='analysis_project_inflight'),
+        ]
+
     def __str__(self):
         return f"{self.id} - {self.status}"
 
+class ProteinStructure(models.Model):
+    """
+    A predicted 3D structure, stored once per protein sequence.
+    Every result whose protein folds to the same sequence points at the same row.
+    """
+    digest = models.CharField(
+        max_length=64,
+        primary_key=True,
+        help_text="SHA-256 of the folded protein sequence"
+    )
+    length = models.PositiveIntegerField(help_text="Residues folded")
+    pdb_compressed = models.BinaryField(help_text="zlib-compressed PDB text")
+    size = models.PositiveIntegerField(help_text="Uncompressed PDB size in bytes")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def pdb(self):
+        return zlib.decompress(self.pdb_compressed).decode('utf-8')
+
+    def __str__(self):
+        return f"Structure {self.digest[:12]} ({self.length} aa)"
+
 class AnalysisResult(models.Model):
     """
     The 'Outcome'. Populated by the Async Worker.
@@ -50,10 +126,72 @@ class AnalysisResult(models.Model):
     )
     
     organism = models.CharField(max_length=255, blank=True, null=True)
-    pdb_data = models.TextField(blank=True, null=True, help_text="Raw PDB string for 3D rendering")
+    gene = models.CharField(max_length=255, blank=True, null=True)
+    structure = models.ForeignKey(
+        ProteinStructure,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='results'
+    )
     
     # JSONField for "Mad Libs" report and biophysical data
     report = models.JSONField(default=dict, blank=True)
 
+    # Output of every completed pipeline stage, {stage: {"state": ..., "timing": ...}},
+    # so a retried job resumes where it stopped. Cleared once the report is saved.
+    checkpoint = models.JSONField(null=True, blank=True)
+
+    @property
+    def pdb_data(self):
+        """Raw PDB string for 3D rendering (None if the structure could not be predicted)."""
+        return self.structure.pdb if self.structure_id else None
+
+    def __str__(self):
+        return f"Result for {self.project.id}"
+
+class AnalysisVariant(models.Model):
+    """
+    One ALT allele of an uploaded VCF, applied to the project's reference coding sequence.
+    Created at upload (raw POS/REF/ALT), then filled in by the pipeline.
+    """
+    CONSEQUENCES = (
+        ('missense', 'Missense'),
+        ('synonymous', 'Synonymous'),
+        ('nonsense', 'Nonsense (stop gained)'),
+        ('stop_lost', 'Stop lost'),
+        ('start_lost', 'Start lost'),
+        ('frameshift', 'Frameshift'),
+        ('inframe_indel', 'In-frame insertion/deletion'),
+        ('complex', 'Multi-residue change'),
+        ('outside_cds', 'Outside the coding sequence'),
+        ('ref_mismatch', 'REF does not match the reference'),
+    )
+
+    project = models.ForeignKey(
+        AnalysisProject,
+        on_delete=models.CASCADE,
+        related_name='variants'
+    )
+
+    # As uploaded (POS is 1-based in the reference coding sequence)
+    variant_id = models.CharField(max_length=255, blank=True, help_text="VCF ID column (e.g. rs28934578)")
+    position = models.PositiveIntegerField()
+    ref = models.TextField()
+    alt = models.TextField()
+
+    # Derived by the pipeline
+    consequence = models.CharField(max_length=20, choices=CONSEQUENCES, blank=True)
+    hgvs_c = models.CharField(max_length=255, blank=True, help_text="Coding DNA change, e.g. c.524G>A")
+    hgvs_p = models.CharField(max_length=255, blank=True, help_text="Protein change, e.g. p.Arg175His")
+    protein_position = models.PositiveIntegerField(null=True, blank=True)
+    old_aa = models.CharField(max_length=1, blank=True)
+    new_aa = models.CharField(max_length=1, blank=True)
+
+    # Annotation (same shapes as a single-sequence report)
+    biophysics = models.JSONField(null=True, blank=True)
+    clinical = models.JSONField(null=True, blank=True)
+    narrative = models.TextField(blank=True)
+
     def __str__(self):
-        return f"Result for {self.project.id}"
\ No newline at end of file
+        return f"{self.project_id} {self.position} {self.ref}>{self.alt}"
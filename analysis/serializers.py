@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .validators import validate_file_extension, validate_file_size
+from .validators import validate_fasta_extension, validate_file_extension, validate_file_size
 from .models import AnalysisProject
 
 class AnalysisInputSerializer(serializers.Serializer):
@@ -9,6 +9,8 @@ class AnalysisInputSerializer(serializers.Serializer):
         validators=[validate_file_extension, validate_file_size]
     )
     raw_text = serializers.CharField(required=False)
+    # VCF uploads describe variants; they are applied to this coding sequence
+    reference_sequence = serializers.CharField(required=False)
 
     def validate(self, data):
         """
@@ -23,4 +25,38 @@ class AnalysisInputSerializer(serializers.Serializer):
         if not has_file and not has_text:
             raise serializers.ValidationError("No input data provided.")
 
-        return data
\ No newline at end of file
+        is_vcf = has_file and data['sequence_file'].name.lower().endswith('.vcf')
+        if is_vcf and 'reference_sequence' not in data:
+            raise serializers.ValidationError("A VCF upload needs a reference_sequence (the coding sequence its positions refer to).")
+        if 'reference_sequence' in data and not is_vcf:
+            raise serializers.ValidationError("reference_sequence is only used with a VCF upload.")
+
+        return data
+
+
+class BatchInputSerializer(serializers.Serializer):
+    """
+    POST /api/batch/ accepts EITHER a multi-record FASTA file
+    OR a JSON array of sequences ({"sequences": [...]} or a bare [...]).
+    """
+    sequence_file = serializers.FileField(
+        required=False,
+        validators=[validate_fasta_extension, validate_file_size]
+    )
+    sequences = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        allow_empty=False
+    )
+
+    def validate(self, data):
+        has_file = 'sequence_file' in data
+        has_list = 'sequences' in data
+
+        if has_file and has_list:
+            raise serializers.ValidationError("Please provide either a file OR a list of sequences, not both.")
+
+        if not has_file and not has_list:
+            raise serializers.ValidationError("No input data provided.")
+
+        return data
@@ -0,0 +1,107 @@
+import hashlib
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from analysis.engine.metrics import Metrics
+from analysis.models import AnalysisProject
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """The submission is over budget. Answer 429 and ask the client to come back after 'retry_after' seconds."""
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """
+    Decides whether a submission is accepted, and how urgently its jobs run.
+
+    Admission (checked before anything is stored):
+      1. Broker backlog: messages waiting in the pipeline queues. Batches are refused
+         at ADMISSION_BATCH_QUEUE_DEPTH, single submissions only at ADMISSION_MAX_QUEUE_DEPTH,
+         so interactive users keep getting in while the workers catch up.
+      2. Per-submitter budget: PENDING/PROCESSING projects of this submitter
+         (ADMISSION_USER_MAX_INFLIGHT for accounts, ADMISSION_GUEST_MAX_INFLIGHT per guest IP).
+
+    Fair share (priority of each run_analysis_pipeline message, 0 = first, 9 = last):
+    the more of your jobs are already waiting, the lower the priority of the next one,
+    so a bulk submitter's jobs interleave with everyone else's instead of queueing in front.
+    """
+
+    @staticmethod
+    def submitter(request):
+        """'user:<id>', or 'guest:<hashed IP>' for anonymous requests (raw IPs are not stored)."""
+        if request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+
+        # nginx appends the address it saw; earlier X-Forwarded-For entries come from the client
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        address = forwarded.rsplit(',', 1)[-1].strip() or request.META.get('REMOTE_ADDR', '')
+        return f"guest:{hashlib.sha256(address.encode()).hexdigest()[:32]}"
+
+    @staticmethod
+    def admit(submitter, jobs=1, batch=False):
+        """
+        Raises AdmissionRejected if the submission doesn't fit.
+        Returns the priority of each of its jobs.
+        """
+        in_flight = AdmissionControl.in_flight(submitter)
+        if settings.ADMISSION_ENABLED:
+            AdmissionControl._check_backlog(batch)
+
+            limit = (
+                settings.ADMISSION_USER_MAX_INFLIGHT if submitter.startswith('user:')
+                else settings.ADMISSION_GUEST_MAX_INFLIGHT
+            )
+            if in_flight + jobs > limit:
+                Metrics.increment('admission', outcome='rejected_inflight')
+                raise AdmissionRejected(
+                    f"Too many analyses in progress ({in_flight} running, limit {limit}). "
+                    f"Please wait for some to finish.",
+                    settings.ADMISSION_RETRY_AFTER,
+                )
+
+        Metrics.increment('admission', jobs, outcome='admitted')
+        return AdmissionControl.priorities(in_flight, jobs, batch)
+
+    @staticmethod
+    def in_flight(submitter):
+        """This submitter's unfinished projects (recent ones only: a project stuck by a lost worker stops counting)."""
+        since = timezone.now() - timedelta(seconds=settings.ADMISSION_INFLIGHT_WINDOW)
+        return AnalysisProject.objects.filter(
+            submitter=submitter, status__in=('PENDING', 'PROCESSING'), created_at__gte=since
+        ).count()
+
+    @staticmethod
+    def priorities(in_flight, jobs, batch=False):
+        """
+        One priority per job: every PIPELINE_FAIR_SHARE_STEP jobs a submitter already
+        has waiting push the next one a level down; batches start PIPELINE_BATCH_PRIORITY lower.
+        """
+        base = settings.PIPELINE_BATCH_PRIORITY if batch else 0
+        return [
+            min(9, base + (in_flight + i) // settings.PIPELINE_FAIR_SHARE_STEP)
+            for i in range(jobs)
+        ]
+
+    @staticmethod
+    def _check_backlog(batch):
+        limit = settings.ADMISSION_BATCH_QUEUE_DEPTH if batch else settings.ADMISSION_MAX_QUEUE_DEPTH
+        try:
+            depth = sum(Metrics.queue_depths().values())
+        except Exception as e:
+            # Fail open: a broker we can't read is no reason to turn users away
+            logger.warning(f"Could not read queue depths for admission control: {e}")
+            return
+
+        if depth >= limit:
+            Metrics.increment('admission', outcome='rejected_backlog')
+            raise AdmissionRejected(
+                f"The analysis queue is full ({depth} jobs waiting). Please try again shortly.",
+                settings.ADMISSION_RETRY_AFTER,
+            )
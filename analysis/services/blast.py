@@ -0,0 +1,86 @@
+import io
+import re
+import logging
+from django.conf import settings
+from analysis.engine.http_client import HttpClient
+from analysis.engine.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class BlastPending(Exception):
+    """
+    Raised when a submitted BLAST job is still running at NCBI.
+    The caller should re-check after 'countdown' seconds (e.g. via Celery retry).
+    """
+    def __init__(self, rid, countdown):
+        super().__init__(f"BLAST {rid} still running. Check again in {countdown}s.")
+        self.rid = rid
+        self.countdown = countdown
+
+
+class BlastError(Exception):
+    """NCBI reported the job as FAILED/UNKNOWN, or the reply could not be understood."""
+
+
+class BlastClient:
+    """
+    Non-blocking client for the NCBI BLAST URL API.
+
+    NCBIWWW.qblast() submits and then sleeps inside the process until NCBI is done.
+    Here the two halves are separate calls, so nothing waits in between:
+      1. submit(): CMD=Put -> returns (RID, estimated seconds to completion)
+      2. fetch():  CMD=Get -> returns an XML handle, or None if still WAITING
+    """
+
+    RID_PATTERN = re.compile(r'^\s*RID = (\S+)', re.MULTILINE)
+    RTOE_PATTERN = re.compile(r'^\s*RTOE = (\d+)', re.MULTILINE)
+    STATUS_PATTERN = re.compile(r'Status=(\w+)')
+
+    @staticmethod
+    def submit(sequence, program="blastn", database="nt"):
+        # Not idempotent (each Put starts a new search), so HttpClient never retries it
+        response = HttpClient.post(settings.NCBI_BLAST_URL, data={
+            "CMD": "Put",
+            "PROGRAM": program,
+            "DATABASE": database,
+            "QUERY": sequence,
+            "tool": settings.NCBI_TOOL,
+            "email": settings.NCBI_EMAIL,
+        }, timeout=30, throttle=RateLimiter.ncbi)
+        response.raise_for_status()
+
+        rid = BlastClient.RID_PATTERN.search(response.text)
+        if not rid:
+            raise BlastError("BLAST submission returned no RID.")
+
+        rtoe = BlastClient.RTOE_PATTERN.search(response.text)
+        return rid.group(1), int(rtoe.group(1)) if rtoe else settings.BLAST_POLL_INTERVAL
+
+    @staticmethod
+    def fetch(rid):
+        response = HttpClient.post(settings.NCBI_BLAST_URL, data={
+            "CMD": "Get",
+            "FORMAT_TYPE": "XML",
+            "RID": rid,
+            "tool": settings.NCBI_TOOL,
+            "email": settings.NCBI_EMAIL,
+        }, timeout=30, idempotent=True, throttle=RateLimiter.ncbi)
+        response.raise_for_status()
+        results = response.text
+
+        # NCBI sends a bare "\n\n" page while results are being formatted.
+        if results == "\n\n":
+            return None
+
+        # Finished XML has no Status tag; the in-progress HTML page does.
+        status = BlastClient.STATUS_PATTERN.search(results)
+        if status:
+            state = status.group(1).upper()
+            if state == "WAITING":
+                return None
+            if state != "READY":
+                raise BlastError(f"BLAST {rid} ended with status {state}.")
+            return None  # READY page without XML yet: ask again
+
+        return io.StringIO(results)
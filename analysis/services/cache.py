@@ -0,0 +1,128 @@
+import hashlib
+import logging
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import cache
+from analysis.models import AnalysisProject, AnalysisResult
+from analysis.engine.metrics import Metrics
+from .progress import ProgressChannel
+
+logger = logging.getLogger(__name__)
+
+# Source files whose behaviour shapes a finished report.
+# If any of them change, previously cached reports are no longer trustworthy.
+ANALYSIS_ROOT = Path(__file__).resolve().parent.parent
+FINGERPRINT_SOURCES = (
+    'engine',
+    'services/scanner.py',
+    'services/classifier.py',
+    'services/structure.py',
+    'services/pipeline.py',
+)
+
+
+class ResultCache:
+    """
+    Content-addressed cache of finished analyses.
+
+    Key:   SHA-256 of the sanitized DNA + pipeline version.
+    Value: UUID of a COMPLETED project whose AnalysisResult can be copied.
+
+    Entries expire after RESULT_CACHE_TTL. Eviction under memory pressure is
+    left to Redis (volatile-lru, see docker-compose.yml), which only drops keys
+    that carry a TTL, so the Celery queues are never touched.
+    """
+
+    _fingerprint = None
+
+    @staticmethod
+    def digest(sequence):
+        """SHA-256 hex digest of an already-sanitized DNA string."""
+        return hashlib.sha256(sequence.encode('ascii')).hexdigest()
+
+    @staticmethod
+    def pipeline_version():
+        """
+        PIPELINE_VERSION setting + a hash of the engine source code.
+        Computed once per process.
+        """
+        if ResultCache._fingerprint is None:
+            hasher = hashlib.sha256()
+            for source in FINGERPRINT_SOURCES:
+                path = ANALYSIS_ROOT / source
+                files = sorted(path.glob('*.py')) if path.is_dir() else [path]
+                for file in files:
+                    hasher.update(file.read_bytes())
+            ResultCache._fingerprint = hasher.hexdigest()[:12]
+        return f"{settings.PIPELINE_VERSION}-{ResultCache._fingerprint}"
+
+    @staticmethod
+    def _key(digest):
+        return f"result:{ResultCache.pipeline_version()}:{digest}"
+
+    @staticmethod
+    def apply(project):
+        """
+        Looks up a finished analysis for this project's sequence.
+        On a hit, copies it onto the project, marks it COMPLETED and returns True.
+        """
+        # A VCF report depends on the uploaded variants, not just the reference sequence.
+        if not settings.RESULT_CACHE_ENABLED or project.input_type == 'VCF':
+            return False
+
+        digest = project.sequence_digest or ResultCache.digest(project.input_sequence)
+        key = ResultCache._key(digest)
+
+        try:
+            source_id = cache.get(key)
+        except Exception as e:
+            # Cache is an optimisation. If Redis is down, just run the pipeline.
+            logger.warning(f"Result cache unavailable: {e}")
+            return False
+
+        if not source_id or str(source_id) == str(project.id):
+            Metrics.increment('result_cache', outcome='miss')
+            return False
+
+        source = AnalysisResult.objects.filter(
+            project_id=source_id,
+            project__status='COMPLETED'
+        ).first()
+
+        if source is None:
+            # The source project was deleted (or failed later). Drop the stale pointer.
+            cache.delete(key)
+            Metrics.increment('result_cache', outcome='miss')
+            return False
+
+        ResultCache.copy(source, project.id, project.stage)
+        Metrics.increment('result_cache', outcome='hit')
+        logger.info(f"Result cache hit for Project {project.id} (copied from {source_id})")
+        return True
+
+    @staticmethod
+    def copy(source, project_id, stage='', status='COMPLETED'):
+        """Copies a finished AnalysisResult onto another project and gives it the source's status."""
+        AnalysisResult.objects.update_or_create(
+            project_id=project_id,
+            defaults={
+                'organism': source.organism,
+                'gene': source.gene,
+                'report': source.report,
+                'structure_id': source.structure_id,
+            }
+        )
+        AnalysisProject.objects.filter(id=project_id).update(status=status)
+        ProgressChannel.publish(project_id, status, stage, source.organism, source.structure_id)
+
+    @staticmethod
+    def store(project):
+        """Registers a COMPLETED project as the canonical result for its sequence."""
+        if not settings.RESULT_CACHE_ENABLED or project.input_type == 'VCF':
+            return
+
+        digest = project.sequence_digest or ResultCache.digest(project.input_sequence)
+        try:
+            cache.set(ResultCache._key(digest), str(project.id), timeout=settings.RESULT_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not store result in cache: {e}")
@@ -0,0 +1,74 @@
+import logging
+from django.conf import settings
+from django.db import transaction
+from analysis.engine.metrics import Metrics
+from analysis.models import AnalysisResult
+
+logger = logging.getLogger(__name__)
+
+
+class StageCheckpoint:
+    """
+    Per-stage checkpoints of a running analysis, in AnalysisResult.checkpoint:
+
+        {"scan":      {"state": {"organism": ..., "gene": ..., "scan_ok": ...}, "timing": {...}},
+         "translate": {"state": {"protein": ..., "orf": ..., "profile": ...}, "timing": {...}},
+         "annotate":  {"state": {"strategy_result": ...}, ...},
+         "fold":      {"state": {"structure": <structure digest>}, ...}, ...}
+
+    Only the state keys a stage set or replaced are saved (see changes()).
+    With CELERY_TASK_ACKS_LATE a crashed worker's job is delivered again, and a
+    pending BLAST re-runs the task; either way every stage that already completed
+    is restored from here instead of being run (and calling NCBI/UniProt/ESMFold) again.
+    The same holds for a duplicate delivery of a single stage task in distributed mode.
+    """
+
+    @staticmethod
+    def load(project_id, stage):
+        """The saved {"state", "timing"} of this stage, or None if it hasn't completed."""
+        if not settings.PIPELINE_CHECKPOINTS:
+            return None
+        return (
+            AnalysisResult.objects.filter(project_id=project_id)
+            .values_list(f'checkpoint__{stage}', flat=True)
+            .first()
+        )
+
+    @staticmethod
+    def save(project_id, stage, changes, timing):
+        """
+        Records a completed stage.
+        The row is locked for the read-modify-write, so the parallel branches
+        (annotate, fold) don't overwrite each other's checkpoint.
+        """
+        if not settings.PIPELINE_CHECKPOINTS:
+            return
+        try:
+            with transaction.atomic():
+                result, _ = AnalysisResult.objects.select_for_update().get_or_create(project_id=project_id)
+                result.checkpoint = {**(result.checkpoint or {}), stage: {"state": changes, "timing": timing}}
+                result.save(update_fields=['checkpoint'])
+        except Exception as e:
+            # A missing checkpoint only costs a repeat of this stage after a crash
+            logger.warning(f"Could not checkpoint stage '{stage}' of Project {project_id}: {e}")
+
+    @staticmethod
+    def restore(state, stage):
+        """Applies a completed stage's checkpoint to the state. Returns False if there is none."""
+        saved = StageCheckpoint.load(state['project_id'], stage)
+        if saved is None:
+            return False
+
+        logger.info(f"Stage '{stage}' of Project {state['project_id']} already completed. Resuming after it.")
+        state.update(saved['state'])
+        state.setdefault('timings', {})[stage] = saved['timing']
+        Metrics.increment('checkpoint', outcome='resumed', stage=stage)
+        return True
+
+    @staticmethod
+    def changes(before, after):
+        """The state keys a stage set or replaced (stages assign new values, they don't mutate them)."""
+        return {
+            key: value for key, value in after.items()
+            if key != 'timings' and (key not in before or before[key] is not value)
+        }
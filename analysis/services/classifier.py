@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 2-bit nucleotide encoding (A=0, C=1, G=2, T=3). Everything else (N) is 4 = invalid.
+_ENCODE = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate(b'ACGT'):
+    _ENCODE[_base] = _code
+    _ENCODE[_base + 32] = _code  # lowercase
+
+# Label for k-mers shared by several references (Kraken would push these to the LCA).
+AMBIGUOUS = np.uint32(0xFFFFFFFF)
+
+
+def canonical_kmers(sequence, k):
+    """
+    Returns the canonical k-mer codes (uint64) of a DNA string, one per window.
+
+    Canonical = min(forward, reverse complement), so a read matches the reference
+    regardless of strand. Windows containing an N are dropped.
+    """
+    codes = _ENCODE[np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+
+    valid = codes < 4
+    invalid_so_far = np.concatenate(([0], np.cumsum(~valid)))
+    window_ok = (invalid_so_far[k:] - invalid_so_far[:-k]) == 0
+
+    bases = np.where(valid, codes, 0).astype(np.uint64)
+    complement = np.uint64(3) - bases
+
+    forward = np.zeros(n, dtype=np.uint64)
+    reverse = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        # Forward: first base is the most significant digit.
+        forward = (forward << np.uint64(2)) | bases[j:j + n]
+        # Reverse complement: base j of the window lands at digit position j.
+        reverse |= complement[j:j + n] << np.uint64(2 * j)
+
+    return np.minimum(forward, reverse)[window_ok]
+
+
+class KmerClassifier:
+    """
+    Local, Kraken-style organism classifier.
+
+    The index is a directory of NumPy arrays built from a reference multi-FASTA panel:
+      - kmers.npy:     sorted, unique canonical k-mers (uint64)
+      - labels.npy:    reference index for each k-mer (uint32, AMBIGUOUS if shared)
+      - manifest.json: k, build time and the (organism, gene) of every reference
+
+    Every build gets its own subdirectory of KMER_INDEX_DIR; the 'current' symlink
+    points at the live one. Everything stays inside KMER_INDEX_DIR (which may be a
+    mounted volume), and replacing the symlink is atomic.
+
+    Arrays are memory-mapped, so every worker process shares the same pages and
+    a lookup is a binary search per query k-mer (milliseconds).
+    """
+
+    CURRENT = 'current'
+
+    _index = None
+    _index_version = None
+
+    @staticmethod
+    def _index_dir():
+        return Path(settings.KMER_INDEX_DIR)
+
+    @staticmethod
+    def _live_dir():
+        """The directory of the live build, or None if no index has been built."""
+        root = KmerClassifier._index_dir()
+        try:
+            return root / os.readlink(root / KmerClassifier.CURRENT)
+        except FileNotFoundError:
+            pass
+        # Indexes built before builds were versioned sit directly in KMER_INDEX_DIR
+        return root if (root / 'manifest.json').exists() else None
+
+    @staticmethod
+    def load():
+        """
+        Returns the loaded index, or None if no index has been built.
+        Reloads automatically when build_kmer_index swaps in a new build.
+        """
+        index_dir = KmerClassifier._live_dir()
+        if index_dir is None:
+            return None
+        manifest_path = index_dir / 'manifest.json'
+        try:
+            version = (str(index_dir), manifest_path.stat().st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+        if KmerClassifier._index is None or version != KmerClassifier._index_version:
+            manifest = json.loads(manifest_path.read_text())
+            KmerClassifier._index = {
+                'k': manifest['k'],
+                'references': manifest['references'],
+                'kmers': np.load(index_dir / 'kmers.npy', mmap_mode='r'),
+                'labels': np.load(index_dir / 'labels.npy', mmap_mode='r'),
+            }
+            KmerClassifier._index_version = version
+            logger.info(f"Loaded k-mer index ({len(manifest['references'])} references, k={manifest['k']})")
+
+        return KmerClassifier._index
+
+    @staticmethod
+    def classify(sequence):
+        """
+        Input: Clean DNA string.
+        Output: {"organism", "gene", "confidence"} or None if no index / no usable k-mers.
+
+        Confidence is the fraction of the query's k-mers that vote for the winning
+        reference, like Kraken's --confidence.
+        """
+        index = KmerClassifier.load()
+        if index is None:
+            return None
+
+        kmers = index['kmers']
+        query = canonical_kmers(sequence, index['k'])
+        if not query.size or not kmers.size:
+            return None
+
+        positions = np.searchsorted(kmers, query)
+        positions[positions == len(kmers)] = 0
+        found = kmers[positions] == query
+
+        hits = index['labels'][positions[found]]
+        hits = hits[hits != AMBIGUOUS]
+        if not hits.size:
+            return {"organism": None, "gene": None, "confidence": 0.0}
+
+        votes = np.bincount(hits, minlength=len(index['references']))
+        best = int(votes.argmax())
+        reference = index['references'][best]
+
+        return {
+            "organism": reference['organism'],
+            "gene": reference['gene'],
+            "confidence": round(float(votes[best]) / len(query), 3),
+        }
+
+    @staticmethod
+    def build(references, output_dir=None, k=None):
+        """
+        Builds a new index and swaps it into place.
+
+        Args:
+            references: Iterable of (organism, gene, sequence) tuples.
+            output_dir: Target directory (defaults to settings.KMER_INDEX_DIR).
+            k: K-mer length, at most 32 (defaults to settings.KMER_SIZE).
+
+        Returns:
+            dict: The manifest that was written, plus the k-mer count.
+        """
+        k = k or settings.KMER_SIZE
+        if not 0 < k <= 32:
+            raise ValueError("k must be between 1 and 32 to fit a uint64.")
+
+        output_dir = Path(output_dir or settings.KMER_INDEX_DIR)
+        meta = []
+        kmer_chunks = []
+        label_chunks = []
+
+        for label, (organism, gene, sequence) in enumerate(references):
+            kmers = np.unique(canonical_kmers(sequence, k))
+            kmer_chunks.append(kmers)
+            label_chunks.append(np.full(len(kmers), label, dtype=np.uint32))
+            meta.append({'organism': organism, 'gene': gene})
+
+        if not meta:
+            raise ValueError("Reference panel is empty.")
+
+        all_kmers = np.concatenate(kmer_chunks)
+        all_labels = np.concatenate(label_chunks)
+
+        # Sort + collapse. A k-mer seen in more than one reference
+        # carries no information about which one the query came from.
+        unique_kmers, first, counts = np.unique(all_kmers, return_index=True, return_counts=True)
+        unique_labels = all_labels[first]
+        unique_labels[counts > 1] = AMBIGUOUS
+
+        # Write a new build next to the live one, then repoint 'current' at it,
+        # so workers never see a half-built index.
+        output_dir.mkdir(parents=True, exist_ok=True)
+        build_id = f"build-{time.time_ns()}"
+        build_dir = output_dir / build_id
+        build_dir.mkdir()
+
+        np.save(build_dir / 'kmers.npy', unique_kmers)
+        np.save(build_dir / 'labels.npy', unique_labels)
+        manifest = {'k': k, 'built_at': time.time(), 'references': meta}
+        (build_dir / 'manifest.json').write_text(json.dumps(manifest))
+
+        link = output_dir / KmerClassifier.CURRENT
+        staging_link = output_dir / f"{KmerClassifier.CURRENT}.{build_id}"
+        os.symlink(build_id, staging_link)
+        os.replace(staging_link, link)
+
+        # Older builds (workers that still map them keep their pages until they reload)
+        for entry in output_dir.iterdir():
+            if entry.name.startswith('build-') and entry.name != build_id:
+                shutil.rmtree(entry, ignore_errors=True)
+
+        manifest['kmer_count'] = int(len(unique_kmers))
+        return manifest
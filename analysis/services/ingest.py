@@ -1,58 +1,171 @@
-import io
-import re
-from Bio import SeqIO
+from django.conf import settings
 from django.core.exceptions import ValidationError
 
+# Byte-level cleaning tables (applied with bytes.translate, in C, chunk by chunk)
+WHITESPACE = b' \t\r\n\x0b\x0c'
+TO_UPPER = bytes.maketrans(b'acgtn', b'ACGTN')
+DNA_ALPHABET = b'ACGTN'
+
+
 class IngestService:
     @staticmethod
     def process(validated_data):
         """
         Orchestrates the extraction and cleaning of DNA data.
         Returns: A clean, uppercase string of nucleotides.
-        """
-        sequence_data = ""
 
+        Uploads are streamed: the file is read INGEST_CHUNK_SIZE bytes at a time
+        and only the first FASTA record is kept, so memory stays at one chunk
+        plus the sequence itself, whatever the file size.
+        """
         # PATH A: File Upload
         if 'sequence_file' in validated_data:
             uploaded_file = validated_data['sequence_file']
-            
-            # Read the file content. 
-            # Django uploads are bytes, so we decode to string.
-            file_content = uploaded_file.read().decode('utf-8')
-            
+
             if uploaded_file.name.endswith('.fasta'):
-                # Biopython requires a file-like object, so we wrap the string in StringIO
-                string_io = io.StringIO(file_content)
-                # Parse FASTA and grab the first sequence found
-                records = list(SeqIO.parse(string_io, "fasta"))
-                if not records:
+                # Parse FASTA lazily and grab the first sequence found (the rest is never read)
+                first = next(IngestService.iter_fasta_records(uploaded_file), None)
+                if first is None:
                     raise ValidationError("Invalid FASTA format: No sequence found.")
-                sequence_data = str(records[0].seq)
-            else:
-                # Treat .txt or .vcf as raw text for now (parsing VCF is complex, 
-                # we assume simple variant lists or raw extraction for Tier 1)
-                sequence_data = file_content
+                return first[1]
+
+            # VCF: the variants are streamed into the database by VariantService.ingest;
+            # the sequence analysed here is the reference they apply to
+            if uploaded_file.name.lower().endswith('.vcf'):
+                return IngestService._sanitize_and_validate(validated_data['reference_sequence'])
+
+            # Treat .txt as raw text
+            sequence = SequenceBuffer()
+            for chunk in uploaded_file.chunks(settings.INGEST_CHUNK_SIZE):
+                sequence.feed(chunk)
+            return sequence.finish()
 
         # PATH B: Raw Text
         elif 'raw_text' in validated_data:
-            sequence_data = validated_data['raw_text']
+            return IngestService._sanitize_and_validate(validated_data['raw_text'])
+
+        return IngestService._sanitize_and_validate("")
+
+    @staticmethod
+    def process_batch(validated_data):
+        """
+        Batch version of process(): every record, not just the first.
+        Returns: [(name, clean_sequence), ...] (at most MAX_BATCH_SIZE entries).
+        """
+        if 'sequence_file' in validated_data:
+            records = IngestService.iter_fasta_records(validated_data['sequence_file'])
+        else:
+            records = (
+                (f"sequence_{i + 1}", IngestService._sanitize_and_validate(sequence))
+                for i, sequence in enumerate(validated_data.get('sequences', []))
+            )
+
+        batch = []
+        while True:
+            try:
+                record = next(records, None)
+            except ValidationError as e:
+                # Point at the offending record instead of failing the batch anonymously
+                raise ValidationError(f"Sequence {len(batch) + 1}: {e.messages[0]}")
+            if record is None:
+                break
+            if len(batch) >= settings.MAX_BATCH_SIZE:
+                raise ValidationError(f"Too many sequences. A batch holds at most {settings.MAX_BATCH_SIZE}.")
+            batch.append(record)
+
+        if not batch:
+            raise ValidationError("No sequences found.")
+        return batch
+
+    @staticmethod
+    def iter_fasta_records(uploaded_file):
+        """
+        Lazily yields (header, clean_sequence) for every record of a FASTA upload.
+        Reads the file chunk by chunk; a record is validated as it streams in,
+        so garbage fails fast without reading the rest of the file.
+        """
+        return IngestService.iter_fasta_chunks(uploaded_file.chunks(settings.INGEST_CHUNK_SIZE))
+
+    @staticmethod
+    def iter_fasta_chunks(chunks):
+        """
+        FASTA parser over an iterable of byte chunks (any split, even mid-line).
+        Text before the first '>' header is ignored.
+        """
+        header = None        # bytes of the current header line while we're inside it
+        sequence = None      # SequenceBuffer of the current record
+        in_header = False
+        at_line_start = True
+
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            pos, size = 0, len(chunk)
+
+            while pos < size:
+                # 1. Inside a header line: collect up to the newline
+                if in_header:
+                    newline = chunk.find(b'\n', pos)
+                    end = size if newline == -1 else newline
+                    if len(header) < settings.INGEST_MAX_HEADER:
+                        header += chunk[pos:end][:settings.INGEST_MAX_HEADER - len(header)]
+                    if newline == -1:
+                        break
+                    in_header, at_line_start, pos = False, True, newline + 1
+                    continue
+
+                # 2. A '>' at the start of a line opens the next record
+                if at_line_start and chunk[pos:pos + 1] == b'>':
+                    if sequence is not None:
+                        yield IngestService._header_text(header), sequence.finish()
+                    header, sequence = bytearray(), SequenceBuffer()
+                    in_header, pos = True, pos + 1
+                    continue
 
-        # COMMON: Sanitization & Validation
-        return IngestService._sanitize_and_validate(sequence_data)
+                # 3. Sequence data: everything up to the next "\n>" in one slice
+                next_header = chunk.find(b'\n>', pos)
+                end = size if next_header == -1 else next_header + 1
+                if sequence is not None:
+                    sequence.feed(chunk[pos:end])
+                at_line_start = chunk[end - 1:end] == b'\n'
+                pos = end
+
+        if sequence is not None:
+            yield IngestService._header_text(header), sequence.finish()
+
+    @staticmethod
+    def _header_text(header):
+        return bytes(header).decode('utf-8', 'replace').strip()
 
     @staticmethod
     def _sanitize_and_validate(sequence):
         """
         Internal method to clean and check the string.
         """
-        # 1. Remove whitespace, newlines, tabs
-        clean_seq = "".join(sequence.split()).upper()
+        buffer = SequenceBuffer()
+        buffer.feed(sequence.encode('utf-8'))
+        return buffer.finish()
+
+
+class SequenceBuffer:
+    """
+    Accumulates DNA from byte chunks, cleaning each chunk as it arrives:
+      1. Remove whitespace, newlines, tabs; uppercase acgtn (one bytes.translate call)
+      2. Strict check: only A, C, G, T, or N (unknown) allowed
+         (a second translate deletes the alphabet; anything left over is garbage).
+    This prevents SQL injection or processing garbage data.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def feed(self, chunk):
+        clean = chunk.translate(TO_UPPER, WHITESPACE)
+        if clean.translate(None, DNA_ALPHABET):
+            raise ValidationError("Invalid DNA sequence detected. Only A, C, G, T, and N are allowed.")
+        self.data += clean
 
-        # 2. Strict Regex Check: Only A, C, G, T, or N (unknown) allowed.
-        # This prevents SQL injection or processing garbage data.
-        dna_pattern = re.compile(r'^[ACGTN]+$')
-        
-        if not dna_pattern.match(clean_seq):
+    def finish(self):
+        if not self.data:
             raise ValidationError("Invalid DNA sequence detected. Only A, C, G, T, and N are allowed.")
-        
-        return clean_seq
\ No newline at end of file
+        return self.data.decode('ascii')
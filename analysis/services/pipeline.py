@@ -0,0 +1,427 @@
+import functools
+import json
+import logging
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from analysis.engine.router import get_strategy
+# Import UniversalStrategy specifically for the "Normal Gene" override
+from analysis.engine.strategies import UniversalStrategy
+from analysis.engine.narrative import NarrativeComposer
+from analysis.engine.deadline import Deadline, DeadlineExceeded
+from analysis.engine.metrics import Metrics
+from analysis.engine.profile import ProteinProfiler
+from analysis.engine.translation import TranslationEngine
+from analysis.models import AnalysisProject, AnalysisResult
+from .scanner import OrganismScanner
+from .structure import StructureService
+from .cache import ResultCache
+from .checkpoint import StageCheckpoint
+from .variants import VariantService
+from .progress import ProgressChannel, TERMINAL_STATUSES
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def _stage(func=None, *, checkpoint=True, expired=None):
+    """
+    Records the stage on the project (one UPDATE) and announces it before running it.
+    Times it as a 'stage' span and keeps the timing, with the external calls made
+    inside it, in state['timings'] (saved with the report).
+
+    Checkpointed stages run at most once per project: a completed stage's output is
+    saved, and a retried or redelivered job restores it instead (see StageCheckpoint).
+
+    Stages that call out pass expired=: they run within the project's deadline
+    (see Deadline). If a call finds it spent, expired(state) stands in for the
+    stage's output and the stage is listed in state['expired']. Work that needs no
+    call (cache hits, the k-mer index, stored structures) still completes.
+    """
+    if func is None:
+        return functools.partial(_stage, checkpoint=checkpoint, expired=expired)
+
+    @functools.wraps(func)
+    def run(state):
+        name = func.__name__
+        if checkpoint and StageCheckpoint.restore(state, name):
+            return state
+
+        AnalysisProject.objects.filter(id=state['project_id']).update(stage=name)
+        ProgressChannel.publish(state['project_id'], 'PROCESSING', name)
+
+        before = dict(state)
+        with Metrics.collect() as calls:
+            with Metrics.span('stage', stage=name) as span:
+                try:
+                    with Deadline.running(state.get('deadline') if expired else None):
+                        state = func(state)
+                except DeadlineExceeded as e:
+                    logger.warning(f"Project {state['project_id']}: no time left for '{name}' ({e}). Continuing without it.")
+                    span.outcome = 'expired'
+                    state = _expire(state, name, expired)
+                # What the next stage receives (the Celery message in distributed mode)
+                span.size = len(json.dumps(state, default=str))
+        calls.pop('stage', None)
+
+        timing = {"seconds": round(span.seconds, 4), "calls": calls}
+        state.setdefault('timings', {})[name] = timing
+        if checkpoint:
+            StageCheckpoint.save(state['project_id'], name, StageCheckpoint.changes(before, state), timing)
+        return state
+    return run
+
+
+def _expire(state, name, expired):
+    """Stands in for a stage that ran out of time."""
+    state = expired(state)
+    state['complete'] = False
+    state['expired'] = state.get('expired', []) + [name]
+    return state
+
+
+def _no_annotation(note):
+    return {
+        "strategy_used": None,
+        "biophysics": None,
+        "clinical": None,
+        "functional": None,
+        "note": note
+    }
+
+
+def _scan_expired(state):
+    state['organism'] = None
+    state['gene'] = "Unknown Gene"
+    state['scan_ok'] = False
+    return state
+
+
+def _annotate_expired(state):
+    state['strategy_result'] = _no_annotation("Ran out of time before the annotation lookup. Report limited to biophysics.")
+    return state
+
+
+def _fold_expired(state):
+    state['structure'] = None
+    return state
+
+
+def _variants_expired(state):
+    state['variant_summary'] = None
+    return state
+
+
+class AnalysisPipeline:
+    """
+    The stages of an analysis, as plain functions over a JSON-serializable 'state' dict.
+
+    The same stages back both execution modes:
+      - Inline:      run_analysis_pipeline runs them one after another in one task.
+      - Distributed: each stage is its own Celery task on its own queue (see tasks.py).
+
+    State keys: project_id, scan_ok, organism, gene, protein, orf, profile, strategy_result, structure, complete,
+                variant_count, variant_summary (VCF projects), timings, deadline, expired.
+
+    Every stage before persist is checkpointed when it completes, so re-running the
+    pipeline for a project (Celery retry, redelivery after a worker crash) picks up
+    after the last completed stage.
+
+    A project has PIPELINE_DEADLINE seconds from its first start (state['deadline']).
+    The stages that call out (scan, annotate, fold, variants) only get what is left of
+    it; once it is spent they are skipped, and the project ends PARTIAL with whatever
+    is done (e.g. organism and report without a structure) instead of FAILED.
+    """
+
+    @staticmethod
+    def start(project_id):
+        """
+        STEP 0: Result Cache + Single-Flight + bookkeeping.
+        Returns the initial state, or None if the project is already answered.
+        Raises SingleFlightPending while an identical analysis runs under another project.
+        """
+        project = AnalysisProject.objects.get(id=project_id)
+
+        # Redelivered task, or a waiting project the leader has since answered
+        if project.status in TERMINAL_STATUSES:
+            return None
+
+        # The same sequence always yields the same report, so skip every remote call on a hit.
+        if ResultCache.apply(project):
+            logger.info("Pipeline Finished from Result Cache.")
+            return None
+
+        # The same sequence is being analysed right now: wait for that run instead of repeating it.
+        SingleFlight.claim(project)
+
+        # The clock starts at the first run; retries and redeliveries keep the same deadline.
+        if project.deadline is None and settings.PIPELINE_DEADLINE:
+            project.deadline = timezone.now() + timedelta(seconds=settings.PIPELINE_DEADLINE)
+        project.status = 'PROCESSING'
+        project.save(update_fields=['status', 'deadline'])
+
+        variant_count = project.variants.count() if project.input_type == 'VCF' else 0
+        return {
+            "project_id": str(project_id),
+            "complete": True,
+            "variant_count": variant_count,
+            "deadline": project.deadline.timestamp() if project.deadline else None,
+        }
+
+    @staticmethod
+    @_stage(expired=_scan_expired)
+    def scan(state):
+        """STEP 1: Identification (Scanner)."""
+        # We handle cases where Scanner might return a tuple (New) or string (Old)
+        scan_result = OrganismScanner.identify_organism(state['project_id'])
+
+        if isinstance(scan_result, tuple):
+            state['organism'], state['gene'] = scan_result
+        else:
+            state['organism'] = scan_result
+            state['gene'] = "Unknown Gene"
+
+        state['scan_ok'] = isinstance(scan_result, tuple)
+        return state
+
+    @staticmethod
+    @_stage
+    def translate(state):
+        """STEP 2: Translation (DNA -> Protein)."""
+        project = AnalysisProject.objects.only('input_sequence').get(id=state['project_id'])
+
+        if state.get('variant_count'):
+            # A VCF reference is a coding sequence: frame 0, up to the first stop codon
+            state['protein'] = TranslationEngine.translate(project.input_sequence, to_stop=True)
+            state['orf'] = None
+        else:
+            # Anything else: the longest ORF over all six frames (frame 0 if there is none)
+            state['protein'], state['orf'] = TranslationEngine.best_protein(
+                project.input_sequence, min_length=settings.ORF_MIN_LENGTH
+            )
+
+        logger.info(f"Translated DNA to Protein: {state['protein'][:20]}...")
+
+        # Whole-protein physics (hydropathy/charge/mass windows, GRAVY, pI).
+        # Healthy genes have no substitution to compare, so this is their biophysics.
+        state['profile'] = ProteinProfiler.profile(state['protein'], window=settings.PROFILE_WINDOW)
+
+        # VCF: work out what each variant does to this coding sequence
+        if state.get('variant_count'):
+            VariantService.derive(state['project_id'], project.input_sequence)
+        return state
+
+    @staticmethod
+    def _strategy_and_context(state):
+        """STEP 3 + 4: Smart Context Construction and Strategy Selection."""
+        gene_name = state['gene']
+
+        # We explicitly set old_aa/new_aa to None.
+        # This signals to the engine: "This is a healthy gene, not a mutation."
+        context = {
+            "organism": state['organism'],
+            "gene": gene_name,
+            "old_aa": None,
+            "new_aa": None
+        }
+
+        # LOGIC: If we found a specific gene (e.g., "INS") but have no mutation data,
+        # we want to know what the gene DOES (Function), not what disease it causes.
+        # So we override the Router and use the UniversalStrategy (UniProt).
+        if gene_name and gene_name != "Unknown Gene":
+            logger.info(f"Gene '{gene_name}' detected. Switching to UniversalStrategy for Functional Analysis.")
+            strategy = UniversalStrategy()
+        else:
+            # Otherwise, use the Router (Human->ClinVar, Other->UniProt)
+            strategy = get_strategy(state['organism'])  # type: ignore
+
+        return strategy, context
+
+    @staticmethod
+    @_stage(expired=_annotate_expired)
+    def annotate(state):
+        """STEP 5a: Strategy lookup (ClinVar / UniProt / physics only)."""
+        strategy, context = AnalysisPipeline._strategy_and_context(state)
+        state['strategy_result'] = strategy.execute(context)
+        return state
+
+    @staticmethod
+    @_stage(expired=_fold_expired)
+    def fold(state):
+        """STEP 5b: Structure Generation (Using Protein Sequence)."""
+        # Only the store key travels in the state; the PDB itself stays in the structure store.
+        structure = StructureService.get_structure(state['protein'])
+        state['structure'] = structure.digest if structure else None
+        return state
+
+    @staticmethod
+    def annotate_and_fold(state):
+        """
+        STEP 5 (inline mode): Annotation + Structure Generation.
+
+        The strategy lookup (ClinVar/UniProt) and ESMFold don't depend on each other,
+        so run them at the same time: the job waits for the slower one, not the sum.
+        A branch that overruns its timeout is abandoned (its thread finishes in the background),
+        and one that raises is left out: the report is written without it (see merge()).
+        """
+        if not settings.PIPELINE_CONCURRENT_BRANCHES:
+            return AnalysisPipeline.fold(AnalysisPipeline.annotate(state))
+
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pipeline-branch')
+        started_at = time.monotonic()
+        try:
+            # Each branch works on its own copy of the state; merge afterwards.
+            annotate = executor.submit(_in_branch, AnalysisPipeline.annotate, dict(state))
+            fold = executor.submit(_in_branch, AnalysisPipeline.fold, dict(state))
+
+            deadline = state.get('deadline')
+            annotated = _join_branch(annotate, started_at, settings.PIPELINE_ANNOTATE_TIMEOUT, 'annotate', deadline)
+            folded = _join_branch(fold, started_at, settings.PIPELINE_FOLD_TIMEOUT, 'fold', deadline)
+        finally:
+            # Don't block the report on a branch we've given up on.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return AnalysisPipeline.merge(state, annotated, folded)
+
+    @staticmethod
+    def merge(state, annotated, folded):
+        """
+        Joins the two branches. A missing branch (None) means it timed out or failed
+        (counted as expired if the project's deadline has passed by now).
+        """
+        state = dict(state)
+        state['timings'] = dict(state.get('timings', {}))
+        expired = list(state.get('expired', []))
+        for branch in (annotated, folded):
+            if branch is not None:
+                state['timings'].update(branch.get('timings', {}))
+                expired += [name for name in branch.get('expired', []) if name not in expired]
+
+        left = Deadline.left(state.get('deadline'))
+        out_of_time = left is not None and left <= 0
+
+        if annotated is not None:
+            state['strategy_result'] = annotated['strategy_result']
+            state['complete'] = state['complete'] and annotated['complete']
+        else:
+            state['complete'] = False
+            state['strategy_result'] = _no_annotation("Annotation lookup timed out or failed. Report limited to structure.")
+            if out_of_time:
+                expired.append('annotate')
+
+        if folded is not None:
+            state['structure'] = folded['structure']
+            state['complete'] = state['complete'] and folded['complete']
+        else:
+            state['complete'] = False
+            state['structure'] = None
+            if out_of_time:
+                expired.append('fold')
+
+        if expired:
+            state['expired'] = expired
+        return state
+
+    @staticmethod
+    @_stage
+    def narrate(state):
+        """STEP 6: Narrative Generation."""
+        state['report_text'] = NarrativeComposer.generate_report(state['strategy_result'], state.get('profile'))
+        return state
+
+    @staticmethod
+    @_stage(expired=_variants_expired)
+    def variants(state):
+        """STEP 6b (VCF only): Annotate every variant (biophysics, ClinVar, narrative)."""
+        if state.get('variant_count'):
+            state['variant_summary'] = VariantService.annotate(state['project_id'], state['organism'], state['gene'])
+        return state
+
+    @staticmethod
+    @_stage(checkpoint=False)
+    def persist(state):
+        """STEP 7: Save Everything."""
+        project = AnalysisProject.objects.get(id=state['project_id'])
+        result, _ = AnalysisResult.objects.get_or_create(project=project)
+
+        result.organism = state['organism']  # Ensure organism is saved to Result model too
+        result.gene = state['gene']
+        result.report = {
+            "text": state['report_text'],
+            "data": state['strategy_result'],
+            "profile": state.get('profile'),
+            "orf": state.get('orf'),
+            # Stages before persist (persist's own time is only in the metrics)
+            "timings": state.get('timings'),
+            "variants": state.get('variant_summary'),
+            # Stages skipped because the time budget ran out (PARTIAL)
+            "expired": state.get('expired', [])
+        }
+        result.structure_id = state['structure']
+        # The report is saved; a redelivered job stops at start() from here on
+        result.checkpoint = None
+        result.save()
+
+        # Out of time somewhere: the report is all we have, without what didn't finish
+        project.status = 'PARTIAL' if state.get('expired') else 'COMPLETED'
+        project.save(update_fields=['status'])
+        ProgressChannel.publish(project.id, project.status, 'persist', result.organism, result.structure_id)
+
+        # Only cache complete answers. A failed BLAST (None), a timed-out branch or a
+        # missing structure is usually transient and must not be served to the next submitter.
+        if state['scan_ok'] and state['structure'] and state['complete']:
+            ResultCache.store(project)
+        # Projects that submitted the same sequence meanwhile get this result
+        SingleFlight.finish(project, result)
+
+        logger.info("Pipeline Finished Successfully.")
+        return state
+
+    @staticmethod
+    def fail(project_id, error):
+        logger.error(f"Pipeline Failed: {error}")
+        # Use update() to prevent race conditions
+        AnalysisProject.objects.filter(id=project_id).update(status='FAILED')
+        # Nothing resumes a failed project
+        AnalysisResult.objects.filter(project_id=project_id).update(checkpoint=None)
+        ProgressChannel.publish(project_id, 'FAILED')
+        SingleFlight.abandon(project_id)
+
+
+def _in_branch(func, *args):
+    """
+    Runs one pipeline branch inside a worker thread.
+    Django opens a separate DB connection per thread, so close it when the branch ends.
+    """
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+def _join_branch(future, started_at, timeout, name, deadline=None):
+    """
+    Waits for a branch until its own timeout (measured from fan-out), or the
+    project's deadline if that comes first.
+    Returns the branch's state, or None if it overran or raised.
+    """
+    remaining = started_at + timeout - time.monotonic()
+    left = Deadline.left(deadline)
+    cut_by_deadline = left is not None and left < remaining
+    if cut_by_deadline:
+        remaining = left
+    try:
+        return future.result(timeout=max(0.0, remaining))
+    except FutureTimeoutError:
+        if cut_by_deadline:
+            logger.warning(f"Branch '{name}' ran past the project's deadline. Continuing without it.")
+        else:
+            logger.warning(f"Branch '{name}' exceeded its {timeout}s budget. Continuing without it.")
+        return None
+    except Exception as e:
+        # One broken lookup (UniProt/ClinVar, ESMFold) must not sink the other branch's work
+        logger.exception(f"Branch '{name}' failed: {e}. Continuing without it.")
+        return None
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+from django.conf import settings
+from django.urls import reverse
+from redis import asyncio as aioredis
+from analysis.engine.redis_client import get_redis
+from analysis.models import AnalysisProject
+
+logger = logging.getLogger(__name__)
+
+# Statuses that come with a report (PARTIAL: the time budget ran out before every part was done)
+ANSWERED_STATUSES = ('COMPLETED', 'PARTIAL')
+TERMINAL_STATUSES = ANSWERED_STATUSES + ('FAILED',)
+
+# The columns a status payload is built from (no sequence, report or PDB)
+STATUS_FIELDS = ('id', 'status', 'stage', 'result__organism', 'result__structure_id')
+
+
+def status_payload(project_id, status, stage='', organism=None, structure_id=None):
+    """
+    The one shape a project's progress is reported in: GET /api/status/{uuid}/
+    and every event on the push channel. Links appear once the project is answered
+    (COMPLETED or PARTIAL).
+    """
+    completed = status in ANSWERED_STATUSES
+    return {
+        "id": str(project_id),
+        "status": status,
+        "stage": stage,
+        "organism": organism,
+        "report_url": reverse('status-report', args=[project_id]) if completed else None,
+        "structure_url": reverse('structure', args=[structure_id]) if completed and structure_id else None,
+    }
+
+
+def payload_from_row(row):
+    """status_payload for a .values(*STATUS_FIELDS) row."""
+    return status_payload(
+        row['id'], row['status'], row['stage'], row['result__organism'], row['result__structure_id']
+    )
+
+
+class StatusCache:
+    """
+    Write-through cache of status payloads in Redis, so polling clients are
+    answered without touching Postgres.
+
+    Key:   status:<uuid>
+    Value: the JSON status_payload
+
+    Writers: the pipeline writes every change through (see ProgressChannel.publish),
+    and projects are cached as PENDING when they are created.
+    Readers: the status endpoint and the event stream. A miss (evicted, expired,
+    or Redis down) falls back to the database and refills the key with SET NX,
+    so a slow reader can never overwrite a newer state written by a worker.
+
+    Expiry: unfinished projects expire after STATUS_CACHE_TTL_ACTIVE (a worker
+    that died silently can't pin a stale state); finished projects never change
+    again and are kept for STATUS_CACHE_TTL_DONE.
+    """
+
+    @staticmethod
+    def key(project_id):
+        return f"status:{project_id}"
+
+    @staticmethod
+    def ttl(status):
+        return settings.STATUS_CACHE_TTL_DONE if status in TERMINAL_STATUSES else settings.STATUS_CACHE_TTL_ACTIVE
+
+    @staticmethod
+    def get(project_id):
+        """The cached payload, or None on a miss (or if the cache is off or unavailable)."""
+        if not settings.STATUS_CACHE_ENABLED:
+            return None
+        try:
+            cached = get_redis().get(StatusCache.key(project_id))
+        except Exception as e:
+            logger.warning(f"Status cache unavailable: {e}")
+            return None
+        return json.loads(cached) if cached else None
+
+    @staticmethod
+    def fill(payload):
+        """Read-through refill after a database read: only if nothing newer is there."""
+        if not settings.STATUS_CACHE_ENABLED:
+            return
+        try:
+            get_redis().set(
+                StatusCache.key(payload['id']), json.dumps(payload), ex=StatusCache.ttl(payload['status']), nx=True
+            )
+        except Exception as e:
+            logger.warning(f"Could not fill status cache: {e}")
+
+    @staticmethod
+    def put_many(payloads):
+        """Writes payloads through (one round trip), e.g. for freshly created projects."""
+        if not settings.STATUS_CACHE_ENABLED or not payloads:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for payload in payloads:
+                pipe.set(StatusCache.key(payload['id']), json.dumps(payload), ex=StatusCache.ttl(payload['status']))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not write status cache: {e}")
+
+
+class ProgressChannel:
+    """
+    Push delivery of project progress over Redis pub/sub.
+
+    Workers publish a status_payload whenever a stage starts or the project
+    finishes (one PUBLISH, fire-and-forget). The ASGI app subscribes per client
+    and streams the events as Server-Sent Events (GET /api/status/{uuid}/events/),
+    so waiting browsers cost nothing until something actually happens.
+    """
+
+    @staticmethod
+    def channel(project_id):
+        return f"progress:{project_id}"
+
+    @staticmethod
+    def publish(project_id, status, stage='', organism=None, structure_id=None):
+        """
+        Writes the new state through to the StatusCache and publishes it, in one round trip.
+        Call it after the database write. Best-effort: readers fall back to the database.
+        """
+        payload = status_payload(project_id, status, stage, organism, structure_id)
+        data = json.dumps(payload)
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            if settings.STATUS_CACHE_ENABLED:
+                pipe.set(StatusCache.key(project_id), data, ex=StatusCache.ttl(status))
+            pipe.publish(ProgressChannel.channel(project_id), data)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not publish progress for Project {project_id}: {e}")
+
+    @staticmethod
+    async def open(project_id):
+        """
+        Subscribes to the project's channel, then reads its current state
+        (StatusCache first, the database on a miss).
+        Subscribing first means an event published in between is not lost.
+        Returns ((client, pubsub), snapshot), or None if the project does not exist.
+        """
+        client = aioredis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=2)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(ProgressChannel.channel(project_id))
+            cached = await client.get(StatusCache.key(project_id)) if settings.STATUS_CACHE_ENABLED else None
+            if cached:
+                return (client, pubsub), json.loads(cached)
+            row = await AnalysisProject.objects.filter(id=project_id).values(*STATUS_FIELDS).afirst()
+        except BaseException:
+            await ProgressChannel._close(client, pubsub)
+            raise
+
+        if row is None:
+            await ProgressChannel._close(client, pubsub)
+            return None
+        return (client, pubsub), payload_from_row(row)
+
+    @staticmethod
+    async def stream(subscription, snapshot):
+        """
+        Server-Sent Events: the current state, then every event until the project
+        finishes or PROGRESS_STREAM_TIMEOUT passes. A comment line is sent every
+        PROGRESS_HEARTBEAT seconds so proxies keep the connection open.
+        """
+        client, pubsub = subscription
+        try:
+            yield ProgressChannel._event(snapshot)
+            if snapshot['status'] in TERMINAL_STATUSES:
+                return
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + settings.PROGRESS_STREAM_TIMEOUT
+            while loop.time() < deadline:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=settings.PROGRESS_HEARTBEAT
+                )
+                if message is None:
+                    yield b": keepalive\n\n"
+                    continue
+
+                event = json.loads(message['data'])
+                yield ProgressChannel._event(event)
+                if event['status'] in TERMINAL_STATUSES:
+                    return
+        finally:
+            await ProgressChannel._close(client, pubsub)
+
+    @staticmethod
+    def _event(payload):
+        return f"data: {json.dumps(payload)}\n\n".encode('utf-8')
+
+    @staticmethod
+    async def _close(client, pubsub):
+        try:
+            await pubsub.aclose()
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Could not close progress subscription: {e}")
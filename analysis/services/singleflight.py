@@ -0,0 +1,155 @@
+import logging
+import redis
+from django.conf import settings
+from analysis.engine.metrics import Metrics
+from analysis.engine.redis_client import get_redis
+from analysis.models import AnalysisProject
+from .cache import ResultCache
+from .progress import ProgressChannel
+
+logger = logging.getLogger(__name__)
+
+# Stage shown on a project that waits for another project's identical analysis
+WAITING_STAGE = 'waiting'
+
+# KEYS[1] = leader key, KEYS[2] = followers set, ARGV[1] = project id, ARGV[2] = TTL.
+# Returns the leader's project id (ARGV[1] itself if this project leads).
+CLAIM_SCRIPT = """
+local leader = redis.call('GET', KEYS[1])
+if not leader then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    return ARGV[1]
+end
+if leader == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return leader
+end
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return leader
+"""
+
+# Same keys. Ends the flight if ARGV[1] still leads it; returns the followers to hand over.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return {}
+end
+local followers = redis.call('SMEMBERS', KEYS[2])
+redis.call('DEL', KEYS[1], KEYS[2])
+return followers
+"""
+
+
+class SingleFlightPending(Exception):
+    """
+    Raised when an identical analysis is already running under another project (the leader).
+    The caller should check again after 'countdown' seconds (e.g. via Celery retry).
+    """
+    def __init__(self, leader_id, countdown):
+        super().__init__(f"Waiting on Project {leader_id}. Check again in {countdown}s.")
+        self.leader_id = leader_id
+        self.countdown = countdown
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight analyses: one pipeline run per sequence at a time.
+
+    Key:   inflight:<pipeline version>:<sequence digest>  -> leader's project id
+           inflight:<pipeline version>:<sequence digest>:followers  -> waiting project ids
+
+    The first project to claim a digest leads and runs the pipeline; later projects
+    with the same digest join the followers and raise SingleFlightPending.
+      - Leader completes: its result is copied to every follower (finish()).
+      - Leader fails: the claim is released (abandon()). The followers' retries are
+        already scheduled; the first of them to check again leads the next attempt.
+      - Leader disappears (worker killed): the claim expires after SINGLE_FLIGHT_TTL.
+        Followers re-check every SINGLE_FLIGHT_POLL_INTERVAL, so one of them takes over.
+    Claims are re-entrant: a leader whose task is retried (pending BLAST) keeps its
+    claim and refreshes the TTL. If Redis is unavailable every project runs on its own.
+    """
+
+    _claim = None
+    _release = None
+
+    @staticmethod
+    def key(project):
+        """The flight key for this project, or None if it is never coalesced."""
+        # A VCF report depends on the uploaded variants, not just the reference sequence.
+        if not settings.SINGLE_FLIGHT_ENABLED or project.input_type == 'VCF' or not project.sequence_digest:
+            return None
+        return f"inflight:{ResultCache.pipeline_version()}:{project.sequence_digest}"
+
+    @staticmethod
+    def claim(project):
+        """
+        Returns if this project leads (or coalescing is off); otherwise registers it
+        as a follower, marks it as waiting and raises SingleFlightPending.
+        """
+        key = SingleFlight.key(project)
+        if key is None:
+            return
+
+        try:
+            if SingleFlight._claim is None:
+                SingleFlight._claim = get_redis().register_script(CLAIM_SCRIPT)
+            leader = SingleFlight._claim(
+                keys=[key, f"{key}:followers"], args=[str(project.id), settings.SINGLE_FLIGHT_TTL]
+            ).decode()
+        except redis.RedisError as e:
+            logger.warning(f"Single-flight unavailable, running Project {project.id} on its own: {e}")
+            return
+
+        if leader == str(project.id):
+            return
+
+        if project.stage != WAITING_STAGE:
+            logger.info(f"Project {project.id} joins the identical analysis of Project {leader}.")
+            AnalysisProject.objects.filter(id=project.id).update(status='PROCESSING', stage=WAITING_STAGE)
+            ProgressChannel.publish(project.id, 'PROCESSING', WAITING_STAGE)
+            Metrics.increment('single_flight', outcome='follower')
+        raise SingleFlightPending(leader, settings.SINGLE_FLIGHT_POLL_INTERVAL)
+
+    @staticmethod
+    def finish(project, result):
+        """Leader completed (or ended PARTIAL): copies its result to every follower that is still waiting."""
+        followers = SingleFlight._end(project)
+        waiting = AnalysisProject.objects.filter(id__in=followers, status__in=('PENDING', 'PROCESSING'))
+        for follower_id in waiting.values_list('id', flat=True):
+            ResultCache.copy(result, follower_id, WAITING_STAGE, project.status)
+        if followers:
+            logger.info(f"Project {project.id} answered {len(followers)} identical analyses.")
+            Metrics.increment('single_flight', len(followers), outcome='fanned_out')
+
+    @staticmethod
+    def abandon(project_id):
+        """
+        Leader failed: releases the claim so a follower can lead the next attempt.
+        Followers are not re-queued here: each already has a retry scheduled
+        (SingleFlightPending), and a second delivery would run the same project twice.
+        """
+        project = AnalysisProject.objects.only('id', 'input_type', 'sequence_digest').filter(id=project_id).first()
+        if project is None:
+            return
+        followers = SingleFlight._end(project)
+        if followers:
+            logger.warning(
+                f"Project {project_id} failed. {len(followers)} waiting projects retry "
+                f"within {settings.SINGLE_FLIGHT_POLL_INTERVAL}s."
+            )
+
+    @staticmethod
+    def _end(project):
+        """Deletes this leader's claim. Returns the follower ids (empty if it no longer leads)."""
+        key = SingleFlight.key(project)
+        if key is None:
+            return []
+        try:
+            if SingleFlight._release is None:
+                SingleFlight._release = get_redis().register_script(RELEASE_SCRIPT)
+            followers = SingleFlight._release(keys=[key, f"{key}:followers"], args=[str(project.id)])
+        except redis.RedisError as e:
+            # The followers re-check on their own once the claim expires
+            logger.warning(f"Could not release single-flight claim of Project {project.id}: {e}")
+            return []
+        return [follower.decode() for follower in followers]
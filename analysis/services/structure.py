@@ -1,14 +1,73 @@
-import requests
+import hashlib
 import logging
+import zlib
 from django.conf import settings
+from analysis.engine.deadline import DeadlineExceeded
+from analysis.engine.http_client import HttpClient
+from analysis.models import ProteinStructure
 
 logger = logging.getLogger(__name__)
 
+
+class StructureStore:
+    """
+    Content-addressed store of predicted structures (ProteinStructure table).
+
+    Key:   SHA-256 of the protein sequence that was folded.
+    Value: the zlib-compressed PDB text (ESMFold output shrinks ~5-8x).
+
+    ESMFold is deterministic for a given sequence, so different DNA inputs that
+    translate to the same protein share one row and one ESMFold call.
+    """
+
+    @staticmethod
+    def digest(protein):
+        return hashlib.sha256(protein.encode('ascii')).hexdigest()
+
+    @staticmethod
+    def get(protein):
+        return ProteinStructure.objects.filter(digest=StructureStore.digest(protein)).first()
+
+    @staticmethod
+    def put(protein, pdb):
+        """Stores a PDB for this protein (or returns the row another worker stored first)."""
+        raw = pdb.encode('utf-8')
+        structure, _ = ProteinStructure.objects.get_or_create(
+            digest=StructureStore.digest(protein),
+            defaults={
+                'length': len(protein),
+                'pdb_compressed': zlib.compress(raw, settings.STRUCTURE_COMPRESSION_LEVEL),
+                'size': len(raw),
+            }
+        )
+        return structure
+
+
 class StructureService:
     """
     Connects to the ESMFold API (by Meta AI) to predict 3D protein structures.
     """
-    API_URL = "https://api.esmatlas.com/foldSequence/v1/pdb/"
+    # Safety Check: ESMFold has a limit (usually ~400 residues for the public API).
+    MAX_RESIDUES = 400
+
+    @staticmethod
+    def get_structure(sequence):
+        """
+        Input: Amino acid sequence string.
+        Output: ProteinStructure (from the store, or freshly predicted and stored), or None.
+        """
+        # We slice it to ensure we don't crash.
+        if len(sequence) > StructureService.MAX_RESIDUES:
+            logger.warning(f"Sequence too long for ESMFold. Truncating to {StructureService.MAX_RESIDUES} residues.")
+            sequence = sequence[:StructureService.MAX_RESIDUES]
+
+        structure = StructureStore.get(sequence)
+        if structure is not None:
+            logger.info(f"Structure store hit for sequence length {len(sequence)}.")
+            return structure
+
+        pdb = StructureService._fold_remote(sequence)
+        return StructureStore.put(sequence, pdb) if pdb else None
 
     @staticmethod
     def generate_pdb(sequence):
@@ -16,23 +75,24 @@ class StructureService:
         Input: Amino acid sequence string.
         Output: PDB format string (3D coordinates).
         """
-        # Safety Check: ESMFold has a limit (usually ~400 residues for the public API).
-        # We slice it to ensure we don't crash.
-        if len(sequence) > 400:
-            logger.warning("Sequence too long for ESMFold. Truncating to 400 residues.")
-            sequence = sequence[:400]
+        structure = StructureService.get_structure(sequence)
+        return structure.pdb if structure else None
 
+    @staticmethod
+    def _fold_remote(sequence):
         try:
             logger.info(f"Requesting structure for sequence length {len(sequence)}...")
-            response = requests.post(StructureService.API_URL, data=sequence, timeout=30)
-            
+            response = HttpClient.post(settings.ESMFOLD_URL, data=sequence, timeout=30, idempotent=True)
+
             if response.status_code != 200:
                 logger.error(f"ESMFold API Error {response.status_code}: {response.text}")
                 return None
-                
+
             # The API returns the raw PDB text body.
             return response.text
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Structure Generation Failed: {str(e)}")
-            return None
\ No newline at end of file
+            return None
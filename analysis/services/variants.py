@@ -0,0 +1,314 @@
+import logging
+from collections import Counter
+from Bio.SeqUtils import seq3
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from analysis.engine.biophysics import BiophysicalEngine
+from analysis.engine.clients import ClinVarClient
+from analysis.engine.narrative import NarrativeComposer
+from analysis.engine.translation import TranslationEngine
+from analysis.engine.router import get_strategy
+from analysis.engine.strategies import HumanStrategy
+from analysis.models import AnalysisVariant
+from .ingest import DNA_ALPHABET
+
+logger = logging.getLogger(__name__)
+
+# Longest VCF line we accept (a guard against binary junk, not a real VCF limit)
+MAX_LINE = 1024 * 1024
+
+DERIVED_FIELDS = ['consequence', 'hgvs_c', 'hgvs_p', 'protein_position', 'old_aa', 'new_aa']
+ANNOTATION_FIELDS = ['biophysics', 'clinical', 'narrative']
+
+# ClinVar classifications listed as notable ("Pathogenic/Likely pathogenic" is both, see is_pathogenic())
+PATHOGENIC = {'pathogenic', 'likely pathogenic'}
+
+
+class VariantService:
+    """
+    The VCF path: many variants against one reference coding sequence.
+
+    1. ingest():   stream the upload -> AnalysisVariant rows (raw POS/REF/ALT), chunked bulk_create
+    2. derive():   apply each variant to the reference -> consequence, HGVS, old/new amino acid
+    3. annotate(): batched biophysics + batched ClinVar + one narrative per variant
+
+    Every step walks the variants VARIANT_CHUNK_SIZE at a time, so memory stays
+    flat whether the VCF has ten lines or a hundred thousand.
+    POS is read as a 1-based position in the reference coding sequence (c. numbering).
+    """
+
+    @staticmethod
+    def ingest(project, uploaded_file):
+        """Stores every ALT allele of the VCF as an AnalysisVariant. Returns the count."""
+        rows, total = [], 0
+        for line_number, variant_id, position, ref, alt in VariantService.iter_vcf(
+            uploaded_file.chunks(settings.INGEST_CHUNK_SIZE)
+        ):
+            total += 1
+            if total > settings.MAX_VCF_VARIANTS:
+                raise ValidationError(f"Too many variants. A VCF holds at most {settings.MAX_VCF_VARIANTS}.")
+
+            rows.append(AnalysisVariant(project=project, variant_id=variant_id, position=position, ref=ref, alt=alt))
+            if len(rows) >= settings.VARIANT_CHUNK_SIZE:
+                AnalysisVariant.objects.bulk_create(rows)
+                rows = []
+
+        if rows:
+            AnalysisVariant.objects.bulk_create(rows)
+        if total == 0:
+            raise ValidationError("Invalid VCF: No variants found.")
+
+        logger.info(f"Stored {total} variants for Project {project.id}")
+        return total
+
+    @staticmethod
+    def iter_vcf(chunks):
+        """
+        Lazily yields (line_number, id, pos, ref, alt) for every ALT allele.
+        Reads byte chunks and only holds the current partial line between them.
+        Symbolic (<DEL>), breakend and '*' alleles are skipped.
+        """
+        line_number = 0
+        pending = b''
+        for chunk in chunks:
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            if len(pending) > MAX_LINE:
+                raise ValidationError(f"Invalid VCF: line {line_number + len(lines) + 1} is too long.")
+            for line in lines:
+                line_number += 1
+                yield from VariantService._parse_line(line, line_number)
+
+        if pending:
+            yield from VariantService._parse_line(pending, line_number + 1)
+
+    @staticmethod
+    def _parse_line(line, line_number):
+        line = line.rstrip(b'\r')
+        if not line or line.startswith(b'#'):
+            return
+
+        fields = line.split(b'\t')
+        if len(fields) < 5:
+            raise ValidationError(f"Invalid VCF: line {line_number} has fewer than 5 columns.")
+
+        try:
+            position = int(fields[1])
+        except ValueError:
+            raise ValidationError(f"Invalid VCF: line {line_number} has a non-numeric POS.")
+
+        ref = fields[3].upper()
+        if position < 1 or not ref or ref.translate(None, DNA_ALPHABET):
+            raise ValidationError(f"Invalid VCF: line {line_number} has an invalid POS or REF.")
+
+        variant_id = fields[2].decode('utf-8', 'replace')[:255]
+        variant_id = '' if variant_id == '.' else variant_id
+
+        for alt in fields[4].upper().split(b','):
+            if not alt or alt == b'.' or alt.translate(None, DNA_ALPHABET):
+                continue  # symbolic, breakend, '*' or missing allele
+            yield line_number, variant_id, position, ref.decode('ascii'), alt.decode('ascii')
+
+    @staticmethod
+    def derive(project_id, reference):
+        """Fills in consequence / HGVS / amino acids for every variant of the project."""
+        for chunk in VariantService._chunks(project_id):
+            for variant in chunk:
+                for field, value in VariantService.consequence(reference, variant.position, variant.ref, variant.alt).items():
+                    setattr(variant, field, value)
+            AnalysisVariant.objects.bulk_update(chunk, DERIVED_FIELDS)
+
+    @staticmethod
+    def consequence(reference, position, ref, alt):
+        """
+        Applies one REF>ALT at 1-based 'position' to the coding sequence 'reference'.
+        Returns the derived fields (consequence, hgvs_c, hgvs_p, protein_position, old_aa, new_aa).
+        HGVS is written in the simple left-aligned form (no 3' shifting).
+        """
+        result = {field: '' for field in DERIVED_FIELDS}
+        result['protein_position'] = None
+
+        start = position - 1
+        if start + len(ref) > len(reference):
+            result['consequence'] = 'outside_cds'
+            return result
+        if reference[start:start + len(ref)] != ref:
+            result['consequence'] = 'ref_mismatch'
+            return result
+
+        # 1. Trim the bases REF and ALT share (VCF anchors indels on the previous base)
+        shared = 0
+        while shared < min(len(ref), len(alt)) and ref[shared] == alt[shared]:
+            shared += 1
+        ref, alt, start = ref[shared:], alt[shared:], start + shared
+        while ref and alt and ref[-1] == alt[-1]:
+            ref, alt = ref[:-1], alt[:-1]
+
+        if not ref and not alt:
+            # REF == ALT: nothing changes
+            result['consequence'] = 'synonymous'
+            result['hgvs_c'] = f"c.{position}="
+            return result
+
+        # 2. Coding DNA change
+        if len(ref) == 1 and len(alt) == 1:
+            result['hgvs_c'] = f"c.{start + 1}{ref}>{alt}"
+        elif not alt:
+            result['hgvs_c'] = f"c.{start + 1}del" if len(ref) == 1 else f"c.{start + 1}_{start + len(ref)}del"
+        elif not ref:
+            result['hgvs_c'] = f"c.{start}_{start + 1}ins{alt}"
+        else:
+            result['hgvs_c'] = f"c.{start + 1}_{start + len(ref)}delins{alt}"
+
+        # 3. Protein change: translate the affected codons before and after
+        first_codon = start // 3
+        result['protein_position'] = first_codon + 1
+
+        if (len(alt) - len(ref)) % 3:
+            old = TranslationEngine.translate(reference[first_codon * 3:first_codon * 3 + 3])
+            result['consequence'] = 'frameshift'
+            result['hgvs_p'] = f"p.{seq3(old)}{first_codon + 1}fs"
+            return result
+
+        last_codon = (start + max(len(ref), 1) - 1) // 3
+        span_start, span_end = first_codon * 3, (last_codon + 1) * 3
+        old_dna = reference[span_start:span_end]
+        new_dna = reference[span_start:start] + alt + reference[start + len(ref):span_end]
+        old_aas, new_aas = TranslationEngine.translate(old_dna), TranslationEngine.translate(new_dna)
+
+        if len(ref) != len(alt):
+            result['consequence'] = 'inframe_indel'
+            result['hgvs_p'] = VariantService._hgvs_delins(old_aas, new_aas, first_codon + 1)
+            return result
+
+        changed = [i for i, (old, new) in enumerate(zip(old_aas, new_aas)) if old != new]
+        if not changed:
+            result['consequence'] = 'synonymous'
+            result['hgvs_p'] = f"p.{seq3(old_aas[0])}{first_codon + 1}="
+            return result
+        if len(changed) > 1:
+            result['consequence'] = 'complex'
+            result['hgvs_p'] = VariantService._hgvs_delins(old_aas, new_aas, first_codon + 1)
+            return result
+
+        old, new = old_aas[changed[0]], new_aas[changed[0]]
+        aa_position = first_codon + changed[0] + 1
+        result['protein_position'] = aa_position
+        result['old_aa'], result['new_aa'] = old, new
+
+        if aa_position == 1 and old == 'M':
+            result['consequence'], result['hgvs_p'] = 'start_lost', "p.Met1?"
+        elif new == '*':
+            result['consequence'], result['hgvs_p'] = 'nonsense', f"p.{seq3(old)}{aa_position}Ter"
+        elif old == '*':
+            result['consequence'], result['hgvs_p'] = 'stop_lost', f"p.Ter{aa_position}{seq3(new)}ext*?"
+        else:
+            result['consequence'], result['hgvs_p'] = 'missense', f"p.{seq3(old)}{aa_position}{seq3(new)}"
+        return result
+
+    @staticmethod
+    def _hgvs_delins(old_aas, new_aas, first_position):
+        """p.Lys10_Ala12delinsGly style description of a multi-residue change."""
+        span = f"{seq3(old_aas[0])}{first_position}"
+        if len(old_aas) > 1:
+            span += f"_{seq3(old_aas[-1])}{first_position + len(old_aas) - 1}"
+        if not new_aas:
+            return f"p.{span}del"
+        return f"p.{span}delins{seq3(new_aas)}"
+
+    @staticmethod
+    def annotate(project_id, organism, gene):
+        """
+        Annotates every variant of the project. Per chunk:
+          - one calculate_deltas_batch for all missense changes
+          - one ClinVarClient.fetch_variants_batch (human genes only)
+          - one narrative per variant
+        Returns a compact summary for the report.
+        """
+        # ClinVar only knows human variants, and needs the gene to search
+        use_clinvar = isinstance(get_strategy(organism), HumanStrategy) and gene and gene != "Unknown Gene"
+
+        consequences, significances = Counter(), Counter()
+        notable, total = [], 0
+
+        for chunk in VariantService._chunks(project_id):
+            total += len(chunk)
+
+            # 1. Biophysics for every missense change, in one vectorised call
+            physical = [variant for variant in chunk if variant.consequence == 'missense']
+            if physical:
+                deltas = BiophysicalEngine.calculate_deltas_batch(
+                    [variant.old_aa for variant in physical], [variant.new_aa for variant in physical]
+                )
+                for i, variant in enumerate(physical):
+                    variant.biophysics = {
+                        "mass_delta": float(deltas['mass_delta'][i]),
+                        "charge_delta": float(deltas['charge_delta'][i]),
+                        "hydropathy_delta": float(deltas['hydropathy_delta'][i]),
+                        "old_aa_name": deltas['old_aa_name'][i],
+                        "new_aa_name": deltas['new_aa_name'][i],
+                    } if deltas['valid'][i] else None
+
+            # 2. Clinical significance for the whole chunk in a few E-utilities calls
+            clinical = {}
+            if use_clinvar:
+                clinical = ClinVarClient.fetch_variants_batch(
+                    [(gene, variant.hgvs_c) for variant in chunk if variant.hgvs_c]
+                )
+
+            # 3. One narrative per variant
+            for variant in chunk:
+                variant.clinical = clinical.get((gene, variant.hgvs_c)) if variant.hgvs_c else None
+                variant.narrative = NarrativeComposer.generate_report({
+                    "biophysics": variant.biophysics,
+                    "clinical": variant.clinical,
+                    "functional": None,
+                    "consequence": variant.consequence,
+                    "hgvs_p": variant.hgvs_p,
+                })
+
+                consequences[variant.consequence] += 1
+                significance = (variant.clinical or {}).get('significance')
+                if significance:
+                    significances[significance] += 1
+                    if VariantService.is_pathogenic(significance) and len(notable) < settings.VARIANT_NOTABLE_LIMIT:
+                        notable.append({
+                            "id": variant.id,
+                            "hgvs_c": variant.hgvs_c,
+                            "hgvs_p": variant.hgvs_p,
+                            "significance": significance,
+                        })
+
+            AnalysisVariant.objects.bulk_update(chunk, ANNOTATION_FIELDS)
+
+        logger.info(f"Annotated {total} variants for Project {project_id}")
+        return {
+            "total": total,
+            "consequences": dict(consequences),
+            "clinical_significance": dict(significances),
+            "notable": notable,
+        }
+
+    @staticmethod
+    def is_pathogenic(significance):
+        """
+        Exact ClinVar values only: a substring match would also take
+        "Conflicting classifications of pathogenicity".
+        """
+        parts = [part.strip() for part in significance.lower().split('/')]
+        return all(part in PATHOGENIC for part in parts)
+
+    @staticmethod
+    def _chunks(project_id):
+        """Yields the project's variants in id order, VARIANT_CHUNK_SIZE rows at a time (keyset pagination)."""
+        last_id = 0
+        while True:
+            chunk = list(
+                AnalysisVariant.objects
+                .filter(project_id=project_id, id__gt=last_id)
+                .order_by('id')[:settings.VARIANT_CHUNK_SIZE]
+            )
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1].id
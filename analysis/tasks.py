@@ -1,87 +1,116 @@
-from celery import shared_task
+from celery import shared_task, chain, chord
 import logging
-from Bio.Seq import Seq
-from .services.scanner import OrganismScanner
-from .engine.router import get_strategy
-# Import UniversalStrategy specifically for the "Normal Gene" override
-from .engine.strategies import UniversalStrategy 
-from .engine.narrative import NarrativeComposer
-from .services.structure import StructureService
-from .models import AnalysisProject, AnalysisResult
+from django.conf import settings
+from .services.blast import BlastPending
+from .services.pipeline import AnalysisPipeline
+from .services.singleflight import SingleFlightPending
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def run_analysis_pipeline(project_id):
+
+# max_retries=None: retries only re-check a pending BLAST, bounded by BLAST_MAX_WAIT.
+@shared_task(bind=True, max_retries=None)
+def run_analysis_pipeline(self, project_id):
     logger.info(f"Pipeline Started: Project {project_id}")
-    
+
     try:
-        project = AnalysisProject.objects.get(id=project_id)
-        project.status = 'PROCESSING'
-        project.save()
-
-        # STEP 1: Identification (Scanner)
-        # We handle cases where Scanner might return a tuple (New) or string (Old)
-        scan_result = OrganismScanner.identify_organism(project_id)
-        
-        if isinstance(scan_result, tuple):
-            organism, gene_name = scan_result
-        else:
-            organism = scan_result
-            gene_name = "Unknown Gene"
-
-        # STEP 2: Translation (DNA -> Protein)
-        dna_sequence = Seq(project.input_sequence)
-        # Translate to protein, stopping at the first stop codon
-        protein_sequence = str(dna_sequence.translate(to_stop=True))
-        
-        logger.info(f"Translated DNA to Protein: {protein_sequence[:20]}...")
-
-        # STEP 3: Smart Context Construction
-        # We explicitly set old_aa/new_aa to None. 
-        # This signals to the engine: "This is a healthy gene, not a mutation."
-        context = {
-            "organism": organism,
-            "gene": gene_name,
-            "old_aa": None,     
-            "new_aa": None      
-        }
-        
-        # STEP 4: Strategy Selection
-        # LOGIC: If we found a specific gene (e.g., "INS") but have no mutation data,
-        # we want to know what the gene DOES (Function), not what disease it causes.
-        # So we override the Router and use the UniversalStrategy (UniProt).
-        if gene_name and gene_name != "Unknown Gene":
-            logger.info(f"Gene '{gene_name}' detected. Switching to UniversalStrategy for Functional Analysis.")
-            strategy = UniversalStrategy()
-        else:
-            # Otherwise, use the Router (Human->ClinVar, Other->UniProt)
-            strategy = get_strategy(organism) # type: ignore
-
-        strategy_result = strategy.execute(context)
-        
-        # STEP 5: Structure Generation (Using Protein Sequence)
-        pdb_data = StructureService.generate_pdb(protein_sequence)
-
-        # STEP 6: Narrative Generation
-        final_report_text = NarrativeComposer.generate_report(strategy_result)
-
-        # STEP 7: Save Everything
-        result, _ = AnalysisResult.objects.get_or_create(project=project)
-        
-        result.organism = organism # Ensure organism is saved to Result model too
-        result.report = {
-            "text": final_report_text,
-            "data": strategy_result
-        }
-        result.pdb_data = pdb_data
-        result.save()
-        
-        project.status = 'COMPLETED'
-        project.save()
-        logger.info("Pipeline Finished Successfully.")
+        state = AnalysisPipeline.start(project_id)
+        if state is None:
+            return
+
+        if settings.PIPELINE_DISTRIBUTED:
+            # Hand the stages to their own queues and free this worker slot immediately.
+            # Stage messages keep the priority this job was admitted with (see AdmissionControl)
+            pipeline_canvas(state, (self.request.delivery_info or {}).get('priority')).apply_async()
+            return
+
+        state = AnalysisPipeline.scan(state)
+        state = AnalysisPipeline.translate(state)
+        # Independent network calls, fanned out in parallel and joined here.
+        state = AnalysisPipeline.annotate_and_fold(state)
+        state = AnalysisPipeline.narrate(state)
+        state = AnalysisPipeline.variants(state)
+        AnalysisPipeline.persist(state)
 
+    except (BlastPending, SingleFlightPending) as e:
+        # NCBI (or the identical analysis we wait on) is still working.
+        # Come back later instead of holding this worker slot.
+        # (Everything before the scan is cheap, so simply re-running the task is fine.)
+        raise self.retry(countdown=e.countdown)
     except Exception as e:
-        logger.error(f"Pipeline Failed: {e}")
-        # Use update() to prevent race conditions
-        AnalysisProject.objects.filter(id=project_id).update(status='FAILED')
\ No newline at end of file
+        AnalysisPipeline.fail(project_id, e)
+
+
+def pipeline_canvas(state, priority=None):
+    """
+    Distributed mode:
+        scan -> translate -> (annotate | fold) -> narrate -> variants -> persist
+
+    annotate and fold run as a chord header on the I/O queues; narrate is the
+    chord body, so it receives both branch states and joins them.
+    Queue routing lives in settings.CELERY_TASK_ROUTES; every stage message
+    carries the job's priority.
+    """
+    options = {} if priority is None else {'priority': priority}
+    return chain(
+        scan_stage.s(state).set(**options),
+        translate_stage.s().set(**options),
+        chord(
+            [annotate_stage.s().set(**options), fold_stage.s().set(**options)],
+            narrate_stage.s().set(**options),
+        ),
+        variants_stage.s().set(**options),
+        persist_stage.s().set(**options),
+    )
+
+
+def _run_stage(task, stage, state):
+    """
+    Runs one stage; on error marks the project FAILED and stops the chain.
+    A pending BLAST reschedules the stage; the rest of the chain waits for it.
+    """
+    try:
+        return stage(state)
+    except BlastPending as e:
+        raise task.retry(countdown=e.countdown)
+    except Exception as e:
+        AnalysisPipeline.fail(state['project_id'], e)
+        raise
+
+
+@shared_task(bind=True, max_retries=None)
+def scan_stage(self, state):
+    return _run_stage(self, AnalysisPipeline.scan, state)
+
+
+@shared_task(bind=True)
+def translate_stage(self, state):
+    return _run_stage(self, AnalysisPipeline.translate, state)
+
+
+@shared_task(bind=True)
+def annotate_stage(self, state):
+    return _run_stage(self, AnalysisPipeline.annotate, state)
+
+
+@shared_task(bind=True)
+def fold_stage(self, state):
+    return _run_stage(self, AnalysisPipeline.fold, state)
+
+
+@shared_task(bind=True)
+def narrate_stage(self, branches):
+    # Chord body: [annotated_state, folded_state] in header order.
+    annotated, folded = branches
+    state = AnalysisPipeline.merge(annotated, annotated, folded)
+    return _run_stage(self, AnalysisPipeline.narrate, state)
+
+
+@shared_task(bind=True)
+def variants_stage(self, state):
+    return _run_stage(self, AnalysisPipeline.variants, state)
+
+
+@shared_task(bind=True)
+def persist_stage(self, state):
+    return _run_stage(self, AnalysisPipeline.persist, state)
@@ -1,3 +1,1376 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+import zlib
+import numpy as np
+import redis
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from Bio.Seq import Seq
+from rest_framework.test import APIClient
+from urllib3 import HTTPResponse
+from analysis.engine.deadline import Deadline, DeadlineExceeded
+from analysis.engine.http_client import HttpClient, _CountingRetry
+from analysis.engine.metrics import Metrics
+from analysis.engine.rate_limit import RateLimiter
+from analysis.engine.translation import TranslationEngine
+from analysis.engine.annotation_cache import AnnotationCache
+from analysis.engine.biophysics import BiophysicalEngine
+from analysis.engine.clients import ClinVarClient
+from analysis.models import AnalysisProject, AnalysisResult, AnalysisVariant, ProteinStructure
+from analysis.services.admission import AdmissionControl
+from analysis.services.blast import BlastClient, BlastError, BlastPending
+from analysis.services.cache import ResultCache
+from analysis.services.classifier import KmerClassifier, canonical_kmers
+from analysis.services.ingest import IngestService, SequenceBuffer
+from analysis.services.pipeline import AnalysisPipeline
+from analysis.services.progress import ProgressChannel, StatusCache, status_payload
+from analysis.services.scanner import OrganismScanner
+from analysis.services.singleflight import WAITING_STAGE, SingleFlight, SingleFlightPending
+from analysis.services.structure import StructureService, StructureStore
+from analysis.tasks import run_analysis_pipeline
+from analysis.services.variants import VariantService
 
-# Create your tests here.
+# ATG GCT TGG AAA TAA -> M A W K *
+CDS = "ATGGCTTGGAAATAA"
+
+# Django cache in process memory instead of Redis
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class VariantConsequenceTests(SimpleTestCase):
+    def test_synonymous(self):
+        result = VariantService.consequence(CDS, 6, 'T', 'C')  # GCT -> GCC, Ala -> Ala
+        self.assertEqual(result['consequence'], 'synonymous')
+        self.assertEqual(result['hgvs_c'], 'c.6T>C')
+        self.assertEqual(result['hgvs_p'], 'p.Ala2=')
+
+    def test_missense(self):
+        result = VariantService.consequence(CDS, 9, 'G', 'T')  # TGG -> TGT, Trp -> Cys
+        self.assertEqual(result['consequence'], 'missense')
+        self.assertEqual(result['hgvs_c'], 'c.9G>T')
+        self.assertEqual(result['hgvs_p'], 'p.Trp3Cys')
+        self.assertEqual((result['old_aa'], result['new_aa'], result['protein_position']), ('W', 'C', 3))
+
+    def test_nonsense(self):
+        result = VariantService.consequence(CDS, 8, 'G', 'A')  # TGG -> TAG
+        self.assertEqual(result['consequence'], 'nonsense')
+        self.assertEqual(result['hgvs_c'], 'c.8G>A')
+        self.assertEqual(result['hgvs_p'], 'p.Trp3Ter')
+
+    def test_stop_lost(self):
+        result = VariantService.consequence(CDS, 13, 'T', 'C')  # TAA -> CAA, Ter -> Gln
+        self.assertEqual(result['consequence'], 'stop_lost')
+        self.assertEqual(result['hgvs_c'], 'c.13T>C')
+        self.assertEqual(result['hgvs_p'], 'p.Ter5Glnext*?')
+
+    def test_change_across_codon_boundary(self):
+        # Last base of codon 2 and first base of codon 3: GCT TGG -> GCC AGG
+        result = VariantService.consequence(CDS, 6, 'TT', 'CA')
+        self.assertEqual(result['hgvs_c'], 'c.6_7delinsCA')
+        # Codon 2 stays Ala, so only codon 3 changes (Trp -> Arg)
+        self.assertEqual(result['consequence'], 'missense')
+        self.assertEqual(result['hgvs_p'], 'p.Trp3Arg')
+        self.assertEqual(result['protein_position'], 3)
+
+    def test_first_base_of_codon(self):
+        result = VariantService.consequence(CDS, 10, 'A', 'G')  # AAA -> GAA, Lys -> Glu
+        self.assertEqual(result['hgvs_p'], 'p.Lys4Glu')
+        self.assertEqual(result['protein_position'], 4)
+
+    def test_indels(self):
+        frameshift = VariantService.consequence(CDS, 4, 'GC', 'G')  # VCF-anchored deletion of c.5
+        self.assertEqual(frameshift['consequence'], 'frameshift')
+        self.assertEqual(frameshift['hgvs_c'], 'c.5del')
+        self.assertEqual(frameshift['hgvs_p'], 'p.Ala2fs')
+
+        inframe = VariantService.consequence(CDS, 6, 'TTGG', 'T')  # deletes codon 3 (TGG)
+        self.assertEqual(inframe['consequence'], 'inframe_indel')
+        self.assertEqual(inframe['hgvs_c'], 'c.7_9del')
+        self.assertEqual(inframe['hgvs_p'], 'p.Trp3del')
+
+    def test_ref_mismatch_and_outside_cds(self):
+        self.assertEqual(VariantService.consequence(CDS, 1, 'C', 'T')['consequence'], 'ref_mismatch')
+        self.assertEqual(VariantService.consequence(CDS, 15, 'AG', 'A')['consequence'], 'outside_cds')
+
+
+class PathogenicTests(SimpleTestCase):
+    def test_exact_clinvar_values(self):
+        for significance in ("Pathogenic", "likely pathogenic", "Pathogenic/Likely pathogenic"):
+            self.assertTrue(VariantService.is_pathogenic(significance), significance)
+        for significance in ("Conflicting classifications of pathogenicity", "Benign", "Uncertain significance",
+                             "Likely pathogenic/Benign"):
+            self.assertFalse(VariantService.is_pathogenic(significance), significance)
+
+
+@override_settings(METRICS_ENABLED=False)
+class VariantAnnotateTests(TestCase):
+    def test_conflicting_variant_is_not_notable(self):
+        project = AnalysisProject.objects.create(input_type='VCF', input_sequence=CDS, status='PROCESSING')
+        AnalysisVariant.objects.bulk_create([
+            AnalysisVariant(project=project, position=position, ref=ref, alt=alt)
+            for position, ref, alt in ((4, 'G', 'C'), (7, 'T', 'C'), (10, 'A', 'G'))
+        ])
+        VariantService.derive(project.id, CDS)
+        significance = {
+            'c.4G>C': "Pathogenic",
+            'c.7T>C': "Conflicting classifications of pathogenicity",
+            'c.10A>G': "Pathogenic/Likely pathogenic",
+        }
+        with mock.patch.object(ClinVarClient, 'fetch_variants_batch', side_effect=lambda queries: {
+            (gene, hgvs): {"significance": significance[hgvs]} for gene, hgvs in queries
+        }):
+            summary = VariantService.annotate(project.id, "Homo sapiens", "INS")
+
+        self.assertEqual(summary['total'], 3)
+        self.assertEqual([variant['hgvs_c'] for variant in summary['notable']], ['c.4G>C', 'c.10A>G'])
+        self.assertEqual(summary['clinical_significance']["Conflicting classifications of pathogenicity"], 1)
+
+
+class IterVcfTests(SimpleTestCase):
+    HEADER = b"##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+
+    def parse(self, *chunks):
+        return list(VariantService.iter_vcf(chunks))
+
+    def test_multi_allelic_line_yields_every_alt(self):
+        variants = self.parse(self.HEADER + b"1\t9\trs1\tg\tT,C,<DEL>,*\t.\t.\t.\n")
+        self.assertEqual(variants, [(3, 'rs1', 9, 'G', 'T'), (3, 'rs1', 9, 'G', 'C')])
+
+    def test_header_only(self):
+        self.assertEqual(self.parse(self.HEADER), [])
+        self.assertEqual(self.parse(b""), [])
+
+    def test_line_split_across_chunks_with_crlf(self):
+        vcf = self.HEADER + b"1\t8\t.\tG\tA\r\n1\t13\trs2\tT\tC"
+        expected = [(3, '', 8, 'G', 'A'), (4, 'rs2', 13, 'T', 'C')]
+        for split in range(1, len(vcf)):
+            self.assertEqual(self.parse(vcf[:split], vcf[split:]), expected)
+
+    def test_malformed_lines(self):
+        for line in (b"1\t8\t.\tG\n", b"1\tabc\t.\tG\tA\n", b"1\t0\t.\tG\tA\n", b"1\t8\t.\tGX\tA\n"):
+            with self.subTest(line=line), self.assertRaises(ValidationError):
+                self.parse(self.HEADER + line)
+
+
+class FastaStreamingTests(SimpleTestCase):
+    FASTA = (
+        b"ignored preamble\n"
+        b">NM_000207.3 Homo sapiens insulin (INS), mRNA\r\n"
+        b"acgtACGT\r\n"
+        b"NNAC\r\n"
+        b">second record\n"
+        b"GGGG\n"
+        b"TTTT"
+    )
+    EXPECTED = [
+        ("NM_000207.3 Homo sapiens insulin (INS), mRNA", "ACGTACGTNNAC"),
+        ("second record", "GGGGTTTT"),
+    ]
+
+    def parse(self, chunks):
+        return list(IngestService.iter_fasta_chunks(chunks))
+
+    def test_whole_text(self):
+        self.assertEqual(self.parse([self.FASTA]), self.EXPECTED)
+
+    def test_every_chunk_boundary(self):
+        # Headers, sequence lines and CRLF pairs split at every possible byte
+        for split in range(1, len(self.FASTA)):
+            with self.subTest(split=split):
+                self.assertEqual(self.parse([self.FASTA[:split], self.FASTA[split:]]), self.EXPECTED)
+
+    def test_tiny_chunks(self):
+        for size in (1, 2, 3, 7):
+            chunks = [self.FASTA[i:i + size] for i in range(0, len(self.FASTA), size)]
+            self.assertEqual(self.parse(chunks), self.EXPECTED)
+
+    def test_text_chunks(self):
+        self.assertEqual(self.parse([self.FASTA.decode()]), self.EXPECTED)
+
+    def test_header_only_record(self):
+        with self.assertRaises(ValidationError):
+            self.parse([b">empty\n>next\nACGT\n"])
+        with self.assertRaises(ValidationError):
+            self.parse([b">empty\r\n"])
+
+    def test_no_record(self):
+        self.assertEqual(self.parse([b""]), [])
+        self.assertEqual(self.parse([b"ACGT\n"]), [])
+
+    def test_invalid_bases(self):
+        with self.assertRaises(ValidationError):
+            self.parse([b">bad\nACGU\n"])
+
+
+class SequenceBufferTests(SimpleTestCase):
+    def test_chunks_equal_whole_text(self):
+        text = b"acg tn\r\nACGT\tN\n"
+        for split in range(1, len(text)):
+            buffer = SequenceBuffer()
+            buffer.feed(text[:split])
+            buffer.feed(text[split:])
+            self.assertEqual(buffer.finish(), "ACGTNACGTN")
+        self.assertEqual(IngestService._sanitize_and_validate(text.decode()), "ACGTNACGTN")
+
+    def test_rejects_garbage_and_empty(self):
+        with self.assertRaises(ValidationError):
+            SequenceBuffer().feed(b"ACGT; DROP TABLE")
+        with self.assertRaises(ValidationError):
+            SequenceBuffer().finish()
+        with self.assertRaises(ValidationError):
+            IngestService._sanitize_and_validate(" \r\n")
+
+
+@override_settings(METRICS_ENABLED=False, PIPELINE_CHECKPOINTS=True, SINGLE_FLIGHT_ENABLED=False)
+class StageCheckpointTests(TestCase):
+    def setUp(self):
+        publish = mock.patch.object(ProgressChannel, 'publish')
+        publish.start()
+        self.addCleanup(publish.stop)
+
+        self.project = AnalysisProject.objects.create(
+            input_type='TEXT', input_sequence="ATG" + "GCT" * 40 + "TAA", status='PROCESSING'
+        )
+        self.state = {"project_id": str(self.project.id), "complete": True, "variant_count": 0, "deadline": None}
+
+    def checkpoint(self):
+        result = AnalysisResult.objects.filter(project=self.project).first()
+        return (result.checkpoint if result else None) or {}
+
+    def test_retry_restores_completed_stages(self):
+        with mock.patch.object(OrganismScanner, 'identify_organism', return_value=("Homo sapiens", "INS")) as scan, \
+             mock.patch.object(TranslationEngine, 'best_protein', wraps=TranslationEngine.best_protein) as translate:
+            first = AnalysisPipeline.translate(AnalysisPipeline.scan(dict(self.state)))
+            # The task is redelivered: the same stages run again from the initial state
+            retried = AnalysisPipeline.translate(AnalysisPipeline.scan(dict(self.state)))
+
+        scan.assert_called_once()
+        translate.assert_called_once()
+        for key in ('organism', 'gene', 'scan_ok', 'protein', 'orf', 'profile', 'timings'):
+            self.assertEqual(retried[key], first[key], key)
+        self.assertEqual(retried['gene'], "INS")
+        self.assertEqual(set(self.checkpoint()), {'scan', 'translate'})
+        self.assertEqual(self.checkpoint()['scan']['state'], {"organism": "Homo sapiens", "gene": "INS", "scan_ok": True})
+
+    def test_failed_stage_leaves_no_checkpoint(self):
+        with mock.patch.object(OrganismScanner, 'identify_organism', side_effect=RuntimeError("worker lost")):
+            with self.assertRaises(RuntimeError):
+                AnalysisPipeline.scan(dict(self.state))
+        self.assertNotIn('scan', self.checkpoint())
+
+        # So the retry runs the stage again
+        with mock.patch.object(OrganismScanner, 'identify_organism', return_value=("Mus musculus", "Ins1")) as scan:
+            state = AnalysisPipeline.scan(dict(self.state))
+        scan.assert_called_once()
+        self.assertEqual(state['organism'], "Mus musculus")
+
+    def test_failed_project_drops_its_checkpoint(self):
+        with mock.patch.object(OrganismScanner, 'identify_organism', return_value=("Homo sapiens", "INS")):
+            AnalysisPipeline.scan(dict(self.state))
+        self.assertIn('scan', self.checkpoint())
+
+        AnalysisPipeline.fail(self.project.id, RuntimeError("ESMFold down"))
+        self.assertEqual(self.checkpoint(), {})
+
+
+@override_settings(
+    METRICS_ENABLED=False, RESULT_CACHE_ENABLED=False, SINGLE_FLIGHT_ENABLED=False,
+    PIPELINE_DISTRIBUTED=False, PIPELINE_CONCURRENT_BRANCHES=False, BLAST_BACKEND='async',
+)
+class DeadlineTests(TestCase):
+    def setUp(self):
+        for target, name in ((ProgressChannel, 'publish'), (RateLimiter, 'ncbi')):
+            patcher = mock.patch.object(target, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(index_dir.cleanup)
+        no_index = override_settings(KMER_INDEX_DIR=index_dir.name)
+        no_index.enable()
+        self.addCleanup(no_index.disable)
+
+    def test_expired_deadline_ends_partial(self):
+        project = AnalysisProject.objects.create(
+            input_type='TEXT', input_sequence="ATG" + "GCT" * 40 + "TAA", status='PENDING',
+            deadline=timezone.now() - timedelta(seconds=1),
+        )
+        # No request may leave: BLAST and ESMFold are skipped before they are sent
+        with mock.patch.object(HttpClient, 'session') as session:
+            run_analysis_pipeline.run(str(project.id))
+        session.assert_not_called()
+
+        project.refresh_from_db()
+        self.assertEqual(project.status, 'PARTIAL')
+        result = AnalysisResult.objects.get(project=project)
+        # Annotation (biophysics only, organism unknown) and the narrative need no call, so they still ran
+        self.assertEqual(result.report['expired'], ['scan', 'fold'])
+        self.assertTrue(result.report['text'])
+        self.assertIsNone(result.structure_id)
+        self.assertIsNone(result.checkpoint)
+
+
+    def test_failed_scan_is_not_announced_as_failed(self):
+        project = AnalysisProject.objects.create(
+            input_type='TEXT', input_sequence="ATG" + "GCT" * 40 + "TAA", status='PENDING',
+        )
+        with mock.patch.object(BlastClient, 'submit', side_effect=BlastError("NCBI down")), \
+                mock.patch.object(StructureService, 'get_structure', return_value=None):
+            run_analysis_pipeline.run(str(project.id))
+
+        project.refresh_from_db()
+        self.assertEqual(project.status, 'COMPLETED')
+        statuses = [call.args[1] for call in ProgressChannel.publish.call_args_list]
+        self.assertNotIn('FAILED', statuses)
+        self.assertEqual(statuses[-1], 'COMPLETED')
+
+
+class FakeFlights:
+    """CLAIM_SCRIPT / RELEASE_SCRIPT over a dict, standing in for SingleFlight's Redis scripts."""
+
+    def __init__(self):
+        self.leaders, self.followers = {}, {}
+
+    def claim(self, keys, args):
+        leader = self.leaders.setdefault(keys[0], args[0])
+        if leader != args[0]:
+            self.followers.setdefault(keys[1], set()).add(args[0])
+        return leader.encode()
+
+    def release(self, keys, args):
+        if self.leaders.get(keys[0]) != args[0]:
+            return []
+        del self.leaders[keys[0]]
+        return [follower.encode() for follower in self.followers.pop(keys[1], ())]
+
+    def expire(self):
+        """The leader's worker died: its claim times out (SINGLE_FLIGHT_TTL)."""
+        self.leaders.clear()
+
+
+@override_settings(METRICS_ENABLED=False, RESULT_CACHE_ENABLED=False, SINGLE_FLIGHT_ENABLED=True)
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        self.flights = FakeFlights()
+        for name, value in (('_claim', self.flights.claim), ('_release', self.flights.release)):
+            patcher = mock.patch.object(SingleFlight, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        publish = mock.patch.object(ProgressChannel, 'publish')
+        publish.start()
+        self.addCleanup(publish.stop)
+
+        self.leader, self.follower = [
+            AnalysisProject.objects.create(
+                input_type='TEXT', input_sequence="ATGGCTTAA", sequence_digest='d' * 64, status='PENDING',
+            )
+            for _ in range(2)
+        ]
+
+    def claim(self, project):
+        SingleFlight.claim(AnalysisProject.objects.get(id=project.id))
+
+    def test_follower_waits_and_retries(self):
+        self.claim(self.leader)
+        for _ in range(2):
+            with self.assertRaises(SingleFlightPending) as pending:
+                self.claim(self.follower)
+            self.assertEqual(pending.exception.leader_id, str(self.leader.id))
+            self.assertEqual(pending.exception.countdown, settings.SINGLE_FLIGHT_POLL_INTERVAL)
+
+        self.follower.refresh_from_db()
+        self.assertEqual((self.follower.status, self.follower.stage), ('PROCESSING', WAITING_STAGE))
+        # Announced once, not on every retry
+        ProgressChannel.publish.assert_called_once_with(self.follower.id, 'PROCESSING', WAITING_STAGE)
+        # The leader's own retries (pending BLAST) keep its claim
+        self.claim(self.leader)
+
+    def test_follower_gets_leader_result(self):
+        self.claim(self.leader)
+        with self.assertRaises(SingleFlightPending):
+            self.claim(self.follower)
+
+        self.leader.status = 'COMPLETED'
+        self.leader.save()
+        result = AnalysisResult.objects.create(project=self.leader, organism="Homo sapiens", report={"text": "INS"})
+        SingleFlight.finish(self.leader, result)
+
+        self.follower.refresh_from_db()
+        self.assertEqual(self.follower.status, 'COMPLETED')
+        self.assertEqual(AnalysisResult.objects.get(project=self.follower).report, {"text": "INS"})
+        # Its scheduled retry finds it answered and stops
+        self.assertIsNone(AnalysisPipeline.start(self.follower.id))
+
+    def test_follower_leads_after_leader_fails(self):
+        self.claim(self.leader)
+        with self.assertRaises(SingleFlightPending):
+            self.claim(self.follower)
+
+        SingleFlight.abandon(self.leader.id)
+
+        self.follower.refresh_from_db()
+        self.assertEqual(self.follower.status, 'PROCESSING')
+        # The follower's next check finds no leader and runs the analysis itself
+        self.claim(self.follower)
+        self.assertEqual(self.flights.leaders, {SingleFlight.key(self.follower): str(self.follower.id)})
+
+    def test_follower_leads_after_claim_expires(self):
+        self.claim(self.leader)
+        with self.assertRaises(SingleFlightPending):
+            self.claim(self.follower)
+
+        self.flights.expire()
+        self.claim(self.follower)
+        # The old leader no longer leads, so finishing hands nothing over
+        self.assertEqual(SingleFlight._end(self.leader), [])
+
+    def test_redis_unavailable_runs_each_project_alone(self):
+        down = mock.Mock(side_effect=redis.ConnectionError("Redis down"))
+        with mock.patch.object(SingleFlight, '_claim', down), mock.patch.object(SingleFlight, '_release', down):
+            self.claim(self.leader)
+            self.claim(self.follower)
+            self.assertEqual(SingleFlight._end(self.leader), [])
+        self.assertEqual(down.call_count, 3)
+
+
+@override_settings(
+    METRICS_ENABLED=False, STATUS_CACHE_ENABLED=False, ADMISSION_ENABLED=True,
+    ADMISSION_MAX_QUEUE_DEPTH=10, ADMISSION_BATCH_QUEUE_DEPTH=5, ADMISSION_RETRY_AFTER=30,
+    ADMISSION_USER_MAX_INFLIGHT=4, ADMISSION_GUEST_MAX_INFLIGHT=2,
+    PIPELINE_FAIR_SHARE_STEP=2, PIPELINE_BATCH_PRIORITY=3,
+)
+class AdmissionTests(TestCase):
+    GUEST = '203.0.113.7'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.depths = {'celery': 0}
+        patchers = (
+            mock.patch.object(Metrics, 'queue_depths', lambda: self.depths),
+            mock.patch.object(run_analysis_pipeline, 'apply_async'),
+            mock.patch('analysis.views.group'),
+        )
+        self.enqueue, self.enqueue_batch = [patcher.start() for patcher in patchers][1:]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def analyze(self, address=GUEST):
+        return self.client.post(
+            '/api/analyze/', {'raw_text': "ATGGCTTAA"}, format='json', secure=True,
+            HTTP_X_FORWARDED_FOR=f"10.9.9.9, {address}",
+        )
+
+    def batch(self, size):
+        return self.client.post(
+            '/api/batch/', ["ATGGCTTAA"] * size, format='json', secure=True, HTTP_X_FORWARDED_FOR=self.GUEST,
+        )
+
+    def in_flight(self, submitter, count):
+        AnalysisProject.objects.bulk_create([
+            AnalysisProject(input_type='TEXT', input_sequence="ATG", submitter=submitter, status='PENDING')
+            for _ in range(count)
+        ])
+
+    def assertRejected(self, response):
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(response.data['retry_after'], 30)
+
+    def test_backlog_refuses_batches_before_interactive(self):
+        self.depths = {'celery': 3, 'io': 4}
+        self.assertRejected(self.batch(1))
+        self.assertEqual(self.analyze().status_code, 201)
+
+        self.depths = {'celery': 10}
+        self.assertRejected(self.analyze())
+        self.enqueue.assert_called_once()
+        self.enqueue_batch.assert_not_called()
+
+    def test_guest_limit_per_forwarded_address(self):
+        # Only nginx's entry counts: the client-supplied one in front of it is ignored
+        self.in_flight(AdmissionControl.submitter(mock.Mock(
+            user=mock.Mock(is_authenticated=False), META={'HTTP_X_FORWARDED_FOR': self.GUEST},
+        )), 2)
+        self.assertRejected(self.analyze())
+        self.assertEqual(self.analyze(address='198.51.100.1').status_code, 201)
+
+    def login(self):
+        user = get_user_model().objects.create_user(email="bulk@example.com", password="x")
+        self.client.force_authenticate(user)
+        return f"user:{user.pk}"
+
+    def test_user_limit(self):
+        self.in_flight(self.login(), 3)
+        # Accounts get their own (larger) budget, not the guest one
+        self.assertEqual(self.analyze().status_code, 201)
+        self.assertRejected(self.batch(1))
+
+    def test_interactive_priority_sinks_with_backlog(self):
+        self.assertEqual(self.analyze().status_code, 201)
+        self.assertEqual(self.enqueue.call_args.kwargs['priority'], 0)
+        self.assertEqual(self.analyze(address='198.51.100.1').status_code, 201)
+
+        self.in_flight(self.login(), 3)
+        self.assertEqual(self.analyze().status_code, 201)
+        # 3 already waiting: one PIPELINE_FAIR_SHARE_STEP (2) down
+        self.assertEqual(self.enqueue.call_args.kwargs['priority'], 1)
+
+    def test_batch_priorities(self):
+        self.login()
+        self.assertEqual(self.batch(3).status_code, 201)
+        # PIPELINE_BATCH_PRIORITY down, and a step lower for every 2 jobs ahead in the same batch
+        [signatures] = self.enqueue_batch.call_args.args
+        self.assertEqual([signature.options['priority'] for signature in signatures], [3, 3, 4])
+
+    def test_disabled_admits_everything(self):
+        self.depths = {'celery': 10_000}
+        with override_settings(ADMISSION_ENABLED=False):
+            self.assertEqual(self.analyze().status_code, 201)
+
+
+@override_settings(METRICS_ENABLED=False, STATUS_CACHE_ENABLED=False, ADMISSION_ENABLED=False, MAX_BATCH_SIZE=3)
+class BatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        patcher = mock.patch('analysis.views.group')
+        self.enqueue = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, data, format='json'):
+        return self.client.post('/api/batch/', data, format=format, secure=True)
+
+    def upload(self, name, content):
+        return self.post({'sequence_file': SimpleUploadedFile(name, content)}, format='multipart')
+
+    def test_json_array(self):
+        response = self.post(["atg gct", "ATGAAA"])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['size'], 2)
+        self.assertEqual([project['name'] for project in response.data['projects']], ['sequence_1', 'sequence_2'])
+        projects = AnalysisProject.objects.filter(batch_id=response.data['id']).order_by('input_sequence')
+        self.assertEqual([(p.input_type, p.input_sequence) for p in projects], [('TEXT', "ATGAAA"), ('TEXT', "ATGGCT")])
+        self.enqueue.return_value.apply_async.assert_called_once_with()
+
+    def test_fasta_upload(self):
+        response = self.upload("genes.fasta", b">ins\nATGGCT\nTAA\n>gcg\nATGAAA\n")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([project['name'] for project in response.data['projects']], ['ins', 'gcg'])
+        self.assertEqual(
+            set(AnalysisProject.objects.values_list('input_type', 'input_sequence')),
+            {('FASTA', "ATGGCTTAA"), ('FASTA', "ATGAAA")},
+        )
+
+    def test_only_fasta_files(self):
+        for name in ("variants.vcf", "genes.txt"):
+            response = self.upload(name, b">ins\nATGGCT\n")
+            self.assertEqual(response.status_code, 400, name)
+            self.assertIn('.fasta', str(response.data['sequence_file'][0]))
+        self.assertFalse(AnalysisProject.objects.exists())
+
+    def test_max_batch_size(self):
+        self.assertEqual(self.post(["ATG"] * 3).status_code, 201)
+        response = self.post(["ATG"] * 4)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("at most 3", response.data['error'])
+        self.assertEqual(AnalysisProject.objects.count(), 3)
+
+    def test_status_aggregate(self):
+        batch_id = self.post(["ATG"] * 3).data['id']
+        first, second, _ = AnalysisProject.objects.filter(batch_id=batch_id)
+        first.status, second.status = 'COMPLETED', 'FAILED'
+        AnalysisProject.objects.bulk_update([first, second], ['status'])
+
+        response = self.client.get(f'/api/batch/{batch_id}/', secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(
+            {code: count for code, count in response.data['counts'].items() if count},
+            {'PENDING': 1, 'COMPLETED': 1, 'FAILED': 1},
+        )
+        self.assertFalse(response.data['finished'])
+
+        AnalysisProject.objects.filter(batch_id=batch_id, status='PENDING').update(status='PARTIAL')
+        self.assertTrue(self.client.get(f'/api/batch/{batch_id}/', secure=True).data['finished'])
+
+        missing = self.client.get(f'/api/batch/{uuid.uuid4()}/', secure=True)
+        self.assertEqual(missing.status_code, 404)
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsBufferTests(SimpleTestCase):
+    def setUp(self):
+        # This process's flusher counts as started: the test flushes by hand
+        for name, value in (('_pending', Counter()), ('_flusher_pid', os.getpid())):
+            patcher = mock.patch.object(Metrics, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_recording_makes_no_redis_call(self):
+        with mock.patch('analysis.engine.metrics.get_redis', side_effect=AssertionError("Redis called")):
+            for _ in range(3):
+                with Metrics.span('http', host='rest.uniprot.org') as span:
+                    span.size = 2_000
+                Metrics.increment('result_cache', outcome='hit')
+
+        client = mock.Mock()
+        with mock.patch('analysis.engine.metrics.get_redis', return_value=client):
+            Metrics._flush()
+            Metrics._flush()  # nothing new: no second round trip
+
+        pipe = client.pipeline.return_value
+        pipe.execute.assert_called_once_with()
+        counts = {call.args[1]: call.args[2] for call in pipe.hincrby.call_args_list}
+        self.assertEqual(counts[Metrics._series('result_cache', {'outcome': 'hit'})], 3)
+        series = Metrics._series('http', {'host': 'rest.uniprot.org', 'outcome': 'ok'})
+        self.assertEqual(counts[f"{series}|bytes|10000"], 3)
+        self.assertEqual(counts[f"{series}|bytes|sum"], 6_000)
+        [seconds] = pipe.hincrbyfloat.call_args_list
+        self.assertEqual(seconds.args[1], f"{series}|seconds|sum")
+
+    def test_failed_flush_keeps_counts(self):
+        Metrics.increment('result_cache', outcome='miss')
+        with mock.patch('analysis.engine.metrics.get_redis', side_effect=redis.ConnectionError("Redis down")):
+            Metrics._flush()
+        self.assertEqual(sum(Metrics._pending.values()), 1)
+
+
+@override_settings(CACHES=LOCAL_CACHE, METRICS_ENABLED=False, RESULT_CACHE_ENABLED=True)
+class ResultCacheTests(TestCase):
+    SEQUENCE = "ATGGCTTGGAAATAA"
+
+    def setUp(self):
+        cache.clear()
+        publish = mock.patch.object(ProgressChannel, 'publish')
+        publish.start()
+        self.addCleanup(publish.stop)
+
+    def project(self, sequence=SEQUENCE, input_type='TEXT', status='PENDING'):
+        return AnalysisProject.objects.create(
+            input_type=input_type, input_sequence=sequence, sequence_digest=ResultCache.digest(sequence), status=status,
+        )
+
+    def finished(self, **kwargs):
+        source = self.project(status='COMPLETED', **kwargs)
+        AnalysisResult.objects.create(project=source, organism="Homo sapiens", gene="INS", report={"text": "Insulin"})
+        ResultCache.store(source)
+        return source
+
+    def test_hit_copies_the_finished_result(self):
+        self.finished()
+        project = self.project()
+
+        self.assertTrue(ResultCache.apply(project))
+        project.refresh_from_db()
+        self.assertEqual(project.status, 'COMPLETED')
+        result = AnalysisResult.objects.get(project=project)
+        self.assertEqual((result.organism, result.gene, result.report), ("Homo sapiens", "INS", {"text": "Insulin"}))
+
+    def test_miss_for_another_sequence(self):
+        self.finished()
+        self.assertFalse(ResultCache.apply(self.project("ATGAAATAA")))
+
+    def test_pipeline_version_change_invalidates(self):
+        self.finished()
+        with override_settings(PIPELINE_VERSION='2'):
+            self.assertFalse(ResultCache.apply(self.project()))
+        # Edited engine code changes the source fingerprint
+        with mock.patch.object(ResultCache, '_fingerprint', 'edited'):
+            self.assertFalse(ResultCache.apply(self.project()))
+        self.assertTrue(ResultCache.apply(self.project()))
+
+    def test_vcf_projects_are_never_cached(self):
+        self.finished(input_type='VCF')
+        self.assertIsNone(cache.get(ResultCache._key(ResultCache.digest(self.SEQUENCE))))
+
+        self.finished()
+        self.assertFalse(ResultCache.apply(self.project(input_type='VCF')))
+
+    def test_stale_pointer_is_dropped(self):
+        self.finished().delete()
+        self.assertFalse(ResultCache.apply(self.project()))
+        self.assertIsNone(cache.get(ResultCache._key(ResultCache.digest(self.SEQUENCE))))
+
+
+class DeadlineSleepTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('analysis.engine.deadline.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_throttle_wait_longer_than_budget_raises(self):
+        with mock.patch.object(RateLimiter, '_script', return_value=5_000_000), \
+                Deadline.running(time.time() + 1), self.assertRaises(DeadlineExceeded):
+            RateLimiter.acquire('test', rate=0.2)
+        self.sleep.assert_not_called()
+
+    def test_throttle_wait_within_budget_sleeps(self):
+        with mock.patch.object(RateLimiter, '_script', side_effect=[500_000, 0]), \
+                Deadline.running(time.time() + 60):
+            self.assertEqual(RateLimiter.acquire('test', rate=2), 0.5)
+        self.sleep.assert_called_once_with(0.5)
+
+    def test_retry_after_longer_than_budget_raises(self):
+        response = HTTPResponse(status=429, headers={'Retry-After': '30'})
+        with Deadline.running(time.time() + 5), self.assertRaises(DeadlineExceeded):
+            _CountingRetry(total=3).sleep(response)
+        self.sleep.assert_not_called()
+
+    def test_no_budget_waits_as_asked(self):
+        _CountingRetry(total=3).sleep(HTTPResponse(status=503, headers={'Retry-After': '30'}))
+        self.sleep.assert_called_once_with(30)
+
+
+class HttpRetryTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(setattr, HttpClient._local, 'idempotent', False)
+        self.addCleanup(setattr, HttpClient._local, 'throttle', None)
+
+    def test_post_retried_only_when_idempotent(self):
+        retry = _CountingRetry(total=3, status_forcelist=(503,))
+        self.assertTrue(retry.is_retry('GET', 503))
+        self.assertFalse(retry.is_retry('POST', 503))
+        HttpClient._local.idempotent = True
+        self.assertTrue(retry.is_retry('POST', 503))
+
+    def test_retry_takes_a_rate_limit_token(self):
+        HttpClient._local.throttle = throttle = mock.Mock()
+        with mock.patch('analysis.engine.deadline.time.sleep'):
+            _CountingRetry(total=3).sleep()
+        throttle.assert_called_once_with()
+
+
+class StructureConditionalGetTests(TestCase):
+    DIGEST = 'a' * 64
+
+    def url(self, digest=DIGEST):
+        return reverse('structure', kwargs={'digest': digest})
+
+    def test_missing_structure_is_404_even_for_if_none_match(self):
+        for tag in ('*', f'"{"b" * 64}"'):
+            response = self.client.get(self.url('b' * 64), HTTP_IF_NONE_MATCH=tag, secure=True)
+            self.assertEqual(response.status_code, 404, tag)
+
+    def test_existing_structure_matches_etag(self):
+        ProteinStructure.objects.create(
+            digest=self.DIGEST, length=1, pdb_compressed=zlib.compress(b"ATOM"), size=4,
+        )
+        response = self.client.get(self.url(), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"ATOM")
+        for tag in ('*', response['ETag']):
+            self.assertEqual(self.client.get(self.url(), HTTP_IF_NONE_MATCH=tag, secure=True).status_code, 304, tag)
+
+
+class MergeTests(SimpleTestCase):
+    STATE = {"project_id": "p", "complete": True, "deadline": None, "timings": {"scan": {"seconds": 1}}}
+
+    def test_keeps_annotation_when_fold_expired(self):
+        annotated = dict(self.STATE, strategy_result={"strategy_used": "UniversalFunctional"},
+                         timings={"annotate": {"seconds": 2}})
+        folded = dict(self.STATE, structure=None, complete=False, expired=['fold'],
+                      timings={"fold": {"seconds": 3}})
+
+        state = AnalysisPipeline.merge(self.STATE, annotated, folded)
+
+        self.assertEqual(state['strategy_result'], {"strategy_used": "UniversalFunctional"})
+        self.assertIsNone(state['structure'])
+        self.assertEqual(state['expired'], ['fold'])
+        self.assertFalse(state['complete'])
+        self.assertEqual(set(state['timings']), {'scan', 'annotate', 'fold'})
+
+    def test_keeps_structure_when_annotation_expired(self):
+        annotated = dict(self.STATE, strategy_result={"strategy_used": None, "note": "Ran out of time"},
+                         complete=False, expired=['annotate'])
+        folded = dict(self.STATE, structure="ab" * 32)
+
+        # Distributed mode merges onto the annotate branch's state
+        state = AnalysisPipeline.merge(annotated, annotated, folded)
+
+        self.assertEqual(state['structure'], "ab" * 32)
+        self.assertEqual(state['strategy_result']['note'], "Ran out of time")
+        self.assertEqual(state['expired'], ['annotate'])
+        self.assertFalse(state['complete'])
+
+    def test_complete_when_nothing_expired(self):
+        state = AnalysisPipeline.merge(
+            self.STATE, dict(self.STATE, strategy_result={}), dict(self.STATE, structure="cd" * 32)
+        )
+        self.assertTrue(state['complete'])
+        self.assertNotIn('expired', state)
+
+    @override_settings(PIPELINE_CONCURRENT_BRANCHES=True, PIPELINE_ANNOTATE_TIMEOUT=5, PIPELINE_FOLD_TIMEOUT=5)
+    def test_branch_that_raises_is_left_out(self):
+        folded = dict(self.STATE, structure="ef" * 32, timings={"fold": {"seconds": 3}})
+        with mock.patch.object(AnalysisPipeline, 'annotate', side_effect=RuntimeError("UniProt down")), \
+                mock.patch.object(AnalysisPipeline, 'fold', return_value=folded):
+            state = AnalysisPipeline.annotate_and_fold(dict(self.STATE))
+
+        self.assertEqual(state['structure'], "ef" * 32)
+        self.assertIsNone(state['strategy_result']['strategy_used'])
+        self.assertFalse(state['complete'])
+        self.assertNotIn('expired', state)
+
+
+def random_dna(length, seed):
+    return ''.join(np.random.default_rng(seed).choice(list("ACGT"), length))
+
+
+def reverse_complement(sequence):
+    return sequence[::-1].translate(str.maketrans("ACGTN", "TGCAN"))
+
+
+class KmerClassifierTests(SimpleTestCase):
+    INS, GCG = random_dna(400, 1), random_dna(400, 2)
+
+    def setUp(self):
+        index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(index_dir.cleanup)
+        self.root = Path(index_dir.name)
+        index = override_settings(KMER_INDEX_DIR=index_dir.name, KMER_SIZE=11)
+        index.enable()
+        self.addCleanup(index.disable)
+
+    def test_canonical_kmers_ignore_strand_and_n(self):
+        read = self.INS[:40]
+        np.testing.assert_array_equal(
+            np.sort(canonical_kmers(read, 11)), np.sort(canonical_kmers(reverse_complement(read), 11))
+        )
+        # 30 windows, 11 of them cover the N
+        self.assertEqual(len(canonical_kmers(read[:20] + "N" + read[21:], 11)), 30 - 11)
+
+    def test_no_index(self):
+        self.assertIsNone(KmerClassifier.classify(self.INS))
+
+    def test_build_and_classify(self):
+        manifest = KmerClassifier.build([("Homo sapiens", "INS", self.INS), ("Mus musculus", "Gcg", self.GCG)])
+        self.assertEqual(manifest['k'], 11)
+
+        match = KmerClassifier.classify(self.GCG[100:250])
+        self.assertEqual((match['organism'], match['gene'], match['confidence']), ("Mus musculus", "Gcg", 1.0))
+        # Reads from the other strand classify the same way
+        self.assertEqual(KmerClassifier.classify(reverse_complement(self.INS[50:200]))['gene'], "INS")
+        # Nothing in common with the panel
+        self.assertEqual(KmerClassifier.classify(random_dna(200, 3))['confidence'], 0.0)
+
+    def test_shared_kmers_are_ambiguous(self):
+        shared = self.INS[:100]
+        KmerClassifier.build([("Homo sapiens", "INS", self.INS), ("Pan troglodytes", "INS", shared + self.GCG)])
+        match = KmerClassifier.classify(shared)
+        self.assertIsNone(match['organism'])
+        self.assertEqual(match['confidence'], 0.0)
+
+    def test_rebuild_swaps_current_symlink(self):
+        KmerClassifier.build([("Homo sapiens", "INS", self.INS)])
+        first = os.readlink(self.root / KmerClassifier.CURRENT)
+        self.assertEqual(KmerClassifier.classify(self.INS[:100])['organism'], "Homo sapiens")
+
+        KmerClassifier.build([("Canis lupus familiaris", "INS", self.INS)])
+        second = os.readlink(self.root / KmerClassifier.CURRENT)
+        self.assertNotEqual(first, second)
+        # Relative link inside KMER_INDEX_DIR, no staging link left, the old build removed
+        self.assertEqual(sorted(entry.name for entry in self.root.iterdir()), sorted([KmerClassifier.CURRENT, second]))
+        # Workers pick up the new build on their next lookup
+        self.assertEqual(KmerClassifier.classify(self.INS[:100])['organism'], "Canis lupus familiaris")
+
+
+BLAST_XML = """<?xml version="1.0"?>
+<!DOCTYPE BlastOutput PUBLIC "-//NCBI//NCBI BlastOutput/EN" "http://www.ncbi.nlm.nih.gov/dtd/NCBI_BlastOutput.dtd">
+<BlastOutput>
+  <BlastOutput_program>blastn</BlastOutput_program>
+  <BlastOutput_version>BLASTN 2.15.0+</BlastOutput_version>
+  <BlastOutput_reference>x</BlastOutput_reference>
+  <BlastOutput_db>nt</BlastOutput_db>
+  <BlastOutput_query-ID>Query_1</BlastOutput_query-ID>
+  <BlastOutput_query-def>q</BlastOutput_query-def>
+  <BlastOutput_query-len>9</BlastOutput_query-len>
+  <BlastOutput_param><Parameters><Parameters_expect>10</Parameters_expect></Parameters></BlastOutput_param>
+  <BlastOutput_iterations>
+    <Iteration>
+      <Iteration_iter-num>1</Iteration_iter-num>
+      <Iteration_query-ID>Query_1</Iteration_query-ID>
+      <Iteration_query-def>q</Iteration_query-def>
+      <Iteration_query-len>9</Iteration_query-len>
+      <Iteration_hits>
+        <Hit>
+          <Hit_num>1</Hit_num>
+          <Hit_id>gi|1|ref|NM_000207.3|</Hit_id>
+          <Hit_def>Homo sapiens insulin (INS), mRNA</Hit_def>
+          <Hit_accession>NM_000207</Hit_accession>
+          <Hit_len>465</Hit_len>
+          <Hit_hsps></Hit_hsps>
+        </Hit>
+      </Iteration_hits>
+      <Iteration_stat><Statistics><Statistics_db-num>1</Statistics_db-num><Statistics_db-len>1</Statistics_db-len><Statistics_hsp-len>0</Statistics_hsp-len><Statistics_eff-space>1</Statistics_eff-space><Statistics_kappa>0.4</Statistics_kappa><Statistics_lambda>0.6</Statistics_lambda><Statistics_entropy>0.7</Statistics_entropy></Statistics></Iteration_stat>
+    </Iteration>
+  </BlastOutput_iterations>
+</BlastOutput>
+"""
+
+
+@override_settings(
+    METRICS_ENABLED=False, RESULT_CACHE_ENABLED=False, SINGLE_FLIGHT_ENABLED=False, PIPELINE_DISTRIBUTED=False,
+    BLAST_BACKEND='async', BLAST_MIN_POLL_DELAY=10, BLAST_POLL_INTERVAL=60, BLAST_MAX_WAIT=900,
+)
+class AsyncBlastTests(TestCase):
+    def setUp(self):
+        index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(index_dir.cleanup)
+        no_index = override_settings(KMER_INDEX_DIR=index_dir.name)
+        no_index.enable()
+        self.addCleanup(no_index.disable)
+        self.project = AnalysisProject.objects.create(input_type='TEXT', input_sequence=CDS, status='PENDING')
+
+    def ncbi(self, *pages):
+        """HttpClient.post answering each BLAST call with the next page."""
+        return mock.patch.object(HttpClient, 'post', side_effect=[
+            mock.Mock(text=page, raise_for_status=mock.Mock()) for page in pages
+        ])
+
+    def test_submit_once_then_poll_until_done(self):
+        with self.ncbi("    RID = R2D2\n    RTOE = 25\n", "Status=WAITING", BLAST_XML) as post:
+            with self.assertRaises(BlastPending) as submitted:
+                OrganismScanner.identify_organism(self.project.id)
+            self.assertEqual((submitted.exception.rid, submitted.exception.countdown), ("R2D2", 25))
+
+            # Each retry checks the same RID instead of submitting again
+            with self.assertRaises(BlastPending) as waiting:
+                OrganismScanner.identify_organism(self.project.id)
+            self.assertEqual(waiting.exception.countdown, 60)
+
+            self.assertEqual(OrganismScanner.identify_organism(self.project.id), ("Homo sapiens", "INS"))
+
+        self.assertEqual([call.kwargs['data']['CMD'] for call in post.call_args_list], ["Put", "Get", "Get"])
+        self.assertEqual({call.kwargs['data'].get('RID') for call in post.call_args_list[1:]}, {"R2D2"})
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.blast_rid, "R2D2")
+
+    def test_first_check_waits_at_least_min_poll_delay(self):
+        with self.ncbi("RID = R2D2\nRTOE = 2\n"), self.assertRaises(BlastPending) as submitted:
+            OrganismScanner.identify_organism(self.project.id)
+        self.assertEqual(submitted.exception.countdown, 10)
+
+    def test_gives_up_after_max_wait(self):
+        AnalysisProject.objects.filter(id=self.project.id).update(
+            blast_rid="R2D2", blast_submitted_at=timezone.now() - timedelta(seconds=901),
+        )
+        with self.ncbi("Status=WAITING"):
+            self.assertIsNone(OrganismScanner.identify_organism(self.project.id))
+
+    def test_task_retries_instead_of_blocking(self):
+        with mock.patch.object(ProgressChannel, 'publish'), \
+                mock.patch.object(run_analysis_pipeline, 'retry', return_value=RuntimeError("retry")) as retry, \
+                self.ncbi("RID = R2D2\nRTOE = 25\n"), self.assertRaises(RuntimeError):
+            run_analysis_pipeline.run(str(self.project.id))
+        retry.assert_called_once_with(countdown=25)
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'PROCESSING')
+
+
+class CleanAnnotationCache:
+    """Empty in-memory annotation cache for every test (counters are not flushed anywhere)."""
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(CACHES=LOCAL_CACHE)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        AnnotationCache.clear_local()
+        self.addCleanup(AnnotationCache.clear_local)
+        record = mock.patch.object(AnnotationCache, 'record')
+        self.record = record.start()
+        self.addCleanup(record.stop)
+
+
+class Summary(dict):
+    """A ClinVar DocumentSummary as Entrez.read returns it (a dict with XML attributes)."""
+
+    def __init__(self, uid, significance, title='', cdna_change=''):
+        super().__init__(
+            title=title, clinical_significance={'description': significance},
+            variation_set=[{'variation_name': title, 'cdna_change': cdna_change}],
+        )
+        self.attributes = {'uid': uid}
+
+
+class ClinVarBatchTests(CleanAnnotationCache, SimpleTestCase):
+    SUMMARIES = {
+        '1': Summary('1', "Benign", title="NM_007294.4(BRCA1):c.5266dup (p.Gln1756fs)"),
+        '2': Summary('2', "Pathogenic", cdna_change="c.68_69del"),
+        '3': Summary('3', "Likely benign", title="NM_000546.6(TP53):c.524G>A (p.Arg175His)"),
+    }
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(ClinVarClient, '_eutils', side_effect=self.eutils)
+        self.calls = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def eutils(self, endpoint, **params):
+        if endpoint == 'esearch':
+            # Relevance order: the first record is not always the one asked for
+            return {'IdList': ['1', '2'] if params['term'].startswith("BRCA1") else ['3']}
+        return {'DocumentSummarySet': {'DocumentSummary': [self.SUMMARIES[uid] for uid in params['id'].split(',')]}}
+
+    def requests(self, endpoint):
+        return [call.kwargs for call in self.calls.call_args_list if call.args[0] == endpoint]
+
+    def test_one_search_per_gene(self):
+        results = ClinVarClient.fetch_variants_batch([
+            ("BRCA1", "c.68_69del"), ("BRCA1", "c.5266dup"), ("TP53", "c.524G>A"), ("BRCA1", "c.68_69del"),
+        ])
+
+        self.assertEqual([params['term'] for params in self.requests('esearch')], [
+            "BRCA1[Gene Name] AND (c.68_69del[Text Word] OR c.5266dup[Text Word])",
+            "TP53[Gene Name] AND (c.524G>A[Text Word])",
+        ])
+        self.assertEqual([params['id'] for params in self.requests('esummary')], ["1,2", "3"])
+        # Each variant gets the record that describes it, not the top hit
+        self.assertEqual(results[("BRCA1", "c.68_69del")], {"significance": "Pathogenic", "disease": "Unspecified Condition", "clinvar_id": "2"})
+        self.assertEqual(results[("BRCA1", "c.5266dup")]['clinvar_id'], "1")
+        self.assertEqual(results[("TP53", "c.524G>A")]['significance'], "Likely benign")
+
+    def test_search_and_summary_batches(self):
+        pairs = [("BRCA1", "c.68_69del"), ("BRCA1", "c.1A>G"), ("BRCA1", "c.5266dup")]
+        with mock.patch.object(ClinVarClient, 'SEARCH_BATCH', 2), mock.patch.object(ClinVarClient, 'SUMMARY_BATCH', 1):
+            results = ClinVarClient.fetch_variants_batch(pairs)
+        self.assertEqual(len(self.requests('esearch')), 2)
+        self.assertEqual([params['id'] for params in self.requests('esummary')], ["1", "2", "1", "2"])
+        self.assertEqual(results[("BRCA1", "c.68_69del")]['clinvar_id'], "2")
+        # Searched with others, a variant no record mentions is not listed
+        self.assertEqual(results[("BRCA1", "c.1A>G")], ClinVarClient.NOT_FOUND)
+        # Searched alone, a variant gets the top hit (as fetch_variant_data does)
+        self.assertEqual(results[("BRCA1", "c.5266dup")]['clinvar_id'], "1")
+
+    def test_cached_variants_are_not_searched_again(self):
+        first = ClinVarClient.fetch_variants_batch([("BRCA1", "c.68_69del")])
+        self.calls.reset_mock()
+        results = ClinVarClient.fetch_variants_batch([("BRCA1", "c.68_69del"), ("TP53", "c.524G>A")])
+        self.assertEqual([params['term'] for params in self.requests('esearch')], ["TP53[Gene Name] AND (c.524G>A[Text Word])"])
+        self.assertEqual(results[("BRCA1", "c.68_69del")], first[("BRCA1", "c.68_69del")])
+
+    def test_describes(self):
+        summary = self.SUMMARIES['1']
+        self.assertTrue(ClinVarClient._describes(summary, "c.5266DUP"))
+        self.assertTrue(ClinVarClient._describes(self.SUMMARIES['2'], "c.68_69del"))
+        self.assertFalse(ClinVarClient._describes(summary, "c.68_69del"))
+
+
+@override_settings(ANNOTATION_CACHE_TTL=3600, ANNOTATION_NEGATIVE_TTL=60, ANNOTATION_STALE_TTL=86400, ANNOTATION_LOCAL_TTL=300)
+class AnnotationCacheTests(CleanAnnotationCache, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1_000_000.0
+        clock = mock.patch('analysis.engine.annotation_cache.time.time', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def fetch(self, parts, value=None, error=None):
+        fetch = mock.Mock(return_value=value, side_effect=error)
+        result = AnnotationCache.get_or_fetch('uniprot', parts, fetch, is_negative=lambda result: result is None)
+        return result, fetch.called
+
+    def test_positive_and_negative_ttl(self):
+        self.assertEqual(self.fetch(("Homo sapiens", "INS"), {"function": "Insulin"}), ({"function": "Insulin"}, True))
+        self.assertEqual(self.fetch(("Homo sapiens", "XYZ"), None), (None, True))
+
+        self.now += 61
+        # "Not found" is asked again after ANNOTATION_NEGATIVE_TTL, a real answer isn't
+        self.assertEqual(self.fetch(("Homo sapiens", "XYZ"), {"function": "New entry"}), ({"function": "New entry"}, True))
+        self.assertEqual(self.fetch(("Homo sapiens", "INS"), {"function": "changed"}), ({"function": "Insulin"}, False))
+
+        self.now += 3600
+        self.assertEqual(self.fetch(("Homo sapiens", "INS"), {"function": "changed"}), ({"function": "changed"}, True))
+
+    def test_stale_if_error(self):
+        self.fetch(("Homo sapiens", "INS"), {"function": "Insulin"})
+        self.now += 3601
+
+        # Upstream down: the expired answer is still served
+        self.assertEqual(self.fetch(("Homo sapiens", "INS"), error=ConnectionError("UniProt down")), ({"function": "Insulin"}, True))
+        self.record.assert_any_call('uniprot', 'stale_served')
+
+        # Nothing cached at all: the error reaches the caller
+        with self.assertRaises(ConnectionError):
+            self.fetch(("Mus musculus", "Ins1"), error=ConnectionError("UniProt down"))
+        self.record.assert_any_call('uniprot', 'errors')
+
+    def test_shared_tier_refills_local(self):
+        AnnotationCache.store('uniprot', ("Homo sapiens", "INS"), {"function": "Insulin"})
+        AnnotationCache.clear_local()  # another worker process
+
+        self.assertEqual(AnnotationCache.lookup('uniprot', ("homo sapiens", " INS")), ({"function": "Insulin"}, True))
+        self.assertEqual(AnnotationCache.lookup('uniprot', ("Homo sapiens", "INS")), ({"function": "Insulin"}, True))
+        self.assertEqual([call.args[1] for call in self.record.call_args_list], ['hit_shared', 'hit_local'])
+
+    def test_local_copies_are_private(self):
+        AnnotationCache.store('uniprot', ("Homo sapiens", "INS"), {"function": "Insulin"})
+        value, _ = AnnotationCache.lookup('uniprot', ("Homo sapiens", "INS"))
+        value["function"] = "mutated by a caller"
+        self.assertEqual(AnnotationCache.lookup('uniprot', ("Homo sapiens", "INS"))[0], {"function": "Insulin"})
+
+
+class BiophysicsTests(SimpleTestCase):
+    def test_single_substitution(self):
+        self.assertEqual(BiophysicalEngine.calculate_deltas('W', 'R'), {
+            "mass_delta": -30.0, "charge_delta": 1, "hydropathy_delta": -3.6,
+            "old_aa_name": "Tryptophan", "new_aa_name": "Arginine",
+        })
+        self.assertEqual(BiophysicalEngine.calculate_deltas('w', 'r'), BiophysicalEngine.calculate_deltas('W', 'R'))
+        for old, new in (('W', 'X'), ('Z', 'A'), ('', 'A'), (None, 'A'), ('Trp', 'A')):
+            self.assertIsNone(BiophysicalEngine.calculate_deltas(old, new), (old, new))
+
+    def test_answers_are_copies(self):
+        BiophysicalEngine.calculate_deltas('W', 'R')['mass_delta'] = 0
+        self.assertEqual(BiophysicalEngine.calculate_deltas('W', 'R')['mass_delta'], -30.0)
+
+    def test_batch_matches_single_for_every_pair(self):
+        codes = BiophysicalEngine.CODES
+        old = [a for a in codes for _ in codes]
+        new = [b for _ in codes for b in codes]
+        for old_column, new_column in (
+            (''.join(old), ''.join(new)),
+            (old, new),
+            (np.array(old), np.array(new)),
+            (np.array(old, dtype='S1'), np.array(new, dtype='S1')),
+        ):
+            batch = BiophysicalEngine.calculate_deltas_batch(old_column, new_column)
+            self.assertTrue(batch['valid'].all())
+            for i, (a, b) in enumerate(zip(old, new)):
+                single = BiophysicalEngine.calculate_deltas(a, b)
+                self.assertEqual(batch['mass_delta'][i], single['mass_delta'])
+                self.assertEqual(batch['charge_delta'][i], single['charge_delta'])
+                self.assertEqual(batch['hydropathy_delta'][i], single['hydropathy_delta'])
+                self.assertEqual((batch['old_aa_name'][i], batch['new_aa_name'][i]), (single['old_aa_name'], single['new_aa_name']))
+
+    def test_batch_marks_invalid_rows(self):
+        batch = BiophysicalEngine.calculate_deltas_batch(['W', None, 'x', 'Trp', 'k'], ['R', 'A', 'A', 'A', ''])
+        self.assertEqual(batch['valid'].tolist(), [True, False, False, False, False])
+        self.assertTrue(np.isnan(batch['mass_delta'][1:]).all())
+        self.assertEqual(batch['old_aa_name'].tolist(), ["Tryptophan", None, None, None, None])
+
+        with self.assertRaises(ValueError):
+            BiophysicalEngine.calculate_deltas_batch("WR", "R")
+
+
+class TranslationTests(SimpleTestCase):
+    def test_matches_biopython_in_every_frame(self):
+        dna = random_dna(301, 4)
+        dna = dna[:100] + "NN" + dna[102:200] + "GCN" + dna[203:]
+        frames = TranslationEngine.six_frames(dna)
+        for strand, frame, protein in frames:
+            strand_dna = dna if strand > 0 else reverse_complement(dna)
+            codons = strand_dna[frame:]
+            expected = str(Seq(codons[:len(codons) // 3 * 3]).translate())
+            self.assertEqual(protein.tobytes().decode(), expected, (strand, frame))
+
+        self.assertEqual(TranslationEngine.translate("atgGCTtgaAAA", to_stop=True), "MA")
+        self.assertEqual(TranslationEngine.translate("ATGGCTTGAAA"), "MA*")
+
+    def test_longest_orf_on_either_strand(self):
+        forward_orf = "ATG" + "GCT" * 5 + "TAA"                    # M + 5 A
+        reverse_orf = "ATG" + "AAA" * 20 + "TGA"                   # M + 20 K, on the minus strand
+        dna = "CC" + forward_orf + "G" + reverse_complement(reverse_orf) + "C"
+
+        orfs = TranslationEngine.find_orfs(dna, min_length=5)
+        self.assertEqual([orf['length'] for orf in orfs], [21, 6])
+        best = orfs[0]
+        self.assertEqual((best['strand'], best['protein'], best['complete']), (-1, "M" + "K" * 20, True))
+        # Coordinates are on the forward strand, stop codon excluded
+        self.assertEqual(TranslationEngine.translate(reverse_complement(dna[best['start']:best['end']])), best['protein'])
+        self.assertEqual(dna[orfs[1]['start']:orfs[1]['end']], forward_orf[:-3])
+
+    def test_orf_without_stop_is_incomplete(self):
+        [orf] = TranslationEngine.find_orfs("ATG" + "GCT" * 4, min_length=2, limit=1)
+        self.assertEqual((orf['protein'], orf['complete']), ("MAAAA", False))
+
+    def test_best_protein_falls_back_to_frame_zero(self):
+        self.assertEqual(TranslationEngine.best_protein("GCTGCTTAAGCT", min_length=3), ("AA", None))
+        protein, orf = TranslationEngine.best_protein("CCATGGCTGCTTAA", min_length=3)
+        self.assertEqual((protein, orf['start'], orf['frame']), ("MAA", 2, 2))
+
+
+def pdb_for(protein):
+    """A minimal PDB with one CA atom per residue, as ESMFold would return it."""
+    names = {'M': 'MET', 'A': 'ALA', 'W': 'TRP', 'K': 'LYS'}
+    lines = [
+        f"ATOM  {i + 1:5d}  CA  {names[aa]} A{i + 1:4d}      0.000   0.000   0.000  1.00 90.00           C"
+        for i, aa in enumerate(protein)
+    ]
+    return "\n".join(lines + ["END"])
+
+
+class StructureStoreTests(TestCase):
+    def test_structure_is_stored_compressed_and_shared(self):
+        pdb = pdb_for("MAWK") * 20
+        with mock.patch.object(StructureService, '_fold_remote', return_value=pdb) as fold:
+            first = StructureService.get_structure("MAWK")
+            second = StructureService.get_structure("MAWK")
+
+        fold.assert_called_once_with("MAWK")
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(first.digest, StructureStore.digest("MAWK"))
+        self.assertEqual((first.length, first.size), (4, len(pdb)))
+        self.assertLess(len(first.pdb_compressed), first.size)
+
+        stored = ProteinStructure.objects.get(pk=first.pk)
+        self.assertEqual(stored.pdb, pdb)
+        self.assertEqual(zlib.decompress(bytes(stored.pdb_compressed)).decode(), pdb)
+
+    def test_failed_prediction_stores_nothing(self):
+        with mock.patch.object(StructureService, '_fold_remote', return_value=None):
+            self.assertIsNone(StructureService.get_structure("MAWK"))
+        self.assertFalse(ProteinStructure.objects.exists())
+
+    def test_long_protein_is_truncated_before_lookup(self):
+        protein = "A" * (StructureService.MAX_RESIDUES + 50)
+        with mock.patch.object(StructureService, '_fold_remote', return_value="END") as fold:
+            structure = StructureService.get_structure(protein)
+        fold.assert_called_once_with(protein[:StructureService.MAX_RESIDUES])
+        self.assertEqual(structure.length, StructureService.MAX_RESIDUES)
+
+
+class StructureMigrationTests(TransactionTestCase):
+    """Runs 0006 forward and back over rows that still carry pdb_data."""
+    before = [('analysis', '0005_analysisvariant')]
+    after = [('analysis', '0006_proteinstructure')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        self.addCleanup(lambda: self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes()))
+        apps = self.migrate(self.before)
+        Project = apps.get_model('analysis', 'AnalysisProject')
+        Result = apps.get_model('analysis', 'AnalysisResult')
+
+        self.pdb = pdb_for("MAWK")
+        self.headless = "HEADER    NO ATOMS\nEND"
+        for pdb_data in (self.pdb, self.pdb, self.headless, None):
+            project = Project.objects.create(input_type='TEXT', input_sequence=CDS)
+            Result.objects.create(project=project, pdb_data=pdb_data)
+
+    def test_forward_moves_pdb_into_store(self):
+        apps = self.migrate(self.after)
+        Result = apps.get_model('analysis', 'AnalysisResult')
+        Structure = apps.get_model('analysis', 'ProteinStructure')
+
+        # Both copies of the same fold share the row a live lookup would hit
+        shared = Structure.objects.get(digest=StructureStore.digest("MAWK"))
+        self.assertEqual((shared.length, shared.size), (4, len(self.pdb)))
+        self.assertEqual(zlib.decompress(bytes(shared.pdb_compressed)).decode(), self.pdb)
+        self.assertEqual(Result.objects.filter(structure=shared).count(), 2)
+
+        # No CA atoms: keyed by the PDB text itself
+        orphan = Structure.objects.get(digest=hashlib.sha256(self.headless.encode()).hexdigest())
+        self.assertEqual(orphan.length, 0)
+
+        self.assertEqual(Structure.objects.count(), 2)
+        self.assertEqual(Result.objects.filter(structure__isnull=True).count(), 1)
+
+    def test_reverse_restores_pdb_data(self):
+        self.migrate(self.after)
+        apps = self.migrate(self.before)
+        Result = apps.get_model('analysis', 'AnalysisResult')
+
+        restored = sorted(Result.objects.values_list('pdb_data', flat=True), key=lambda pdb: pdb or '')
+        self.assertEqual(restored, sorted([None, self.headless, self.pdb, self.pdb], key=lambda pdb: pdb or ''))
+
+
+class FakeRedis:
+    """GET / SET (EX, NX) / PUBLISH over a dict; pipeline() runs each command as it is queued."""
+
+    def __init__(self):
+        self.store, self.ttls, self.published = {}, {}, []
+
+    def get(self, key):
+        value = self.store.get(key)
+        return value.encode() if value is not None else None
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.store:
+            return None
+        self.store[key], self.ttls[key] = value, ex
+        return True
+
+    def publish(self, channel, message):
+        self.published.append((channel, json.loads(message)))
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+
+@override_settings(STATUS_CACHE_ENABLED=True, STATUS_CACHE_TTL_ACTIVE=60, STATUS_CACHE_TTL_DONE=3600)
+class StatusCacheTests(TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = mock.patch('analysis.services.progress.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.project = AnalysisProject.objects.create(input_type='TEXT', input_sequence=CDS)
+        self.key = StatusCache.key(self.project.id)
+        self.url = reverse('status', args=[self.project.id])
+
+    def poll(self):
+        return APIClient().get(self.url, secure=True)
+
+    def test_publish_writes_through_and_announces(self):
+        ProgressChannel.publish(self.project.id, 'PROCESSING', 'blast')
+
+        cached = json.loads(self.redis.store[self.key])
+        self.assertEqual((cached['status'], cached['stage']), ('PROCESSING', 'blast'))
+        self.assertEqual(self.redis.ttls[self.key], 60)
+        self.assertEqual(self.redis.published, [(ProgressChannel.channel(self.project.id), cached)])
+
+        ProgressChannel.publish(self.project.id, 'COMPLETED')
+        self.assertEqual(json.loads(self.redis.store[self.key])['status'], 'COMPLETED')
+        self.assertEqual(self.redis.ttls[self.key], 3600)
+
+    def test_poll_is_answered_from_cache(self):
+        ProgressChannel.publish(self.project.id, 'PROCESSING', 'structure')
+
+        with self.assertNumQueries(0):
+            response = self.poll()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['status'], response.data['stage']), ('PROCESSING', 'structure'))
+
+    def test_miss_reads_database_and_fills(self):
+        response = self.poll()
+
+        self.assertEqual(response.data['status'], 'PENDING')
+        self.assertEqual(json.loads(self.redis.store[self.key]), response.data)
+        self.assertEqual(self.redis.ttls[self.key], 60)
+
+    def test_fill_never_overwrites_a_newer_state(self):
+        stale = status_payload(self.project.id, 'PENDING')
+        ProgressChannel.publish(self.project.id, 'COMPLETED')
+
+        StatusCache.fill(stale)
+        self.assertEqual(json.loads(self.redis.store[self.key])['status'], 'COMPLETED')
+
+    def test_redis_down_falls_back_to_database(self):
+        with mock.patch('analysis.services.progress.get_redis', side_effect=redis.ConnectionError("Redis down")):
+            ProgressChannel.publish(self.project.id, 'PROCESSING', 'blast')
+            response = self.poll()
+        self.assertEqual((response.status_code, response.data['status']), (200, 'PENDING'))
@@ -1,8 +1,17 @@
-from django.urls import path
+from django.urls import path, re_path
 from .views import AnalyzeView
-from .views import ProjectStatusView
+from .views import ProjectStatusView, ProjectReportView, ProjectVariantsView, StructureView, project_events
+from .views import BatchAnalyzeView, BatchStatusView
+from .views import CacheStatsView
 
 urlpatterns = [
     path('analyze/', AnalyzeView.as_view(), name='analyze'),
     path('status/<uuid:project_id>/', ProjectStatusView.as_view(), name='status'),
+    path('status/<uuid:project_id>/events/', project_events, name='status-events'),
+    path('status/<uuid:project_id>/report/', ProjectReportView.as_view(), name='status-report'),
+    path('status/<uuid:project_id>/variants/', ProjectVariantsView.as_view(), name='status-variants'),
+    re_path(r'^structures/(?P<digest>[0-9a-f]{64})/$', StructureView.as_view(), name='structure'),
+    path('batch/', BatchAnalyzeView.as_view(), name='batch'),
+    path('batch/<uuid:batch_id>/', BatchStatusView.as_view(), name='batch-status'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
 ]
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+from django.conf import settings
 from django.core.exceptions import ValidationError
 
 def validate_file_extension(value):
@@ -10,10 +11,20 @@ def validate_file_extension(value):
     if not ext.lower() in valid_extensions:
         raise ValidationError('Unsupported file extension. Allowed: .fasta, .txt, .vcf')
 
+def validate_fasta_extension(value):
+    """
+    Batch uploads are read as multi-record FASTA, so only .fasta files are accepted
+    (a .vcf or plain .txt would pass the single-upload check and then yield no records).
+    """
+    ext = os.path.splitext(value.name)[1]
+    if ext.lower() != '.fasta':
+        raise ValidationError('Unsupported file extension for a batch. Upload a multi-record .fasta file.')
+
 def validate_file_size(value):
     """
-    Limits file size to 50KB to prevent server overload.
+    Limits file size (settings.MAX_UPLOAD_SIZE) to prevent server overload.
+    Uploads are streamed by IngestService, so the limit is about disk/DB, not RAM.
     """
-    limit = 50 * 1024  # 50 KB
+    limit = settings.MAX_UPLOAD_SIZE
     if value.size > limit:
-        raise ValidationError('File too large. Size should not exceed 50 KB.')
\ No newline at end of file
+        raise ValidationError(f'File too large. Size should not exceed {limit // (1024 * 1024)} MB.')
@@ -1,20 +1,44 @@
+import gzip
+import hashlib
+import json
+import logging
+import zlib
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import AllowAny, IsAdminUser
+from celery import group
 from django.core.exceptions import ValidationError
-from .serializers import AnalysisInputSerializer
+from django.db import transaction
+from django.db.models import Count
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from .serializers import AnalysisInputSerializer, BatchInputSerializer
+from .services.admission import AdmissionControl, AdmissionRejected
 from .services.ingest import IngestService
-from .models import AnalysisProject
+from .services.cache import ResultCache
+from .services.variants import VariantService
+from .services.progress import (
+    ANSWERED_STATUSES, STATUS_FIELDS, TERMINAL_STATUSES, ProgressChannel, StatusCache, payload_from_row, status_payload
+)
+from .engine.annotation_cache import AnnotationCache
+from .engine.metrics import Metrics
+from .models import AnalysisBatch, AnalysisProject, AnalysisResult, AnalysisVariant, ProteinStructure
 from .tasks import run_analysis_pipeline
 from django.shortcuts import get_object_or_404, render
 
+logger = logging.getLogger(__name__)
+
 def index(request):
     recent_projects = []
     if request.user.is_authenticated:
         # Fetch last 3 completed projects for this user
         recent_projects = AnalysisProject.objects.filter(
             user=request.user, 
-            status='COMPLETED'
+            status__in=ANSWERED_STATUSES
+        ).select_related('result').only(
+            'id', 'status', 'created_at', 'result__organism'
         ).order_by('-created_at')[:3]
         
     return render(request, 'index.html', {'recent_projects': recent_projects})
@@ -28,6 +52,13 @@ class AnalyzeView(APIView):
         serializer = AnalysisInputSerializer(data=request.data)
         
         if serializer.is_valid():
+            # 0. Admission control: refuse (429) before doing any work if we're over budget
+            submitter = AdmissionControl.submitter(request)
+            try:
+                [priority] = AdmissionControl.admit(submitter)
+            except AdmissionRejected as e:
+                return _over_budget(e)
+
             try:
                 # 1. Call the Service Layer to get clean data
                 clean_sequence = IngestService.process(serializer.validated_data)
@@ -42,16 +73,23 @@ class AnalyzeView(APIView):
                 # 3. Create the Database Record
                 # We handle the User if they are logged in, otherwise None (Guest)
                 user = request.user if request.user.is_authenticated else None
-                
-                project = AnalysisProject.objects.create(
-                    user=user,
-                    input_type=input_type,
-                    input_sequence=clean_sequence,
-                    status='PENDING'
-                )
 
-                # 4. Trigger the Background Task
-                run_analysis_pipeline.delay(project.id)
+                # A VCF's variants are stored with the project: both or neither
+                with transaction.atomic():
+                    project = AnalysisProject.objects.create(
+                        user=user,
+                        submitter=submitter,
+                        input_type=input_type,
+                        input_sequence=clean_sequence,
+                        sequence_digest=ResultCache.digest(clean_sequence),
+                        status='PENDING'
+                    )
+                    if input_type == 'VCF':
+                        VariantService.ingest(project, serializer.validated_data['sequence_file']) # type: ignore
+
+                # 4. Trigger the Background Task (the first polls are answered from the status cache)
+                StatusCache.put_many([status_payload(project.id, project.status)])
+                run_analysis_pipeline.apply_async(args=[project.id], priority=priority)
 
                 # 5. Return the UUID "Receipt"
                 return Response({
@@ -65,29 +103,363 @@ class AnalyzeView(APIView):
                 return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
+
+
+def _over_budget(rejection):
+    """429 for a submission refused by AdmissionControl, with the standard Retry-After header."""
+    return Response(
+        {"error": rejection.message, "retry_after": rejection.retry_after},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={'Retry-After': str(rejection.retry_after)},
+    )
+
 
 class ProjectStatusView(APIView):
     """
     GET /api/status/{uuid}/
-    Poll this endpoint to check progress.
+    Poll this endpoint to check progress. Small on purpose: the report and the
+    structure are separate (cacheable) resources, linked once the project is answered.
+
+    Answered from the Redis StatusCache (no database query, no session lookup);
+    on a miss, one query that skips the heavy columns, and the cache is refilled.
     """
+    # Status is public by UUID; skipping authentication keeps polls off the session table
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
     def get(self, request, project_id):
-        project = get_object_or_404(AnalysisProject, id=project_id)
-        
-        data = {
+        payload = StatusCache.get(project_id)
+        if payload is None:
+            project = AnalysisProject.objects.filter(id=project_id).values(*STATUS_FIELDS).first()
+            if project is None:
+                return Response({"error": "Project not found."}, status=status.HTTP_404_NOT_FOUND)
+            payload = payload_from_row(project)
+            StatusCache.fill(payload)
+
+        return Response(payload)
+
+
+async def project_events(request, project_id):
+    """
+    GET /api/status/{uuid}/events/
+    Server-Sent Events: the project's current state, then one event per stage
+    until it finishes. Async, so it must be served by the ASGI app (see
+    docker-compose.yml); clients fall back to polling the status endpoint.
+    """
+    subscription = await ProgressChannel.open(project_id)
+    if subscription is None:
+        return JsonResponse({"error": "Project not found."}, status=404)
+
+    response = StreamingHttpResponse(ProgressChannel.stream(*subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: pass events through as they come
+    return response
+
+
+class ProjectReportView(APIView):
+    """
+    GET /api/status/{uuid}/report/
+    The finished report (JSON). A report never changes once written, but the URL
+    is not content-addressed, so clients revalidate it (If-None-Match -> 304).
+    """
+    def get(self, request, project_id):
+        report = (
+            AnalysisResult.objects
+            .filter(project_id=project_id, project__status__in=ANSWERED_STATUSES)
+            .values_list('report', flat=True)
+            .first()
+        )
+        if report is None:
+            return Response({"error": "Report not available."}, status=status.HTTP_404_NOT_FOUND)
+
+        body = json.dumps(report, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        return _cacheable_response(
+            request,
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            content_type='application/json',
+            cache_control='private, no-cache',
+            load=lambda: body,
+        )
+
+
+class StructureView(APIView):
+    """
+    GET /api/structures/{sha256}/
+    A predicted structure (PDB text). The URL is the hash of the protein, so the
+    content behind it never changes: cached forever, and a conditional GET is
+    answered from a primary-key lookup, without reading the structure itself.
+    """
+    def get(self, request, digest):
+        def load_deflated():
+            # Stored zlib-compressed, which is exactly the 'deflate' content-coding
+            blob = ProteinStructure.objects.filter(digest=digest).values_list('pdb_compressed', flat=True).first()
+            return bytes(blob) if blob is not None else None
+
+        def load():
+            blob = load_deflated()
+            return zlib.decompress(blob) if blob is not None else None
+
+        response = _cacheable_response(
+            request,
+            etag=digest,
+            content_type='chemical/x-pdb',
+            cache_control='public, max-age=31536000, immutable',
+            load=load,
+            load_deflated=load_deflated,
+            exists=lambda: ProteinStructure.objects.filter(digest=digest).exists(),
+        )
+        if response is None:
+            return Response({"error": "Structure not found."}, status=status.HTTP_404_NOT_FOUND)
+        return response
+
+
+def _accepted_encodings(request):
+    """Content-codings the client accepts (q > 0) from Accept-Encoding."""
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _cacheable_response(request, etag, content_type, cache_control, load, load_deflated=None, exists=None):
+    """
+    Serves an immutable-per-ETag body with conditional GET and gzip/deflate negotiation.
+
+    load():          the uncompressed body (None if it does not exist -> returns None)
+    load_deflated(): optional, the body already zlib-compressed (served as-is for 'deflate')
+    exists():        optional, a cheap check that the resource exists, for callers that
+                     haven't looked it up yet. Returns None when it doesn't, so a missing
+                     resource is a 404 even for If-None-Match (* or a matching tag).
+
+    Each encoding is a different representation, so it gets its own strong ETag.
+    Bodies are only loaded when the client's copy is not current.
+    """
+    if exists is not None and not exists():
+        return None
+
+    accepted = _accepted_encodings(request)
+    if 'deflate' in accepted and load_deflated is not None:
+        encoding = 'deflate'
+    elif 'gzip' in accepted:
+        encoding = 'gzip'
+    elif 'deflate' in accepted:
+        encoding = 'deflate'
+    else:
+        encoding = None
+
+    tag = f'"{etag}-{encoding}"' if encoding else f'"{etag}"'
+    if_none_match = request.headers.get('If-None-Match', '')
+    if tag in [candidate.strip() for candidate in if_none_match.split(',')] or if_none_match.strip() == '*':
+        response = HttpResponseNotModified()
+    else:
+        if encoding == 'deflate' and load_deflated is not None:
+            body = load_deflated()
+        else:
+            body = load()
+            if body is not None and encoding == 'gzip':
+                # mtime=0: the same input always gives the same bytes (strong ETag)
+                body = gzip.compress(body, compresslevel=settings.STRUCTURE_COMPRESSION_LEVEL, mtime=0)
+            elif body is not None and encoding == 'deflate':
+                body = zlib.compress(body, settings.STRUCTURE_COMPRESSION_LEVEL)
+        if body is None:
+            return None
+
+        response = HttpResponse(body, content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['ETag'] = tag
+    response['Cache-Control'] = cache_control
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+class ProjectVariantsView(APIView):
+    """
+    GET /api/status/{uuid}/variants/?after=<id>&limit=<n>
+    The annotated variants of a VCF project, a page at a time (keyset pagination:
+    pass the returned 'next' as 'after' to get the following page).
+    """
+    MAX_LIMIT = 500
+
+    def get(self, request, project_id):
+        project = get_object_or_404(AnalysisProject.objects.only('id', 'status'), id=project_id)
+
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = min(max(int(request.query_params.get('limit', 100)), 1), self.MAX_LIMIT)
+        except ValueError:
+            return Response({"error": "'after' and 'limit' must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        variants = list(
+            AnalysisVariant.objects
+            .filter(project_id=project.id, id__gt=after)
+            .order_by('id')
+            .values(
+                'id', 'variant_id', 'position', 'ref', 'alt', 'consequence', 'hgvs_c', 'hgvs_p',
+                'protein_position', 'old_aa', 'new_aa', 'biophysics', 'clinical', 'narrative'
+            )[:limit]
+        )
+
+        return Response({
             "id": project.id,
             "status": project.status,
-            "organism": None,
-            "pdb_data": None,
-            "report": None
-        }
-        
-        if hasattr(project, 'result'):
-            data['organism'] = project.result.organism # type: ignore
-            # ONLY return heavy data if completed
-            if project.status == 'COMPLETED':
-                data['pdb_data'] = project.result.pdb_data # type: ignore
-                data['report'] = project.result.report # type: ignore
-
-        return Response(data)    
\ No newline at end of file
+            "variants": variants,
+            "next": variants[-1]['id'] if len(variants) == limit else None
+        })
+
+
+class BatchAnalyzeView(APIView):
+    """
+    POST /api/batch/
+    Accepts a multi-record FASTA file OR a JSON array of sequences.
+    Returns: UUID of the batch + the UUIDs of its projects (in input order).
+    """
+    def post(self, request):
+        # A bare JSON array is shorthand for {"sequences": [...]}
+        data = {'sequences': request.data} if isinstance(request.data, list) else request.data
+        serializer = BatchInputSerializer(data=data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # 1. Clean every record (the whole batch is rejected if one is invalid)
+            records = IngestService.process_batch(serializer.validated_data)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 2. Admission control: the whole batch has to fit in the submitter's budget
+        submitter = AdmissionControl.submitter(request)
+        try:
+            priorities = AdmissionControl.admit(submitter, jobs=len(records), batch=True)
+        except AdmissionRejected as e:
+            return _over_budget(e)
+
+        input_type = 'FASTA' if 'sequence_file' in serializer.validated_data else 'TEXT' # type: ignore
+        user = request.user if request.user.is_authenticated else None
+
+        # 3. One INSERT for the batch, one (bulk) INSERT for all its projects
+        with transaction.atomic():
+            batch = AnalysisBatch.objects.create(user=user, size=len(records))
+            projects = AnalysisProject.objects.bulk_create([
+                AnalysisProject(
+                    user=user,
+                    submitter=submitter,
+                    batch=batch,
+                    input_type=input_type,
+                    input_sequence=sequence,
+                    sequence_digest=ResultCache.digest(sequence),
+                    status='PENDING'
+                )
+                for _, sequence in records
+            ])
+
+        # 4. Enqueue them together (one producer connection) once the rows are committed,
+        #    each at its fair-share priority
+        StatusCache.put_many([status_payload(project.id, project.status) for project in projects])
+        group(
+            run_analysis_pipeline.s(project.id).set(priority=priority)
+            for project, priority in zip(projects, priorities)
+        ).apply_async()
+
+        return Response({
+            "id": batch.id,
+            "size": batch.size,
+            "projects": [
+                {"id": project.id, "name": name}
+                for project, (name, _) in zip(projects, records)
+            ],
+            "message": f"{batch.size} sequences accepted. Processing pending."
+        }, status=status.HTTP_201_CREATED)
+
+
+class BatchStatusView(APIView):
+    """
+    GET /api/batch/{uuid}/
+    Aggregate progress of a batch: project counts per status, in one query.
+    """
+    def get(self, request, batch_id):
+        rows = (
+            AnalysisProject.objects
+            .filter(batch_id=batch_id)
+            .values('status')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        counts = {code: 0 for code, _ in AnalysisProject.STATUS_CHOICES}
+        counts.update({row['status']: row['count'] for row in rows})
+
+        total = sum(counts.values())
+        if total == 0:
+            # Batches are never empty, so no projects means no such batch
+            return Response({"error": "Batch not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        finished = sum(counts[code] for code in TERMINAL_STATUSES)
+        return Response({
+            "id": batch_id,
+            "total": total,
+            "counts": counts,
+            "finished": finished == total
+        })
+
+
+def metrics(request):
+    """
+    GET /metrics
+    Prometheus scrape endpoint: stage/client span histograms, cache counters,
+    Celery queue depths and annotation cache hit rates. Internal only (nginx denies it).
+    """
+    extra = []
+    try:
+        depths = Metrics.queue_depths()
+        extra.append((
+            'generosetta_queue_depth', 'gauge', 'Messages waiting in each Celery queue.',
+            [({'queue': queue}, depth) for queue, depth in depths.items()]
+        ))
+    except Exception as e:
+        logger.warning(f"Queue depth unavailable: {e}")
+
+    try:
+        namespaces = AnnotationCache.stats()['namespaces']
+        extra.append((
+            'generosetta_annotation_cache_total', 'counter', 'ClinVar/UniProt annotation cache lookups by outcome.',
+            [({'namespace': namespace, 'event': event}, count)
+             for namespace, counters in namespaces.items()
+             for event, count in counters.items() if event != 'hit_rate']
+        ))
+        extra.append((
+            'generosetta_annotation_cache_hit_ratio', 'gauge', 'Share of annotation lookups served from cache.',
+            [({'namespace': namespace}, counters['hit_rate']) for namespace, counters in namespaces.items()]
+        ))
+    except Exception as e:
+        logger.warning(f"Annotation cache statistics unavailable: {e}")
+
+    try:
+        body = Metrics.render(extra)
+    except Exception as e:
+        return HttpResponse(f"# metrics unavailable: {e}\n", status=503, content_type='text/plain')
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class CacheStatsView(APIView):
+    """
+    GET /api/cache-stats/
+    Staff only. Hit/miss counters of the ClinVar/UniProt annotation cache.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            return Response(AnnotationCache.stats())
+        except Exception as e:
+            return Response({"error": f"Cache statistics unavailable: {e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -151,6 +151,208 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 # Optimization: If the worker dies, don't acknowledge the task as "done" until it actually finishes.
 CELERY_TASK_ACKS_LATE = True
+# ...and requeue it if the worker process is killed mid-task. Safe because stages are
+# checkpointed: the redelivered job resumes after the last completed stage.
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+# Message priorities (0 = first, 9 = last): every level is its own Redis list,
+# and workers drain higher levels first. See AdmissionControl.priorities.
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+}
+
+# PIPELINE SETTINGS
+# ------------------------------------------------------------------------------
+# Run the strategy lookup (ClinVar/UniProt) and ESMFold in parallel threads.
+# Each branch gets its own timeout (seconds, counted from fan-out).
+PIPELINE_CONCURRENT_BRANCHES = os.getenv('PIPELINE_CONCURRENT_BRANCHES', 'True') == 'True'
+PIPELINE_ANNOTATE_TIMEOUT = float(os.getenv('PIPELINE_ANNOTATE_TIMEOUT', 20))
+PIPELINE_FOLD_TIMEOUT = float(os.getenv('PIPELINE_FOLD_TIMEOUT', 35))
+
+# Distributed mode: every stage is its own task on its own queue, so a worker
+# slot is only held for the duration of one stage instead of the whole job.
+PIPELINE_DISTRIBUTED = os.getenv('PIPELINE_DISTRIBUTED', 'False') == 'True'
+
+# Save every completed stage's output on the AnalysisResult, so a retried or
+# redelivered job skips the stages (and the BLAST/ESMFold calls) it already did.
+PIPELINE_CHECKPOINTS = os.getenv('PIPELINE_CHECKPOINTS', 'True') == 'True'
+
+# Time budget per project (seconds from when the pipeline first picks it up; 0 = none).
+# External calls get what is left of it as their timeout. Once it is spent, the
+# remaining lookups are skipped and the project ends PARTIAL (report, no structure, ...)
+# instead of FAILED, so nobody waits longer than this for an answer.
+PIPELINE_DEADLINE = int(os.getenv('PIPELINE_DEADLINE', 10 * 60))
+
+# Worker pools, started with `python manage.py pipeline_worker <name>`.
+# 'io' stages spend their time waiting on NCBI/UniProt/ESMFold/Postgres -> many threads.
+# 'cpu' stages burn CPU in Python -> one process per core.
+# Note: every 'io' thread may hold its own Postgres connection (CONN_MAX_AGE).
+PIPELINE_WORKER_POOLS = {
+    'io': {
+        'queues': ['celery', 'pipeline.scan', 'pipeline.annotate', 'pipeline.fold', 'pipeline.persist'],
+        'pool': os.getenv('PIPELINE_IO_POOL', 'threads'),
+        'concurrency': int(os.getenv('PIPELINE_IO_CONCURRENCY', 32)),
+    },
+    'cpu': {
+        'queues': ['pipeline.translate', 'pipeline.narrate'],
+        'pool': 'prefork',
+        'concurrency': int(os.getenv('PIPELINE_CPU_CONCURRENCY', os.cpu_count() or 2)),
+    },
+}
+
+CELERY_TASK_ROUTES = {
+    'analysis.tasks.scan_stage': {'queue': 'pipeline.scan'},
+    'analysis.tasks.translate_stage': {'queue': 'pipeline.translate'},
+    'analysis.tasks.annotate_stage': {'queue': 'pipeline.annotate'},
+    'analysis.tasks.fold_stage': {'queue': 'pipeline.fold'},
+    'analysis.tasks.narrate_stage': {'queue': 'pipeline.narrate'},
+    'analysis.tasks.variants_stage': {'queue': 'pipeline.annotate'},
+    'analysis.tasks.persist_stage': {'queue': 'pipeline.persist'},
+}
+
+# ADMISSION CONTROL
+# Submissions are refused with 429 + Retry-After when the broker backlog or the
+# submitter's unfinished projects are over budget (see analysis/services/admission.py).
+# Batches are refused at a smaller backlog, so single submissions still get in.
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'True') == 'True'
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv('ADMISSION_MAX_QUEUE_DEPTH', 2000))
+ADMISSION_BATCH_QUEUE_DEPTH = int(os.getenv('ADMISSION_BATCH_QUEUE_DEPTH', 500))
+ADMISSION_USER_MAX_INFLIGHT = int(os.getenv('ADMISSION_USER_MAX_INFLIGHT', 500))  # one full batch
+ADMISSION_GUEST_MAX_INFLIGHT = int(os.getenv('ADMISSION_GUEST_MAX_INFLIGHT', 20))
+ADMISSION_INFLIGHT_WINDOW = int(os.getenv('ADMISSION_INFLIGHT_WINDOW', 60 * 60))  # older projects stop counting
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 30))
+
+# Fair share: a submitter's next job drops one priority level per FAIR_SHARE_STEP
+# jobs it already has waiting; batch jobs start BATCH_PRIORITY levels down.
+PIPELINE_FAIR_SHARE_STEP = int(os.getenv('PIPELINE_FAIR_SHARE_STEP', 2))
+PIPELINE_BATCH_PRIORITY = int(os.getenv('PIPELINE_BATCH_PRIORITY', 3))
+
+# PROGRESS PUSH
+# Stages publish to Redis pub/sub; the ASGI app streams them as Server-Sent Events.
+# A stream ends after PROGRESS_STREAM_TIMEOUT (the browser then falls back to polling)
+# and sends a keep-alive comment every PROGRESS_HEARTBEAT seconds.
+PROGRESS_STREAM_TIMEOUT = float(os.getenv('PROGRESS_STREAM_TIMEOUT', 900))
+PROGRESS_HEARTBEAT = float(os.getenv('PROGRESS_HEARTBEAT', 15))
+
+# Write-through status cache (Redis) for GET /api/status/<uuid>/.
+# Unfinished projects expire quickly so a dead worker can't pin a stale state;
+# finished ones never change again.
+STATUS_CACHE_ENABLED = os.getenv('STATUS_CACHE_ENABLED', 'True') == 'True'
+STATUS_CACHE_TTL_ACTIVE = int(os.getenv('STATUS_CACHE_TTL_ACTIVE', 60 * 60))  # 1 hour
+STATUS_CACHE_TTL_DONE = int(os.getenv('STATUS_CACHE_TTL_DONE', 60 * 60 * 24))  # 1 day
+
+# Stage/client span histograms and counters in Redis, exported at /metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+# How often each process adds its buffered spans and counters to Redis (seconds)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+
+# UPLOADS
+# Files are streamed in INGEST_CHUNK_SIZE pieces (see analysis/services/ingest.py);
+# Django spools anything above FILE_UPLOAD_MAX_MEMORY_SIZE (2.5 MB) to a temp file.
+# Keep nginx's client_max_body_size in step with MAX_UPLOAD_SIZE.
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 20 * 1024 * 1024))  # 20 MB
+INGEST_CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', 64 * 1024))
+INGEST_MAX_HEADER = 1000  # FASTA header characters kept per record
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 500))  # sequences per POST /api/batch/
+
+# VCF
+# Variants are stored, derived and annotated VARIANT_CHUNK_SIZE rows at a time
+# (one bulk INSERT/UPDATE, one biophysics batch and a few ClinVar calls per chunk).
+MAX_VCF_VARIANTS = int(os.getenv('MAX_VCF_VARIANTS', 100000))
+VARIANT_CHUNK_SIZE = int(os.getenv('VARIANT_CHUNK_SIZE', 1000))
+VARIANT_NOTABLE_LIMIT = 20  # pathogenic variants listed in the report summary
+
+# Shortest ORF (residues) the translate stage accepts as the protein; below it
+# the input is translated from frame 0 up to the first stop codon instead.
+ORF_MIN_LENGTH = int(os.getenv('ORF_MIN_LENGTH', 30))
+
+# Sliding window (residues) for the protein hydropathy/charge/mass profiles.
+# 9 highlights surface regions; 19 is the classic window for membrane helices.
+PROFILE_WINDOW = int(os.getenv('PROFILE_WINDOW', 9))
+
+# Predicted structures are stored once per protein, zlib-compressed (see analysis/services/structure.py)
+STRUCTURE_COMPRESSION_LEVEL = int(os.getenv('STRUCTURE_COMPRESSION_LEVEL', 6))
+
+# CACHE SETTINGS
+# ------------------------------------------------------------------------------
+# Redis DB 1 keeps cache keys apart from the Celery queues on DB 0.
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/1')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    },
+}
+
+# RESULT CACHE
+# Finished reports are reused for identical sequences (keyed by SHA-256 of the clean DNA).
+# Bump PIPELINE_VERSION to invalidate every cached result by hand; edits to the engine
+# code invalidate them automatically (see analysis/services/cache.py).
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'True') == 'True'
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', 60 * 60 * 24 * 7))  # 7 days
+PIPELINE_VERSION = os.getenv('PIPELINE_VERSION', '1')
+
+# ANNOTATION CACHE (ClinVar / UniProt answers)
+# Fresh for ANNOTATION_CACHE_TTL ("not found" answers for ANNOTATION_NEGATIVE_TTL), then kept
+# ANNOTATION_STALE_TTL longer to serve if the upstream API is down.
+# Each worker process also keeps the most recent ANNOTATION_LOCAL_SIZE entries in memory.
+ANNOTATION_CACHE_TTL = int(os.getenv('ANNOTATION_CACHE_TTL', 60 * 60 * 24 * 30))  # 30 days
+ANNOTATION_NEGATIVE_TTL = int(os.getenv('ANNOTATION_NEGATIVE_TTL', 60 * 60 * 24))  # 1 day
+ANNOTATION_STALE_TTL = int(os.getenv('ANNOTATION_STALE_TTL', 60 * 60 * 24 * 30))
+ANNOTATION_LOCAL_SIZE = int(os.getenv('ANNOTATION_LOCAL_SIZE', 4096))
+ANNOTATION_LOCAL_TTL = int(os.getenv('ANNOTATION_LOCAL_TTL', 5 * 60))
+# How often each process adds its hit/miss counts to the shared stats (seconds)
+ANNOTATION_STATS_FLUSH_INTERVAL = float(os.getenv('ANNOTATION_STATS_FLUSH_INTERVAL', 10))
+
+# LOCAL ORGANISM CLASSIFIER
+# k-mer index built with `python manage.py build_kmer_index panel.fasta`.
+# Builds are versioned subdirectories of KMER_INDEX_DIR ('current' links the live one),
+# so the directory itself can be a mounted volume.
+# Only matches at or above the confidence threshold skip the remote BLAST.
+KMER_INDEX_DIR = os.getenv('KMER_INDEX_DIR', str(BASE_DIR / 'data' / 'kmer_index'))
+KMER_SIZE = int(os.getenv('KMER_SIZE', 31))
+KMER_CONFIDENCE_THRESHOLD = float(os.getenv('KMER_CONFIDENCE_THRESHOLD', 0.6))
+
+# NCBI
+# Identify ourselves to NCBI so they can contact us instead of blocking the IP.
+NCBI_EMAIL = os.getenv('NCBI_EMAIL', 'emediongfrancis@gmail.com')
+NCBI_TOOL = os.getenv('NCBI_TOOL', 'generosetta')
+NCBI_BLAST_URL = os.getenv('NCBI_BLAST_URL', 'https://blast.ncbi.nlm.nih.gov/Blast.cgi')
+NCBI_EUTILS_URL = os.getenv('NCBI_EUTILS_URL', 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils')
+NCBI_API_KEY = os.getenv('NCBI_API_KEY', '')
+
+# Shared by every worker through Redis (see analysis/engine/rate_limit.py).
+# NCBI allows 3 requests/s per IP, or 10/s with an API key.
+NCBI_RATE_LIMIT = float(os.getenv('NCBI_RATE_LIMIT', 10 if NCBI_API_KEY else 3))
+NCBI_RATE_BURST = int(os.getenv('NCBI_RATE_BURST', 1))
+
+# UNIPROT / ESMFOLD
+UNIPROT_SEARCH_URL = os.getenv('UNIPROT_SEARCH_URL', 'https://rest.uniprot.org/uniprotkb/search')
+ESMFOLD_URL = os.getenv('ESMFOLD_URL', 'https://api.esmatlas.com/foldSequence/v1/pdb/')
+
+# BLAST backend: 'sync' = NCBIWWW.qblast (blocks the worker until NCBI is done),
+# 'async' = submit once, store the RID, re-check via countdown-scheduled Celery retries.
+BLAST_BACKEND = os.getenv('BLAST_BACKEND', 'async')
+BLAST_MIN_POLL_DELAY = int(os.getenv('BLAST_MIN_POLL_DELAY', 10))  # seconds before the first check
+BLAST_POLL_INTERVAL = int(os.getenv('BLAST_POLL_INTERVAL', 60))    # NCBI: max one check per RID per minute
+BLAST_MAX_WAIT = int(os.getenv('BLAST_MAX_WAIT', 15 * 60))
+
+# SINGLE-FLIGHT
+# Identical sequences submitted while one is being analysed wait for that run
+# (see analysis/services/singleflight.py). The claim outlives the longest job;
+# waiting projects re-check every POLL_INTERVAL in case the leader disappeared.
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'True') == 'True'
+SINGLE_FLIGHT_TTL = int(os.getenv('SINGLE_FLIGHT_TTL', BLAST_MAX_WAIT + 5 * 60))
+SINGLE_FLIGHT_POLL_INTERVAL = int(os.getenv('SINGLE_FLIGHT_POLL_INTERVAL', 30))
+
+# OUTBOUND HTTP (UniProt, ESMFold, NCBI)
+# Keep-alive connections per host, shared by every task in a worker process.
+# Retries on 429/5xx wait backoff * 2^n seconds plus up to HTTP_RETRY_JITTER of random jitter.
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 32))
+HTTP_RETRY_TOTAL = int(os.getenv('HTTP_RETRY_TOTAL', 3))
+HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', 0.5))
+HTTP_RETRY_JITTER = float(os.getenv('HTTP_RETRY_JITTER', 0.5))
 
 
 # Internationalization
@@ -213,5 +415,7 @@ SOCIALACCOUNT_EMAIL_AUTHENTICATION_AUTO_CONNECT = True
 
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SECURE_SSL_REDIRECT = True
+# Prometheus scrapes plain HTTP inside the Docker network
+SECURE_REDIRECT_EXEMPT = [r'^metrics$']
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
\ No newline at end of file
@@ -16,11 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from analysis.views import index
+from analysis.views import index, metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('allauth.urls')),
     path('api/', include('analysis.urls')), # This makes the endpoint /api/analyze/
+    path('metrics', metrics, name='metrics'),  # Prometheus scrape target (internal)
     path('', index, name='home'),  # Home page
 ]